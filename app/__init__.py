@@ -1,5 +1,19 @@
-from flask import Flask
+"""
+the flask app is created, and its views registered, on the first
+`from app import app`. importing app.db or app.classifier alone (workers,
+scripts, tests) doesn't import flask.
+"""
+import threading
 
-app = Flask(__name__)
+_app_lock = threading.Lock()
 
-from app import views
+
+def __getattr__(name: str):
+	if name != "app":
+		raise AttributeError("module %s has no attribute %s" % (__name__, name))
+	with _app_lock:
+		if "app" not in globals():
+			from flask import Flask
+			globals()["app"] = Flask(__name__)
+			from app import views
+	return globals()["app"]
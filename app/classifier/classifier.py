@@ -1,4 +1,6 @@
-from typing import List, Tuple, Any, Dict
+import threading
+import contextlib
+from typing import Callable, List, Tuple, Any, Dict
 from app.classifier.custom_types import (
 	SChoice,
 	SQuestion,
@@ -12,12 +14,34 @@ from app.classifier.custom_types import (
 from app.db import database
 import numpy as np
 from app.classifier.data_manager import DataManager
-# for machine learning
-from keras.models import Sequential
-from keras.layers import Dense
-from keras.optimizers import Adam
-from keras.activations import relu, softmax
-from keras.losses import categorical_crossentropy
+from app.classifier.training_data import TrainingData
+from app.classifier.course_manager import LABEL_DTYPE
+from app.classifier.training_snapshot import TrainingSnapshot
+from app.classifier.model_store import ModelStore, ModelArtifact
+from app.classifier.numpy_model import NumpyModel
+from app.classifier.prediction_worker import PredictionWorker
+from app.classifier.prediction_cache import PredictionCache, CACHE_SIZE
+import app.classifier.sparse_batches as sparse_batches
+# keras (and tensorflow) take seconds to import, so they are imported by
+# the methods that build, load or compile a keras model, on first use.
+# processes that load a model with numpy_runtime=True never import them.
+
+
+def _tensorflow_context() -> Tuple[Any, Any] or None:
+	"""
+	the default graph and the keras session of tensorflow 1, in which a
+	keras model built by this thread runs. other threads use the default
+	graph of their own, so they need both to call the model. None with
+	tensorflow 2, which has no graphs to capture, and without tensorflow.
+	"""
+	try:
+		import tensorflow as tf
+		import keras.backend as backend
+	except ImportError:
+		return None
+	if not getattr(tf, "__version__", "").startswith("1."):
+		return None
+	return tf.get_default_graph(), backend.get_session()
 
 
 class Classifier:
@@ -25,12 +49,57 @@ class Classifier:
 	helps us make both predictions and learning for our course classifications
 	"""
 
-	def __init__(self, nn_hidden_layers=((100, relu), (50, relu))) -> None:
+	def __init__(
+		self,
+		nn_hidden_layers=((100, "relu"), (50, "relu")),
+		prediction_cache_size: int = CACHE_SIZE,
+		build_model: bool = True,
+		sparse_inputs: bool = False,
+		sparse_labels: bool = False
+	) -> None:
+		"""
+		:param nn_hidden_layers: see setup_classifier
+		:param prediction_cache_size: see PredictionCache
+		:param build_model:
+			if false, no keras model is built: the classifier can only
+			predict once a model is loaded with load_latest_model
+		:param sparse_inputs:
+			if true, responses are encoded as scipy.sparse CSR matrices by
+			train, train_streaming, write_training_snapshot and
+			predict_batch (the training data keeps answer codes instead of
+			dense rows), and densified one batch at a time for keras models
+		:param sparse_labels:
+			if true, labels are int32 course indexes instead of one-hot
+			rows, and the model is trained with a sparse categorical
+			crossentropy loss
+		"""
 		self.data_manager = DataManager()
-		self.data: np.ndarray = None
+		self.sparse_labels = sparse_labels
+		self.training_data = TrainingData(
+			self.data_manager, sparse=sparse_inputs, sparse_labels=sparse_labels
+		)
+		# dense, or a scipy.sparse CSR matrix with sparse_inputs
+		self.data: np.ndarray or Any = None
 		self.label: np.ndarray = None
-		self._classifier: Sequential = None
-		self.setup_classifier(nn_hidden_layers=nn_hidden_layers)
+		self.sparse_inputs = sparse_inputs
+		# a keras Sequential or a NumpyModel. it is only used within
+		# _model_access, as keras models can't be trained and called, or
+		# called from several threads, at the same time
+		self._classifier: Any = None
+		self._model_lock = threading.RLock()
+		# see _tensorflow_context, captured with every keras model
+		self._tensorflow_context: Tuple[Any, Any] or None = None
+		# version of the published model loaded or published last, if any
+		self.model_version: str = None
+		# started by the first serve_ranking, see prediction_worker()
+		self._worker: PredictionWorker = None
+		self._worker_lock = threading.Lock()
+		# rankings of predict_ranking and serve_ranking, by response vector
+		self.prediction_cache = PredictionCache(prediction_cache_size)
+		# incremented whenever the model changes, see _model_changed()
+		self._model_generation = 0
+		if build_model:
+			self.setup_classifier(nn_hidden_layers=nn_hidden_layers)
 
 	def setup_classifier(
 		self,
@@ -44,30 +113,146 @@ class Classifier:
 			that specifies the number of hidden units and a string that
 			specifies the activation to use
 		"""
+		from keras.models import Sequential
+		from keras.layers import Dense
 		first_hidden_layer_unit_count, activation = nn_hidden_layers[0]
-		self._classifier = Sequential()
+		model = Sequential()
 
-		self._classifier.add(Dense(
+		model.add(Dense(
 			units=first_hidden_layer_unit_count,
 			activation=activation,
 			input_dim=self.data_manager.input_dimension()
 		))
 		for hidden_layer_unit_count, activation in nn_hidden_layers[1:]:
-			self._classifier.add(Dense(
+			model.add(Dense(
 				units=hidden_layer_unit_count,
 				activation=activation
 			))
-		self._classifier.add(Dense(
+		model.add(Dense(
 			units=self.data_manager.output_dimension(),
-			activation=softmax
+			activation="softmax"
 		))
 
-		self._classifier.compile(
-			loss=categorical_crossentropy,
+		self._compile(model)
+		self._replace_model(model, _tensorflow_context())
+
+	def _compile(self, model: Any) -> None:
+		from keras.optimizers import Adam
+		from keras.losses import (
+			categorical_crossentropy,
+			sparse_categorical_crossentropy,
+		)
+		model.compile(
+			loss=sparse_categorical_crossentropy if self.sparse_labels
+			else categorical_crossentropy,
 			optimizer=Adam(),
 			metrics=["accuracy"]
 		)
 
+	def publish_model(
+		self,
+		directory: str,
+		training: Dict[str, Any] = None
+	) -> ModelArtifact:
+		"""
+		publishes the current model to the model store in directory as
+		its latest model
+		:param training: metadata of the training to keep with the model
+		"""
+		metadata = {
+			"rows": self.training_data.size,
+			"rid_watermark": self.training_data.rid_watermark,
+		}
+		metadata.update(training or {})
+		with self._model_access() as model:
+			architecture, weights = model.to_json(), model.get_weights()
+			layers = [
+				{
+					"units": layer.get_config()["units"],
+					"activation": layer.get_config()["activation"],
+				}
+				for layer in model.layers
+			]
+		artifact = ModelStore(directory).publish(
+			architecture=architecture,
+			weights=weights,
+			input_dimension=self.data_manager.input_dimension(),
+			output_dimension=self.data_manager.output_dimension(),
+			layers=layers,
+			training=metadata,
+		)
+		self.model_version = artifact.version
+		return artifact
+
+	def load_latest_model(
+		self,
+		directory: str,
+		numpy_runtime: bool = False
+	) -> ModelArtifact or None:
+		"""
+		replaces the current model with the latest model of the model store
+		in directory. raises ModelMismatchError if it was trained on
+		another catalog.
+		:param numpy_runtime:
+			if true, the model is loaded as a NumpyModel, which predicts
+			without keras but can't be trained
+		:return: the model loaded, None if the store has no model
+		"""
+		artifact = ModelStore(directory).latest()
+		if artifact is None:
+			return None
+		artifact.check(self.data_manager)
+		if numpy_runtime:
+			self._replace_model(NumpyModel.from_artifact(artifact), None, artifact.version)
+		else:
+			from keras.models import model_from_json
+			model = model_from_json(artifact.architecture())
+			model.set_weights(artifact.weights())
+			self._compile(model)
+			self._replace_model(model, _tensorflow_context(), artifact.version)
+		return artifact
+
+	@contextlib.contextmanager
+	def _model_access(self):
+		"""
+		gives the model to one thread at a time, within the tensorflow 1
+		graph and session it was built in (if any), for predict, fit and
+		any other use of it
+		"""
+		with self._model_lock:
+			if self._tensorflow_context is None:
+				yield self._classifier
+				return
+			graph, session = self._tensorflow_context
+			with graph.as_default(), session.as_default():
+				yield self._classifier
+
+	def _replace_model(
+		self,
+		model: Any,
+		tensorflow_context: Tuple[Any, Any] or None,
+		version: str = None
+	) -> None:
+		with self._model_lock:
+			self._classifier = model
+			self._tensorflow_context = tensorflow_context
+			self.model_version = version
+			self._model_changed()
+
+	def _model_changed(self) -> None:
+		"""
+		invalidates the rankings cached with the previous model. the
+		generation is part of the cache keys, so rankings of the previous
+		model that are still being computed are never returned either.
+		"""
+		self._model_generation += 1
+		self.prediction_cache.clear()
+
+	def export_numpy_model(self) -> NumpyModel:
+		""" the current model, for predictions with numpy only """
+		with self._model_access() as model:
+			return NumpyModel.from_keras(model)
+
 	def train(
 		self,
 		epochs: int = 5,
@@ -75,18 +260,104 @@ class Classifier:
 		verbose_mode: int = 1
 	) -> None:
 		"""
-		train the _classifier based on the data that we currently have
-		"""
-		if self.data is None:
-			self.data, self.label = self.data_manager.load_training_data()
-		if self.data is not None and self.label is not None:
-			self._classifier.fit(
-				self.data,
-				self.label,
-				epochs=epochs,
-				batch_size=batch_size,
-				verbose=verbose_mode
-			)
+		train the _classifier based on the data that we currently have.
+		the training data is refreshed first, which only fetches the
+		responses that were stored or relabelled since the last refresh.
+		"""
+		self.refresh_training_data()
+		if self.training_data.size > 0:
+			with self._model_access() as model:
+				sparse_batches.fit(
+					model,
+					self.data,
+					self.label,
+					epochs=epochs,
+					batch_size=batch_size,
+					verbose=verbose_mode
+				)
+				self._model_changed()
+
+	def refresh_training_data(self) -> int:
+		"""
+		brings self.data and self.label up to date with the database
+		:return: the number of responses added, updated or removed
+		"""
+		changed = self.training_data.refresh()
+		self.data, self.label = \
+			self.training_data.data, self.training_data.labels
+		return changed
+
+	def write_training_snapshot(self, directory: str) -> TrainingSnapshot:
+		"""
+		refreshes the training data and writes it as the training snapshot
+		in directory, for train_from_snapshot in this or other processes
+		"""
+		self.refresh_training_data()
+		return TrainingSnapshot.write(
+			directory, self.training_data, sparse=self.sparse_inputs
+		)
+
+	def train_from_snapshot(
+		self,
+		directory: str,
+		epochs: int = 5,
+		batch_size: int = 32,
+		verbose_mode: int = 1
+	) -> TrainingSnapshot:
+		"""
+		train the _classifier on the training snapshot in directory instead
+		of the database. the snapshot is memory-mapped, so it is shared with
+		every other process reading it. raises StaleSnapshotError if the
+		snapshot was encoded with a different catalog.
+		"""
+		snapshot = TrainingSnapshot.load(directory)
+		snapshot.check(self.data_manager)
+		labels = snapshot.labels
+		# snapshots written with the other kind of labels are converted
+		if self.sparse_labels and labels.ndim == 2:
+			labels = labels.argmax(axis=1).astype(LABEL_DTYPE)
+		elif not self.sparse_labels and labels.ndim == 1:
+			labels = self.data_manager.cm.one_hot(labels)
+		if snapshot.manifest["rows"] > 0:
+			with self._model_access() as model:
+				sparse_batches.fit(
+					model,
+					snapshot.data,
+					labels,
+					epochs=epochs,
+					batch_size=batch_size,
+					verbose=verbose_mode
+				)
+				self._model_changed()
+		return snapshot
+
+	def train_streaming(
+		self,
+		epochs: int = 5,
+		batch_size: int = 32,
+		chunk_size: int = 10000,
+		verbose_mode: int = 1
+	) -> None:
+		"""
+		train the _classifier on data streamed from the database in chunks
+		of chunk_size responses instead of loading all of it in memory.
+		examples are only shuffled within a chunk.
+		"""
+		for _ in range(epochs):
+			for data, label in self.data_manager.iter_training_data(
+				chunk_size, sparse=self.sparse_inputs, sparse_labels=self.sparse_labels
+			):
+				# predictions run between two chunks
+				with self._model_access() as model:
+					sparse_batches.fit(
+						model,
+						data,
+						label,
+						epochs=1,
+						batch_size=batch_size,
+						verbose=verbose_mode
+					)
+					self._model_changed()
 
 	def store_training_data(
 		self,
@@ -118,34 +389,144 @@ class Classifier:
 	def predict_ranking(
 		self,
 		vector: np.ndarray,
-		verbose: int = 0
+		verbose: int = 0,
+		top_k: int = None
 	) -> List[Tuple[SCourseNumber, SCourse, float]]:
 		"""
 		returns an ordered list of predicted courses, ranging from
 		best course prediction to worst
 		:param vector: A vector that has the shape (1, self.data_manager.input_dimension)
 		:param verbose: the verbosity level when making the prediction
+		:param top_k: if given, only the top_k most likely courses are kept
+		"""
+		return self._cached_ranking(vector, top_k, lambda: self.get_course_rankings(
+			self._predict(vector, verbose=verbose),
+			top_k=top_k,
+		))
+
+	def predict_batch(
+		self,
+		responses: List[RID] or np.ndarray,
+		batch_size: int = 1024,
+		verbose: int = 0,
+		top_k: int = None
+	) -> List[List[Tuple[SCourseNumber, SCourse, float]]]:
+		"""
+		ranks the courses for many responses with a single predict.
+		:param responses:
+			either the rids of stored responses, which are loaded with one
+			query per thousand rids, or a matrix of response vectors with
+			one row per response (dense or scipy.sparse)
+		:param batch_size: number of rows per batch within the predict
+		:param verbose: the verbosity level when making the prediction
+		:param top_k: if given, only the top_k most likely courses are kept
+		:return: the ranking of each response, in the order given
+		"""
+		if isinstance(responses, np.ndarray) or sparse_batches.is_sparse(responses):
+			vectors = responses
+		else:
+			loaded = database.load_responses(responses)
+			for rid in responses:
+				if rid not in loaded:
+					raise KeyError("rid not found in database -> %s" % str(rid))
+			qam = self.data_manager.qam
+			vectors = self.data_manager.encode_codes(
+				qam.encode_answers(loaded[rid] for rid in responses),
+				sparse=self.sparse_inputs,
+			)
+		if vectors.shape[0] == 0:
+			return []
+		return self.get_batch_course_rankings(
+			self._predict(vectors, batch_size=batch_size, verbose=verbose),
+			top_k=top_k,
+		)
+
+	def _predict(self, vectors: Any, batch_size: int = 1024, verbose: int = 0) -> np.ndarray:
+		""" predicts a (dense or sparse) matrix of vectors with the current model """
+		with self._model_access() as model:
+			return sparse_batches.predict(
+				model, vectors, batch_size=batch_size, verbose=verbose
+			)
+
+	def prediction_worker(self) -> PredictionWorker:
+		"""
+		the worker that runs the predictions of serve_ranking, started on
+		first use. it always predicts with the current model, so models
+		loaded after it started are used too.
 		"""
-		return self.get_course_rankings(
-			self._classifier.predict(vector, verbose=verbose)
+		with self._worker_lock:
+			if self._worker is None:
+				self._worker = PredictionWorker(self._predict).start()
+			return self._worker
+
+	def serve_ranking(
+		self,
+		vector: np.ndarray,
+		top_k: int = None,
+		timeout: float = None
+	) -> List[Tuple[SCourseNumber, SCourse, float]]:
+		"""
+		same as predict_ranking, but safe to call from many threads at
+		once: the vector is predicted by the prediction worker, together
+		with the vectors of the other threads waiting for a prediction.
+		:param timeout: seconds to wait for the prediction, None to wait
+		"""
+		return self._cached_ranking(vector, top_k, lambda: self.get_course_rankings(
+			self.prediction_worker().predict(vector, timeout)[np.newaxis],
+			top_k=top_k,
+		))
+
+	def _cached_ranking(
+		self,
+		vector: np.ndarray,
+		top_k: int or None,
+		rank: Callable[[], List[Tuple[SCourseNumber, SCourse, float]]]
+	) -> List[Tuple[SCourseNumber, SCourse, float]]:
+		""" the ranking of vector from the prediction cache, or from rank() """
+		key = PredictionCache.key(
+			vector, self.model_version, self._model_generation, top_k
 		)
+		ranking = self.prediction_cache.get(key)
+		if ranking is None:
+			ranking = rank()
+			self.prediction_cache.put(key, ranking)
+		# a copy, so that callers can't change the cached ranking
+		return list(ranking)
+
+	def close(self) -> None:
+		""" stops the prediction worker, if it was started """
+		with self._worker_lock:
+			worker, self._worker = self._worker, None
+		if worker is not None:
+			worker.close()
 
 	def get_course_rankings(
 		self,
-		predictions: np.ndarray
+		predictions: np.ndarray,
+		top_k: int = None
 	) -> List[Tuple[SCourseNumber, SCourse, float]]:
-		prediction_tuples = [
-			(
-				cid,
-				predictions[0, self.data_manager.cm.get_course_index(cid)]
-			) for cid in list(self.data_manager.course_ids())
+		""" the ranking of the first row of predictions """
+		return self.get_batch_course_rankings(predictions[:1], top_k)[0]
+
+	def get_batch_course_rankings(
+		self,
+		predictions: np.ndarray,
+		top_k: int = None
+	) -> List[List[Tuple[SCourseNumber, SCourse, float]]]:
+		"""
+		ranks the courses of every row of predictions at once
+		:param predictions: one row of course probabilities per response
+		:param top_k: if given, only the top_k most likely courses are kept
+		:return: (course number, course, probability) tuples for each row
+		"""
+		cm = self.data_manager.cm
+		orders = cm.rank(predictions, top_k)
+		probabilities = np.take_along_axis(predictions, orders, axis=1)
+		return [
+			list(zip(cns, courses, row_probabilities))
+			for cns, courses, row_probabilities in zip(
+				cm.index_to_cn[orders],
+				cm.index_to_course[orders],
+				probabilities,
+			)
 		]
-		courses_sorted_by_probability = sorted(
-			prediction_tuples,
-			key=lambda tup: -tup[1]
-		)
-		ranking = []
-		for cid, probability in courses_sorted_by_probability:
-			cid, cn, course = self.data_manager.cm.get_course_bundle(cid)
-			ranking.append((cn, course, probability))
-		return ranking
@@ -1,9 +1,12 @@
-from typing import Dict, Tuple
+from typing import Dict, Iterable, Tuple
 from app.classifier.custom_types import SCourseNumber, SCourse, CID, Vector
 from app.utils.resolver_util import ValueResolver
-import app.db.database as database
+import app.db.catalog as catalog
 import numpy as np
 
+# dtype of the course index labels, for sparse categorical training
+LABEL_DTYPE = np.int32
+
 
 class CourseManager:
 	def __init__(self) -> None:
@@ -14,22 +17,51 @@ class CourseManager:
 		self.cid_resolver: ValueResolver[CID or SCourse or SCourseNumber, CID] = None
 		self.cid_to_vector: Dict[CID, np.ndarray] = {}
 		self.course_count: int = None
+		# course metadata by course index, for ranking whole prediction
+		# matrices at once
+		self.index_to_cid: np.ndarray = None
+		self.index_to_cn: np.ndarray = None
+		self.index_to_course: np.ndarray = None
+		self.catalog_version: int = None
 		self.setup()
 
 	def setup(self) -> None:
-		cid_to_course, cid_resolver, cids = ValueResolver(), {}, []
-		for cid_, cn_, course_ in database.load_courses():
-			cn, course = SCourseNumber(cn_), SCourse(course_)
-			cid = CID(cid_)
+		cid_to_course, cid_resolver = {}, ValueResolver()
+		snapshot = catalog.snapshot()
+		for cid, cn, course in snapshot.courses:
 			cid_to_course[cid] = (cn, course)
 			cid_resolver[[cid, course, cn]] = cid
-			cids.append(cid)
 		self.cid_to_course, self.cid_resolver = cid_to_course, cid_resolver
-		cid_to_index = {}
-		for index, cid in enumerate(sorted(cids)):
-			cid_to_index[cid] = index
-		self.cid_to_index = cid_to_index
-		self.course_count = len(cids)
+		# the snapshot's courses are sorted by cid, like the indexes were
+		self.cid_to_index = dict(snapshot.cid_to_index)
+		self.course_count = len(snapshot.courses)
+		self.index_to_cid = np.array(
+			[cid for cid, _, _ in snapshot.courses], dtype=np.int64
+		)
+		self.index_to_cn = np.empty(self.course_count, dtype=object)
+		self.index_to_course = np.empty(self.course_count, dtype=object)
+		for index, (_, cn, course) in enumerate(snapshot.courses):
+			self.index_to_cn[index], self.index_to_course[index] = cn, course
+		self.catalog_version = snapshot.version
+
+	def rank(self, predictions: np.ndarray, top_k: int = None) -> np.ndarray:
+		"""
+		:param predictions: one row of course probabilities per response
+		:param top_k: if given, only the top_k most likely courses are ranked
+		:return:
+			the course indexes of each row from most to least likely, as a
+			(row count, top_k or course count) matrix
+		"""
+		if top_k is None or top_k >= self.course_count:
+			return np.argsort(-predictions, axis=1, kind="stable")
+		# select the top_k of each row in linear time, then sort only those
+		top = np.argpartition(-predictions, top_k - 1, axis=1)[:, :top_k]
+		order = np.argsort(
+			-np.take_along_axis(predictions, top, axis=1),
+			axis=1,
+			kind="stable",
+		)
+		return np.take_along_axis(top, order, axis=1)
 
 	def get_course_vector(
 		self,
@@ -42,6 +74,34 @@ class CourseManager:
 			Vector.one_hot_repr(self.course_count, course_index)
 		return self.get_course_vector(cid)
 
+	def get_course_indices(
+		self,
+		course_identifiers: Iterable[CID or SCourse or SCourseNumber]
+	) -> np.ndarray:
+		"""
+		the course index of each course, in one pass: each distinct course
+		is resolved once, however many times it appears.
+		:return: an int32 array, i.e. labels for sparse categorical training
+		"""
+		resolved: Dict[CID or SCourse or SCourseNumber, int] = {}
+
+		def course_index(identifier: CID or SCourse or SCourseNumber) -> int:
+			index = resolved.get(identifier)
+			if index is None:
+				index = resolved[identifier] = self.get_course_index(identifier)
+			return index
+
+		return np.fromiter(
+			(course_index(identifier) for identifier in course_identifiers),
+			dtype=LABEL_DTYPE,
+		)
+
+	def one_hot(self, course_indices: np.ndarray) -> np.ndarray:
+		""" the one-hot label matrix of course indices, one row per index """
+		labels = np.zeros((len(course_indices), self.course_count))
+		labels[np.arange(len(course_indices)), course_indices] = 1
+		return labels
+
 	def get_course_bundle(
 		self,
 		course_identifier: CID or SCourse or SCourseNumber
@@ -1,5 +1,5 @@
 import numpy as np
-from typing import Any
+from typing import Any, Dict
 from app.db.sql_constants import QuestionTypes, QuestionAnswerTypes
 
 
@@ -57,6 +57,20 @@ class FloatVectorList:
 	element_types = {int, float}
 
 
+# the interned instances of each class, see SpecialString.interned
+_interned: Dict[type, Dict[Any, Any]] = {}
+
+
+def _intern(cls: type, value: Any) -> Any:
+	instances = _interned.get(cls)
+	if instances is None:
+		instances = _interned.setdefault(cls, {})
+	instance = instances.get(value)
+	if instance is None:
+		instance = instances.setdefault(value, cls(value))
+	return instance
+
+
 class SpecialString(str):
 	"""
 	This string ensures that any class that inherit from this and edits
@@ -74,6 +88,15 @@ class SpecialString(str):
 		obj = super().__new__(cls, str(args[0]))
 		return obj
 
+	@classmethod
+	def interned(cls, value: Any) -> "SpecialString":
+		"""
+		the one shared instance of cls for value, built on first use. for
+		values from small, finite sets (i.e. course numbers) that are read
+		over and over: instances are kept for the life of the process.
+		"""
+		return _intern(cls, value)
+
 	def __repr__(self):
 		return super(SpecialString, self).__repr__()[1:-1]
 
@@ -172,6 +195,14 @@ class SpecialInt(int):
 		obj = super().__new__(cls, int(args[0]))
 		return obj
 
+	@classmethod
+	def interned(cls, value: Any) -> "SpecialInt":
+		"""
+		see SpecialString.interned. for the ids of questions, answers and
+		courses, not for rids, which grow without bound.
+		"""
+		return _intern(cls, value)
+
 
 class IntID(SpecialInt):
 	def __repr__(self):
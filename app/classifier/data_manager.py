@@ -1,4 +1,4 @@
-from typing import Union, Iterable, Dict, List, Tuple
+from typing import Union, Iterable, Iterator, Dict, List, Tuple, Any
 from app.classifier.custom_types import (
 	SQuestion,
 	SChoice,
@@ -11,7 +11,7 @@ from app.classifier.custom_types import (
 )
 from app.classifier.course_manager import CourseManager
 from app.classifier.question_answer_manager import QuestionAnswerManager
-from app.db import database
+from app.db import database, catalog, packed_answers
 import numpy as np
 
 
@@ -42,8 +42,37 @@ class DataManager:
 		return database.store_response(
 			self.response_choices,
 			self.cm.get_cn(course),
+			packed_answers.pack(catalog.snapshot(), self.response_choices),
 		)
 
+	def store_responses(
+		self,
+		batch: List[Tuple[
+			Dict[QID or SQuestion, AID or SChoice],
+			CID or SCourse or SCourseNumber or None,
+		]],
+	) -> List[RID]:
+		"""
+		stores many responses at once (i.e. imports of paper surveys or
+		buffered submissions) in a single transaction.
+		:param batch: (answer map, course or None) tuples
+		:return: the rids of the stored responses, in order
+		"""
+		responses = [
+			(
+				{
+					self.qam.get_qid(question): self.qam.get_aid(question, choice)
+					for question, choice in answer_map.items()
+				},
+				None if course is None else self.cm.get_cn(course),
+			)
+			for answer_map, course in batch
+		]
+		snapshot = catalog.snapshot()
+		return database.store_responses(responses, [
+			packed_answers.pack(snapshot, response) for response, _ in responses
+		])
+
 	def get_answered_questions_count(self) -> int:
 		return len([
 			qid for qid in self.question_ids()
@@ -60,20 +89,125 @@ class DataManager:
 		return self.qam.convert_response_to_vector(self.response_choices)
 
 	def load_training_data(
-		self
+		self,
+		sparse: bool = False,
+		sparse_labels: bool = False
 	) -> Union[Tuple[None, None], Tuple[np.ndarray, np.ndarray]]:
-		responses: Dict[Tuple[RID, SCourseNumber], Dict[QID, AID]] = \
-			database.load_labelled_responses()
-		data: List[np.ndarray] = []
-		labels: List[np.ndarray] = []
-		for (rid, cid) in responses:
-			data.append(
-				self.qam.convert_response_to_vector(responses[(rid, cid)])
-			)
-			labels.append(self.cm.get_course_vector(cid))
-		if len(data) == 0:
+		"""
+		the data and label matrices of every labelled response, in order of
+		rid. the answers are read as arrays of ids and encoded at once.
+		:param sparse:
+			if true, the data matrix is a scipy.sparse CSR matrix (see
+			QuestionAnswerManager.encode_sparse)
+		:param sparse_labels:
+			if true, the labels are an int32 array of course indexes (see
+			CourseManager.get_course_indices) instead of one-hot rows
+		"""
+		rids, cns, qids, aids = database.load_labelled_answer_arrays()
+		if len(rids) == 0:
+			return None, None
+		# one row per response, in order of rid
+		_, first_answers, rows = \
+			np.unique(rids, return_index=True, return_inverse=True)
+		data = self.encode_codes(
+			self.qam.encode_answer_arrays(rows, qids, aids, len(first_answers)),
+			sparse,
+		)
+		return data, self.encode_labels(cns[first_answers], sparse_labels)
+
+	def load_packed_training_data(
+		self,
+		sparse: bool = False,
+		sparse_labels: bool = False
+	) -> Union[Tuple[None, None], Tuple[np.ndarray, np.ndarray]]:
+		"""
+		same as load_training_data (in order of rid), but reads one row
+		per response and decodes the packed answers into the data matrix
+		all at once. responses that are not packed yet are loaded together,
+		packed and stored packed, so the next load reads them packed.
+		:param sparse: see load_training_data
+		:param sparse_labels: see load_training_data
+		"""
+		rows = database.load_packed_labelled_responses()
+		if len(rows) == 0:
 			return None, None
-		return np.vstack(data), np.vstack(labels)
+		unpacked = database.load_responses(
+			[rid for rid, _, packed in rows if packed is None]
+		)
+		snapshot = catalog.snapshot()
+		repacked = {
+			rid: packed_answers.pack(snapshot, answers)
+			for rid, answers in unpacked.items()
+		}
+		if any(packed is not None for packed in repacked.values()):
+			database.store_packed_answers([
+				(rid, packed) for rid, packed in repacked.items()
+				if packed is not None
+			])
+		indices = packed_answers.unpack([
+			packed if packed is not None else repacked.get(rid) or b""
+			for rid, _, packed in rows
+		], self.qam.question_count())
+		# responses that answer questions that are not in the catalog any
+		# more cannot be packed: they are encoded from their answers
+		unpackable = [
+			row for row, (rid, _, _) in enumerate(rows)
+			if rid in repacked and repacked[rid] is None
+		]
+		if len(unpackable) > 0:
+			indices = indices.copy()
+			indices[unpackable] = self.qam.encode_answers(
+				unpacked[rows[row][0]] for row in unpackable
+			)
+		data = self.encode_codes(indices, sparse)
+		return data, self.encode_labels((cn for _, cn, _ in rows), sparse_labels)
+
+	def iter_training_data(
+		self,
+		chunk_size: int = 1000,
+		sparse: bool = False,
+		sparse_labels: bool = False,
+	) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+		"""
+		streaming version of load_training_data: yields the data and label
+		matrices chunk_size responses at a time, so peak memory depends on
+		chunk_size rather than on the number of stored responses.
+		"""
+		for chunk in database.stream_labelled_responses(chunk_size):
+			yield self.encode_responses(chunk, sparse, sparse_labels)
+
+	def encode_responses(
+		self,
+		responses: List[Tuple[int, str, Dict[int, int]]],
+		sparse: bool = False,
+		sparse_labels: bool = False,
+	) -> Tuple[np.ndarray, np.ndarray]:
+		"""
+		:param responses: (rid, course number, {qid: aid}) tuples
+		:param sparse: see load_training_data
+		:param sparse_labels: see load_training_data
+		:return: one row of data and one label per response
+		"""
+		data = self.encode_codes(
+			self.qam.encode_answers(answers for _, _, answers in responses),
+			sparse,
+		)
+		return data, self.encode_labels((cn for _, cn, _ in responses), sparse_labels)
+
+	def encode_labels(
+		self,
+		course_numbers: Iterable[SCourseNumber],
+		sparse_labels: bool = False
+	) -> np.ndarray:
+		""" the course indexes of course_numbers, or their one-hot rows """
+		course_indices = self.cm.get_course_indices(course_numbers)
+		return course_indices if sparse_labels else self.cm.one_hot(course_indices)
+
+	def encode_codes(self, codes: np.ndarray, sparse: bool = False) -> Any:
+		""" the data matrix of answer codes, dense or scipy.sparse CSR """
+		if sparse:
+			return self.qam.encode_sparse(codes)
+		return self.qam.encode_batch(codes)
 
 	def question_ids(self) -> Iterable[QID]:
 		yield from self.qam.question_ids()
@@ -0,0 +1,144 @@
+"""
+a directory of trained models, so that processes that only predict can
+load the latest model instead of training one at boot.
+
+each published model is a subdirectory named by its version with:
+- architecture.json: the keras architecture (model.to_json())
+- weights.npz: the weights of the model (model.get_weights()), in order
+- metadata.json: the catalog it was trained on, its input and output
+dimensions, its dense layers and whatever training metadata was given
+
+a model is written in a temporary directory that is renamed once
+complete, then the LATEST file is replaced to point at it. both are
+atomic, so readers see either the previous model or the new one.
+"""
+import os
+import json
+import time
+from typing import Dict, List, Any
+import numpy as np
+from app.classifier.data_manager import DataManager
+import app.db.catalog as catalog
+
+LATEST = "LATEST"
+ARCHITECTURE = "architecture.json"
+WEIGHTS = "weights.npz"
+METADATA = "metadata.json"
+
+
+class ModelMismatchError(Exception):
+	""" raised when a model does not fit the current catalog """
+
+
+class ModelArtifact:
+	def __init__(self, directory: str, metadata: Dict[str, Any]) -> None:
+		self.directory = directory
+		self.metadata = metadata
+		self.version: str = metadata["version"]
+
+	def architecture(self) -> str:
+		with open(os.path.join(self.directory, ARCHITECTURE)) as architecture:
+			return architecture.read()
+
+	def weights(self) -> List[np.ndarray]:
+		with np.load(os.path.join(self.directory, WEIGHTS)) as weights:
+			return [weights["arr_%d" % index] for index in range(len(weights.files))]
+
+	def check(self, data_manager: DataManager) -> None:
+		"""
+		raises ModelMismatchError unless data_manager can feed this model:
+		the dimensions must match, and so must the catalog, since a model
+		trained on other (or reordered) questions or courses of the same
+		dimensions would rank the wrong courses
+		"""
+		expected = (data_manager.input_dimension(), data_manager.output_dimension())
+		found = (self.metadata["input_dimension"], self.metadata["output_dimension"])
+		if found != expected:
+			raise ModelMismatchError(
+				"model %s takes %d inputs and predicts %d courses, but the "
+				"catalog has %d inputs and %d courses" %
+				((self.version,) + found + expected)
+			)
+		if self.metadata.get("catalog_fingerprint") != catalog.snapshot().fingerprint:
+			raise ModelMismatchError(
+				"model %s was trained on another catalog" % self.version
+			)
+
+
+class ModelStore:
+	def __init__(self, directory: str) -> None:
+		self.directory = directory
+
+	def publish(
+		self,
+		architecture: str,
+		weights: List[np.ndarray],
+		input_dimension: int,
+		output_dimension: int,
+		layers: List[Dict[str, Any]],
+		training: Dict[str, Any] = None,
+	) -> ModelArtifact:
+		"""
+		writes a model and makes it the latest one.
+		:param architecture: the keras architecture, as json
+		:param weights: the weights of the model, in order
+		:param input_dimension: size of the response vectors it takes
+		:param output_dimension: number of courses it predicts
+		:param layers: {"units": int, "activation": str} of each dense layer
+		:param training: metadata of the training (epochs, rows, etc.)
+		:return: the published model
+		"""
+		os.makedirs(self.directory, exist_ok=True)
+		snapshot = catalog.snapshot()
+		version = "%d" % time.time_ns()
+		metadata = {
+			"version": version,
+			"published": time.strftime("%Y-%m-%dT%H:%M:%S"),
+			"catalog_fingerprint": snapshot.fingerprint,
+			"catalog_version": snapshot.version,
+			"input_dimension": input_dimension,
+			"output_dimension": output_dimension,
+			"layers": layers,
+			"training": training or {},
+		}
+		staging = os.path.join(self.directory, ".staging-" + version)
+		os.makedirs(staging)
+		with open(os.path.join(staging, ARCHITECTURE), "w") as architecture_file:
+			architecture_file.write(architecture)
+		np.savez(os.path.join(staging, WEIGHTS), *weights)
+		with open(os.path.join(staging, METADATA), "w") as metadata_file:
+			json.dump(metadata, metadata_file, indent=2)
+		os.rename(staging, os.path.join(self.directory, version))
+		latest = os.path.join(self.directory, LATEST)
+		with open(latest + ".tmp", "w") as latest_file:
+			latest_file.write(version)
+		os.replace(latest + ".tmp", latest)
+		return self.load(version)
+
+	def load(self, version: str) -> ModelArtifact:
+		directory = os.path.join(self.directory, version)
+		with open(os.path.join(directory, METADATA)) as metadata_file:
+			return ModelArtifact(directory, json.load(metadata_file))
+
+	def latest(self) -> ModelArtifact or None:
+		""" :return: the latest published model, None if there is none """
+		try:
+			with open(os.path.join(self.directory, LATEST)) as latest_file:
+				version = latest_file.read().strip()
+		except FileNotFoundError:
+			return None
+		return self.load(version)
+
+	def versions(self) -> List[str]:
+		""" :return: the versions of every published model, oldest first """
+		if not os.path.isdir(self.directory):
+			return []
+		return sorted(
+			(
+				name for name in os.listdir(self.directory)
+				# skips models still being written, in .staging- directories
+				if name.isdigit() and
+				os.path.isfile(os.path.join(self.directory, name, METADATA))
+			),
+			key=int,
+		)
@@ -0,0 +1,93 @@
+"""
+inference for the classifier's Sequential of Dense layers with numpy only,
+so that processes that only rank courses don't need to import keras (and
+tensorflow). a NumpyModel is exported from a trained keras model, or read
+from a model published to a ModelStore, and has the same predict as the
+keras model.
+"""
+from typing import Callable, Dict, List, Tuple, Any
+import numpy as np
+from app.classifier.model_store import ModelArtifact
+from app.classifier.sparse_batches import is_sparse
+
+# keras computes in float32
+DTYPE = np.float32
+
+
+def _softmax(x: np.ndarray) -> np.ndarray:
+	exponentials = np.exp(x - x.max(axis=1, keepdims=True))
+	return exponentials / exponentials.sum(axis=1, keepdims=True)
+
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+	return 1. / (1. + np.exp(-x))
+
+
+# activations by the name keras gives them in a layer's config
+ACTIVATIONS: Dict[str, Callable[[np.ndarray], np.ndarray]] = {
+	"linear": lambda x: x,
+	"relu": lambda x: np.maximum(x, 0),
+	"sigmoid": _sigmoid,
+	"tanh": np.tanh,
+	"softmax": _softmax,
+}
+
+
+class NumpyModel:
+	# predict takes scipy.sparse matrices as they are, see sparse_batches
+	accepts_sparse = True
+
+	def __init__(self, layers: List[Tuple[np.ndarray, np.ndarray, str]]) -> None:
+		"""
+		:param layers: (kernel, bias, activation name) of each Dense layer
+		"""
+		for _, _, activation in layers:
+			assert activation in ACTIVATIONS, \
+				"activation %s is not supported" % repr(activation)
+		self.layers = [
+			(kernel.astype(DTYPE), bias.astype(DTYPE), ACTIVATIONS[activation])
+			for kernel, bias, activation in layers
+		]
+
+	@staticmethod
+	def from_keras(model: Any) -> "NumpyModel":
+		""" exports the weights and activations of a trained Sequential """
+		weights = model.get_weights()
+		return NumpyModel([
+			(weights[2 * index], weights[2 * index + 1], layer.get_config()["activation"])
+			for index, layer in enumerate(model.layers)
+		])
+
+	@staticmethod
+	def from_artifact(artifact: ModelArtifact) -> "NumpyModel":
+		""" reads a model published to a ModelStore """
+		weights = artifact.weights()
+		return NumpyModel([
+			(weights[2 * index], weights[2 * index + 1], layer["activation"])
+			for index, layer in enumerate(artifact.metadata["layers"])
+		])
+
+	def input_dimension(self) -> int:
+		return self.layers[0][0].shape[0]
+
+	def output_dimension(self) -> int:
+		return self.layers[-1][0].shape[1]
+
+	def predict(
+		self,
+		x: np.ndarray,
+		batch_size: int = None,
+		verbose: int = 0,
+	) -> np.ndarray:
+		"""
+		same as the keras model's predict. the whole matrix is computed at
+		once: batch_size and verbose are only accepted for compatibility.
+		:param x:
+			one response vector per row, as an array or a scipy.sparse
+			matrix: the first layer then only reads its non-zero values
+		:return: one row of course probabilities per response
+		"""
+		output = x.astype(DTYPE) if is_sparse(x) else np.asarray(x, dtype=DTYPE)
+		for kernel, bias, activation in self.layers:
+			output = activation(output @ kernel + bias)
+		return output
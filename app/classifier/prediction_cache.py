@@ -0,0 +1,96 @@
+"""
+a bounded cache of course rankings by response vector. answers come from
+small sets of choices, so the same vectors come back often, and a cached
+ranking skips both the network and the sort.
+
+entries are keyed by a 128 bits digest of the vector (instead of the
+vector itself, which has one float per choice) and by the version of the
+model that ranked it. the least recently used entry is evicted once the
+cache is full. it is safe to use from many threads.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Tuple, Any
+import numpy as np
+
+# default maximum number of rankings kept
+CACHE_SIZE = 4096
+
+
+def vector_digest(vector: np.ndarray) -> bytes:
+	"""
+	:return:
+		a digest of the values of vector, the same whatever its dtype or
+		whether it is of shape (n,) or (1, n)
+	"""
+	values = np.ascontiguousarray(np.reshape(vector, -1), dtype=np.float32)
+	return hashlib.blake2b(values.tobytes(), digest_size=16).digest()
+
+
+class PredictionCache:
+	def __init__(self, max_size: int = CACHE_SIZE) -> None:
+		"""
+		:param max_size: maximum number of entries, 0 to cache nothing
+		"""
+		self.max_size = max_size
+		self._lock = threading.Lock()
+		self._entries: "OrderedDict[Tuple[bytes, Hashable], Any]" = OrderedDict()
+		# metrics
+		self._hits = 0
+		self._misses = 0
+		self._evictions = 0
+		self._invalidations = 0
+
+	@staticmethod
+	def key(vector: np.ndarray, *version: Hashable) -> Tuple[bytes, Hashable]:
+		"""
+		:param version:
+			whatever else the cached value depends on, i.e. the model
+			version and the options of the ranking
+		"""
+		return vector_digest(vector), version
+
+	def get(self, key: Tuple[bytes, Hashable]) -> Any or None:
+		""" :return: the value cached for key, None if there is none """
+		with self._lock:
+			value = self._entries.get(key)
+			if value is None:
+				self._misses += 1
+				return None
+			self._entries.move_to_end(key)
+			self._hits += 1
+			return value
+
+	def put(self, key: Tuple[bytes, Hashable], value: Any) -> None:
+		if self.max_size <= 0:
+			return
+		with self._lock:
+			self._entries[key] = value
+			self._entries.move_to_end(key)
+			while len(self._entries) > self.max_size:
+				self._entries.popitem(last=False)
+				self._evictions += 1
+
+	def clear(self) -> None:
+		""" drops every entry, i.e. when the model changed """
+		with self._lock:
+			self._entries.clear()
+			self._invalidations += 1
+
+	def __len__(self) -> int:
+		with self._lock:
+			return len(self._entries)
+
+	def metrics(self) -> Dict[str, Any]:
+		with self._lock:
+			lookups = self._hits + self._misses
+			return {
+				"size": len(self._entries),
+				"max_size": self.max_size,
+				"hits": self._hits,
+				"misses": self._misses,
+				"hit_rate": self._hits / lookups if lookups > 0 else 0.,
+				"evictions": self._evictions,
+				"invalidations": self._invalidations,
+			}
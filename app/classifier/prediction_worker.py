@@ -0,0 +1,169 @@
+"""
+a single inference thread that coalesces concurrent predictions. request
+threads submit() response vectors and get a future back; the worker takes
+the first vector queued, gathers whatever else arrives within WINDOW
+seconds (up to MAX_BATCH_SIZE vectors), and runs one predict for all of
+them.
+
+under load, the cost of a predict call is then shared by a whole batch
+instead of being paid by every request. the worker does not make predict
+thread safe by itself: Classifier also predicts and trains from other
+threads, and serializes every use of its model with a lock (see
+Classifier._model_access).
+"""
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Tuple, Any
+import numpy as np
+from app.utils.histogram_util import Histogram, exponential_bounds
+
+# seconds the worker waits for more vectors after the first one
+WINDOW = 0.002
+# maximum number of vectors per predict
+MAX_BATCH_SIZE = 256
+
+# batch sizes 1, 2, 4, ... 1024, then larger
+BATCH_SIZE_BOUNDS = exponential_bounds(1, 11)
+# seconds from submit to predict: 0.1ms, 0.2ms, ... up to about 3s
+QUEUE_WAIT_BOUNDS = exponential_bounds(0.0001, 16)
+
+
+class PredictionWorker:
+	def __init__(
+		self,
+		predict: Callable[[np.ndarray], np.ndarray],
+		window: float = WINDOW,
+		max_batch_size: int = MAX_BATCH_SIZE,
+	) -> None:
+		"""
+		:param predict:
+			takes a matrix with one vector per row and returns one row of
+			predictions per vector. it is only called from the worker thread
+		:param window: seconds the worker waits for more vectors
+		:param max_batch_size: maximum number of vectors per predict
+		"""
+		assert max_batch_size > 0, "max_batch_size must be positive"
+		self.predict_batch = predict
+		self.window = window
+		self.max_batch_size = max_batch_size
+		self._queue: "queue.Queue[Tuple[np.ndarray, Future, float] or None]" = \
+			queue.Queue()
+		self._lock = threading.Lock()
+		self._thread: threading.Thread = None
+		self._closed = False
+		# metrics
+		self._requests = 0
+		self._batches = 0
+		self._failed_batches = 0
+		self._batch_sizes = Histogram(BATCH_SIZE_BOUNDS)
+		self._queue_waits = Histogram(QUEUE_WAIT_BOUNDS)
+
+	def submit(self, vector: np.ndarray) -> Future:
+		"""
+		queues a vector for the next batch.
+		:param vector: one response vector, of shape (n,) or (1, n)
+		:return: a future of the row of predictions of the vector
+		"""
+		future = Future()
+		with self._lock:
+			if self._closed:
+				raise RuntimeError("the prediction worker is closed")
+			self._requests += 1
+			self._queue.put((np.reshape(vector, -1), future, time.perf_counter()))
+		return future
+
+	def predict(self, vector: np.ndarray, timeout: float = None) -> np.ndarray:
+		""" submit, then wait for the row of predictions of vector """
+		return self.submit(vector).result(timeout)
+
+	def start(self) -> "PredictionWorker":
+		""" starts predicting in a background thread """
+		assert self._thread is None, "the worker is already started"
+		self._thread = threading.Thread(
+			target=self._run,
+			name="prediction-worker",
+			daemon=True,
+		)
+		self._thread.start()
+		return self
+
+	def close(self) -> None:
+		""" stops accepting vectors, predicts the queued ones and stops """
+		with self._lock:
+			if self._closed:
+				return
+			self._closed = True
+			self._queue.put(None)
+		if self._thread is not None:
+			self._thread.join()
+
+	def depth(self) -> int:
+		""" number of vectors waiting for a batch """
+		return self._queue.qsize()
+
+	def metrics(self) -> Dict[str, Any]:
+		with self._lock:
+			return {
+				"depth": self._queue.qsize(),
+				"requests": self._requests,
+				"batches": self._batches,
+				"failed_batches": self._failed_batches,
+				"batch_size": self._batch_sizes.as_dict(),
+				"queue_wait": self._queue_waits.as_dict(),
+			}
+
+	def _run(self) -> None:
+		stopping = False
+		while not stopping:
+			item = self._queue.get()
+			if item is None:
+				break
+			batch = [item]
+			deadline = time.perf_counter() + self.window
+			while len(batch) < self.max_batch_size:
+				try:
+					remaining = deadline - time.perf_counter()
+					if remaining > 0:
+						item = self._queue.get(timeout=remaining)
+					else:
+						# past the window, only take what is already queued
+						item = self._queue.get_nowait()
+				except queue.Empty:
+					break
+				if item is None:
+					stopping = True
+					break
+				batch.append(item)
+			self._predict(batch)
+		# vectors queued between close() and the stop marker
+		while True:
+			try:
+				item = self._queue.get_nowait()
+			except queue.Empty:
+				break
+			if item is not None:
+				self._predict([item])
+
+	def _predict(self, batch: List[Tuple[np.ndarray, Future, float]]) -> None:
+		start = time.perf_counter()
+		# skips the vectors whose caller cancelled its future
+		batch = [entry for entry in batch if entry[1].set_running_or_notify_cancel()]
+		if len(batch) == 0:
+			return
+		with self._lock:
+			self._batches += 1
+			self._batch_sizes.record(len(batch))
+			for _, _, submitted in batch:
+				self._queue_waits.record(start - submitted)
+		try:
+			predictions = self.predict_batch(np.stack([vector for vector, _, _ in batch]))
+		except Exception as error:
+			with self._lock:
+				self._failed_batches += 1
+			for _, future, _ in batch:
+				future.set_exception(error)
+			return
+		for row, (_, future, _) in zip(predictions, batch):
+			future.set_result(row)
@@ -1,7 +1,7 @@
-from typing import Iterable, Dict, Set, List
+from typing import Iterable, Dict, Set, List, Tuple, Any
 from app.classifier.custom_types import SQuestion, SChoice, QID, AID
 import numpy as np
-import app.db.database as database
+import app.db.catalog as catalog
 from app.utils.resolver_util import ValueResolver
 
 
@@ -13,6 +13,27 @@ class QuestionAnswerManager:
 		self.aid_vector_map: Dict[QID, Dict[AID, List[int]]] = None
 		self.input_dimension: int = None
 		self.qid_set: Set[QID] = None
+		self.catalog_version: int = None
+		# the lookup tables of the encoders, computed once by setup():
+		# qids in order of column, and for the question of each column the
+		# offset of its columns in the response vector, the code of each of
+		# its answers (1, 2, ... by aid, 0 is "not answered", as in
+		# packed_answers) and the vector of each code
+		self.qids_ordered: List[QID] = None
+		self.qid_to_column: Dict[QID, int] = None
+		self.column_offsets: np.ndarray = None
+		self.answer_codes: List[Dict[AID, int]] = None
+		self.code_tables: List[np.ndarray] = None
+		# the same tables for encode_sparse: for each code of each question,
+		# the number of non-zero values of its vector, then their columns
+		# in the response vector and their values
+		self.sparse_tables: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+		# the same lookups as arrays indexed by id, for encode_answer_arrays:
+		# the column of each qid and the column and code of each aid, -1 and
+		# 0 for ids that are not in the catalog
+		self.qid_columns: np.ndarray = None
+		self.aid_columns: np.ndarray = None
+		self.aid_codes: np.ndarray = None
 		self.setup()
 
 	def setup(self) -> None:
@@ -20,7 +41,8 @@ class QuestionAnswerManager:
 		question_dimension_map = {}
 		aid_vector_map = {}
 		qid_set = set()
-		for qid, question, answer_list in database.load_questions():
+		snapshot = catalog.snapshot()
+		for qid, question, answer_list in snapshot.questions:
 			qid_resolver[[qid, question]] = qid
 			question_dimension = None
 			# answer_list should never be larger than 10 and usually max 4
@@ -34,7 +56,7 @@ class QuestionAnswerManager:
 					"dimension must be the same across all answer choices. " \
 					"%s fails this check" % repr(qid)
 				dic = aid_vector_map.get(qid, {})
-				dic[aid] = vector
+				dic[aid] = list(vector)
 				aid_vector_map[qid] = dic
 			question_dimension_map[qid] = question_dimension
 			qid_set.add(qid)
@@ -44,6 +66,55 @@ class QuestionAnswerManager:
 		self.input_dimension = \
 			sum([question_dimension_map[qid] for qid in question_dimension_map])
 		self.qid_set = qid_set
+		self.catalog_version = snapshot.version
+		self.setup_encoder()
+
+	def setup_encoder(self) -> None:
+		qids_ordered = sorted(self.qid_set)
+		offsets, answer_codes, code_tables = [], [], []
+		offset = 0
+		for qid in qids_ordered:
+			aids = sorted(self.aid_vector_map[qid])
+			dimension = self.question_dimension_map[qid]
+			table = np.zeros((len(aids) + 1, dimension))
+			for code, aid in enumerate(aids, 1):
+				table[code] = self.aid_vector_map[qid][aid]
+			offsets.append(offset)
+			answer_codes.append({aid: code for code, aid in enumerate(aids, 1)})
+			code_tables.append(table)
+			offset += dimension
+		self.qids_ordered = qids_ordered
+		self.qid_to_column = {qid: column for column, qid in enumerate(qids_ordered)}
+		self.column_offsets = np.array(offsets + [offset], dtype=np.int64)
+		self.answer_codes = answer_codes
+		self.code_tables = code_tables
+		self.sparse_tables = [
+			self._sparse_table(table, offset)
+			for table, offset in zip(code_tables, offsets)
+		]
+		all_aids = [aid for codes in answer_codes for aid in codes]
+		self.qid_columns = np.full(max(qids_ordered, default=-1) + 1, -1, dtype=np.int64)
+		self.aid_columns = np.full(max(all_aids, default=-1) + 1, -1, dtype=np.int64)
+		self.aid_codes = np.zeros(len(self.aid_columns), dtype=np.uint8)
+		for column, (qid, codes) in enumerate(zip(qids_ordered, answer_codes)):
+			self.qid_columns[qid] = column
+			for aid, code in codes.items():
+				self.aid_columns[aid] = column
+				self.aid_codes[aid] = code
+
+	@staticmethod
+	def _sparse_table(
+		table: np.ndarray,
+		offset: int
+	) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+		counts = np.count_nonzero(table, axis=1)
+		columns = np.zeros((len(table), counts.max()), dtype=np.int32)
+		values = np.zeros((len(table), counts.max()))
+		for code, vector in enumerate(table):
+			non_zero = np.flatnonzero(vector)
+			columns[code, :len(non_zero)] = offset + non_zero
+			values[code, :len(non_zero)] = vector[non_zero]
+		return counts, columns, values
 
 	def get_qid(self, question: QID or SQuestion) -> QID:
 		return self.qid_resolver[question]
@@ -60,10 +131,124 @@ class QuestionAnswerManager:
 		self,
 		response: Dict[QID, AID]
 	) -> np.ndarray:
-		vector_list = []
-		for qid in self.question_ids_ordered():
-			vector_list.extend(self.get_answer_vector(qid, response))
-		return np.array(vector_list)
+		vector = np.zeros(self.input_dimension)
+		offsets = self.column_offsets
+		for qid, aid in response.items():
+			column = self.qid_to_column.get(qid)
+			if column is None or aid is None:
+				continue
+			vector[offsets[column]:offsets[column + 1]] = \
+				self.code_tables[column][self.answer_codes[column][aid]]
+		return vector
+
+	def encode_answers(self, responses: Iterable[Dict[QID, AID]]) -> np.ndarray:
+		"""
+		:return:
+			the (response count, question count) matrix of the answer codes
+			of responses, to give to encode_batch
+		"""
+		responses = list(responses)
+		codes = np.zeros((len(responses), self.question_count()), dtype=np.uint8)
+		qid_to_column, answer_codes = self.qid_to_column, self.answer_codes
+		for row, response in enumerate(responses):
+			for qid, aid in response.items():
+				column = qid_to_column.get(qid)
+				if column is not None and aid is not None:
+					codes[row, column] = answer_codes[column][aid]
+		return codes
+
+	def encode_answer_arrays(
+		self,
+		rows: np.ndarray,
+		qids: np.ndarray,
+		aids: np.ndarray,
+		row_count: int
+	) -> np.ndarray:
+		"""
+		encode_answers for answers given as columns (see
+		database.load_labelled_answer_arrays), without a python object
+		per answer. answers to questions not in the catalog are ignored.
+		:param rows: the row of the response of each answer
+		:param qids: the qid of each answer
+		:param aids: the aid of each answer
+		:param row_count: number of responses
+		:return: see encode_answers
+		"""
+		rows, qids, aids = np.asarray(rows), np.asarray(qids), np.asarray(aids)
+		known = (qids >= 0) & (qids < len(self.qid_columns))
+		columns = np.full(len(qids), -1, dtype=np.int64)
+		columns[known] = self.qid_columns[qids[known]]
+		known = columns >= 0
+		rows, columns, aids = rows[known], columns[known], aids[known]
+		valid = (aids >= 0) & (aids < len(self.aid_columns))
+		valid[valid] = self.aid_columns[aids[valid]] == columns[valid]
+		if not valid.all():
+			raise KeyError(
+				"answers %s are not answers of their question" %
+				repr(sorted(set(aids[~valid].tolist())))
+			)
+		codes = np.zeros((row_count, self.question_count()), dtype=np.uint8)
+		codes[rows, columns] = self.aid_codes[aids]
+		return codes
+
+	def encode_batch(
+		self,
+		codes: np.ndarray,
+		out: np.ndarray = None
+	) -> np.ndarray:
+		"""
+		:param codes:
+			a (response count, question count) matrix of answer codes, with
+			questions in order of qid: unpacked answers (see
+			packed_answers.py) or the result of encode_answers
+		:param out:
+			a (response count, input dimension) matrix to write the response
+			vectors into, allocated if not given
+		:return: the matrix of the response vectors, one row per response
+		"""
+		if out is None:
+			out = np.zeros((len(codes), self.input_dimension))
+		assert out.shape == (len(codes), self.input_dimension), \
+			"out must be of shape %s" % repr((len(codes), self.input_dimension))
+		offsets = self.column_offsets
+		for column, table in enumerate(self.code_tables):
+			out[:, offsets[column]:offsets[column + 1]] = table[codes[:, column]]
+		return out
+
+	def encode_sparse(self, codes: np.ndarray) -> Any:
+		"""
+		same as encode_batch, as a scipy.sparse CSR matrix. only the non-zero
+		values of the answers given are written, so memory and time depend
+		on the number of answers rather than on the input dimension.
+		:param codes: see encode_batch
+		:return: a (response count, input dimension) csr_matrix
+		"""
+		# imported here so that dense-only processes don't import scipy
+		import scipy.sparse
+		counts = [
+			table_counts[codes[:, column]]
+			for column, (table_counts, _, _) in enumerate(self.sparse_tables)
+		]
+		indptr = np.zeros(len(codes) + 1, dtype=np.int64)
+		np.cumsum(np.sum(counts, axis=0), out=indptr[1:])
+		indices = np.empty(indptr[-1], dtype=np.int32)
+		values = np.empty(indptr[-1])
+		# where the values of the next question go in each row. questions
+		# are in order of column, so the indices of each row are sorted
+		starts = indptr[:-1].copy()
+		for column, (_, columns, table_values) in enumerate(self.sparse_tables):
+			column_codes, column_counts = codes[:, column], counts[column]
+			for value_index in range(columns.shape[1]):
+				rows = np.flatnonzero(column_counts > value_index)
+				row_codes = column_codes[rows]
+				positions = starts[rows] + value_index
+				indices[positions] = columns[row_codes, value_index]
+				values[positions] = table_values[row_codes, value_index]
+			starts += column_counts
+		return scipy.sparse.csr_matrix(
+			(values, indices, indptr),
+			shape=(len(codes), self.input_dimension),
+		)
 
 	def get_answer_vector(
 		self,
@@ -75,7 +260,7 @@ class QuestionAnswerManager:
 		return self.aid_vector_map[qid][response[qid]]
 
 	def question_ids_ordered(self) -> List[QID]:
-		return sorted([qid for qid in self.question_ids()])
+		return list(self.qids_ordered)
 
 	def question_ids(self) -> Iterable[QID]:
 		for qid in self.qid_set:
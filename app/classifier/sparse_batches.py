@@ -0,0 +1,76 @@
+"""
+feeds the data matrices to models whether they are dense or scipy.sparse
+CSR matrices (see QuestionAnswerManager.encode_sparse). keras models only
+take dense input, so a sparse matrix is densified one batch at a time and
+at most batch_size dense rows exist at once. models with accepts_sparse
+set (i.e. NumpyModel) are given the sparse matrix as is.
+"""
+import math
+from typing import Iterator, Tuple, Any
+import numpy as np
+
+
+def is_sparse(matrix: Any) -> bool:
+	# a scipy.sparse matrix, without importing scipy for dense matrices
+	return hasattr(matrix, "tocsr") and hasattr(matrix, "nnz")
+
+
+def dense_batches(
+	data: Any,
+	labels: np.ndarray,
+	batch_size: int,
+	shuffle: bool = True,
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+	"""
+	yields (dense data, labels) batches of batch_size rows forever, in a
+	new random order every epoch if shuffle, as keras' fit_generator wants
+	"""
+	row_count = data.shape[0]
+	while True:
+		order = np.random.permutation(row_count) if shuffle else np.arange(row_count)
+		for start in range(0, row_count, batch_size):
+			rows = order[start:start + batch_size]
+			yield data[rows].toarray(), np.asarray(labels[rows])
+
+
+def fit(
+	model: Any,
+	data: Any,
+	labels: np.ndarray,
+	epochs: int,
+	batch_size: int,
+	verbose: int,
+) -> None:
+	""" model.fit, densifying data one batch at a time if it is sparse """
+	if not is_sparse(data):
+		model.fit(data, labels, epochs=epochs, batch_size=batch_size, verbose=verbose)
+		return
+	# keras 2.2 only takes generators through fit_generator, later
+	# versions take them through fit
+	fit_generator = getattr(model, "fit_generator", model.fit)
+	fit_generator(
+		dense_batches(data.tocsr(), labels, batch_size),
+		steps_per_epoch=math.ceil(data.shape[0] / batch_size),
+		epochs=epochs,
+		verbose=verbose,
+	)
+
+
+def predict(
+	model: Any,
+	data: Any,
+	batch_size: int = 1024,
+	verbose: int = 0,
+) -> np.ndarray:
+	""" model.predict, densifying data one batch at a time if it is sparse """
+	if not is_sparse(data) or getattr(model, "accepts_sparse", False):
+		return model.predict(data, batch_size=batch_size, verbose=verbose)
+	data = data.tocsr()
+	return np.vstack([
+		model.predict(
+			data[start:start + batch_size].toarray(),
+			batch_size=batch_size,
+			verbose=verbose,
+		)
+		for start in range(0, data.shape[0], batch_size)
+	])
@@ -0,0 +1,78 @@
+import time
+import threading
+import unittest
+import numpy as np
+import app.db.database as database
+from app.classifier.classifier import Classifier
+from app.db.__tests__.sqlite_test_case import SQLiteTestCase, store_question
+
+
+class OverlapModel:
+	""" a model that records how many of its calls ever ran at once """
+
+	def __init__(self, output_dimension: int) -> None:
+		self.output_dimension = output_dimension
+		self.lock = threading.Lock()
+		self.active = 0
+		self.max_active = 0
+		self.fits = 0
+
+	def _call(self, duration: float) -> None:
+		with self.lock:
+			self.active += 1
+			self.max_active = max(self.max_active, self.active)
+		time.sleep(duration)
+		with self.lock:
+			self.active -= 1
+
+	def fit(self, data, labels, epochs, batch_size, verbose):
+		self._call(0.05)
+		self.fits += 1
+
+	def predict(self, data, batch_size=None, verbose=0):
+		self._call(0.001)
+		return np.full((data.shape[0], self.output_dimension), 1. / self.output_dimension)
+
+
+class TestClassifier(SQLiteTestCase):
+
+	def setUp(self):
+		super().setUp()
+		store_question("do you like labs?")
+		qid, _, answers = database.load_questions()[0]
+		database.store_responses([({qid: answers[0][0]}, "6")])
+		self.classifier = Classifier(build_model=False)
+		self.model = OverlapModel(self.classifier.data_manager.output_dimension())
+		self.classifier._replace_model(self.model, None)
+
+	def tearDown(self):
+		self.classifier.close()
+		super().tearDown()
+
+	def test_predictions_and_training_never_overlap(self):
+		classifier = self.classifier
+		input_dimension = classifier.data_manager.input_dimension()
+
+		def predict(index):
+			for repeat in range(10):
+				# distinct vectors, so that none comes from the prediction cache
+				vector = np.full((1, input_dimension), index * 10 + repeat)
+				if index % 3 == 0:
+					classifier.predict_ranking(vector)
+				elif index % 3 == 1:
+					classifier.serve_ranking(vector, timeout=5)
+				else:
+					classifier.predict_batch(np.vstack([vector, vector]))
+
+		threads = [threading.Thread(target=classifier.train, kwargs={"verbose_mode": 0})]
+		threads += [threading.Thread(target=predict, args=(index,)) for index in range(6)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		self.assertEqual(self.model.fits, 1)
+		self.assertEqual(self.model.max_active, 1)
+
+
+if __name__ == "__main__":
+	unittest.main()
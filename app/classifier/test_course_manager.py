@@ -0,0 +1,44 @@
+import unittest
+import numpy as np
+from app.classifier.course_manager import CourseManager
+from app.db.__tests__.sqlite_test_case import SQLiteTestCase
+
+
+class TestCourseManager(SQLiteTestCase):
+
+	def setUp(self):
+		super().setUp()
+		self.cm = CourseManager()
+
+	def test_index_aligned_course_arrays(self):
+		for cid in self.cm.course_ids():
+			index = self.cm.get_course_index(cid)
+			_, cn, course = self.cm.get_course_bundle(cid)
+			self.assertEqual(self.cm.index_to_cid[index], cid)
+			self.assertEqual(self.cm.index_to_cn[index], cn)
+			self.assertEqual(self.cm.index_to_course[index], course)
+
+	def test_rank_matches_a_full_sort_with_and_without_top_k(self):
+		predictions = np.random.RandomState(0).rand(50, self.cm.course_count)
+		full = self.cm.rank(predictions)
+		expected = [sorted(range(len(row)), key=lambda i: -row[i]) for row in predictions]
+		self.assertEqual(full.tolist(), expected)
+		top = self.cm.rank(predictions, top_k=3)
+		self.assertEqual(top.tolist(), [row[:3] for row in expected])
+
+	def test_course_indices_and_one_hot(self):
+		cns = ["6", "18", "6", "8", "6"]
+		indices = self.cm.get_course_indices(cns)
+		self.assertEqual(indices.dtype, np.int32)
+		self.assertEqual(indices.tolist(), [self.cm.get_course_index(cn) for cn in cns])
+		np.testing.assert_array_equal(
+			self.cm.one_hot(indices),
+			np.vstack([self.cm.get_course_vector(cn) for cn in cns]),
+		)
+		self.assertEqual(self.cm.get_course_indices(iter([])).tolist(), [])
+		with self.assertRaises(KeyError):
+			self.cm.get_course_indices(["not a course"])
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,68 @@
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from app.classifier.data_manager import DataManager
+from app.classifier.model_store import ModelStore, ModelMismatchError
+from app.db.__tests__.sqlite_test_case import SQLiteTestCase, store_question
+
+
+class TestModelStore(SQLiteTestCase):
+
+	def setUp(self):
+		super().setUp()
+		store_question("do you like labs?")
+		self.data_manager = DataManager()
+		self.directory = tempfile.mkdtemp()
+		self.store = ModelStore(self.directory)
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+		super().tearDown()
+
+	def publish(self, input_dimension, output_dimension):
+		return self.store.publish(
+			architecture="{}",
+			weights=[np.ones((input_dimension, output_dimension)), np.zeros(output_dimension)],
+			input_dimension=input_dimension,
+			output_dimension=output_dimension,
+			layers=[{"units": output_dimension, "activation": "softmax"}],
+			training={"epochs": 1},
+		)
+
+	def test_publish_and_load_latest(self):
+		self.assertIsNone(self.store.latest())
+		dimensions = (
+			self.data_manager.input_dimension(),
+			self.data_manager.output_dimension(),
+		)
+		first = self.publish(*dimensions)
+		second = self.publish(*dimensions)
+		self.assertEqual(self.store.versions(), [first.version, second.version])
+		latest = self.store.latest()
+		self.assertEqual(latest.version, second.version)
+		self.assertEqual(latest.metadata["training"], {"epochs": 1})
+		weights = latest.weights()
+		self.assertEqual([w.shape for w in weights], [dimensions, dimensions[1:]])
+		latest.check(self.data_manager)
+
+	def test_mismatched_dimensions_are_refused(self):
+		self.publish(self.data_manager.input_dimension() + 1, 3)
+		with self.assertRaises(ModelMismatchError):
+			self.store.latest().check(self.data_manager)
+
+	def test_models_of_another_catalog_are_refused(self):
+		self.publish(
+			self.data_manager.input_dimension(), self.data_manager.output_dimension()
+		)
+		# a new database, with another question of the same dimensions
+		super().tearDown()
+		super().setUp()
+		store_question("do you like psets?")
+		data_manager = DataManager()
+		with self.assertRaises(ModelMismatchError):
+			self.store.latest().check(data_manager)
+
+
+if __name__ == "__main__":
+	unittest.main()
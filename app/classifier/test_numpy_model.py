@@ -0,0 +1,109 @@
+import shutil
+import tempfile
+import unittest
+import importlib.util
+import numpy as np
+import app.db.database as database
+from app.db.sql import SQLiteEngine
+from app.classifier.model_store import ModelStore
+from app.classifier.numpy_model import NumpyModel
+
+
+def reference_predict(layers, x):
+	""" the Dense layers computed one response and one unit at a time """
+	activations = {
+		"relu": lambda v: [max(value, 0.) for value in v],
+		"softmax": lambda v: [np.exp(value) / sum(np.exp(v)) for value in v],
+	}
+	rows = []
+	for vector in x:
+		for kernel, bias, activation in layers:
+			vector = activations[activation]([
+				sum(vector[i] * kernel[i, j] for i in range(len(vector))) + bias[j]
+				for j in range(kernel.shape[1])
+			])
+		rows.append(vector)
+	return np.array(rows)
+
+
+def random_layers(random, dimensions, activations):
+	return [
+		(random.randn(n_in, n_out), random.randn(n_out), activation)
+		for n_in, n_out, activation in zip(dimensions, dimensions[1:], activations)
+	]
+
+
+class TestNumpyModel(unittest.TestCase):
+	""" needs neither keras nor a database server """
+
+	def setUp(self):
+		random = np.random.RandomState(0)
+		self.layers = random_layers(
+			random, (6, 10, 5, 4), ("relu", "relu", "softmax")
+		)
+		self.x = random.randint(0, 2, (20, 6)).astype(float)
+
+	def test_predict_matches_the_dense_layers(self):
+		model = NumpyModel(self.layers)
+		predictions = model.predict(self.x)
+		np.testing.assert_allclose(
+			predictions, reference_predict(self.layers, self.x), rtol=1e-4, atol=1e-6
+		)
+		np.testing.assert_allclose(predictions.sum(axis=1), 1., rtol=1e-5)
+
+	def test_predict_sparse(self):
+		import scipy.sparse
+		model = NumpyModel(self.layers)
+		np.testing.assert_allclose(
+			model.predict(scipy.sparse.csr_matrix(self.x)),
+			model.predict(self.x),
+			rtol=1e-5,
+		)
+
+	def test_from_artifact(self):
+		# the store records the catalog, which is read from an empty db
+		engine, database.engine = database.engine, SQLiteEngine()
+		database.initialize_database()
+		directory = tempfile.mkdtemp()
+		try:
+			artifact = ModelStore(directory).publish(
+				architecture="{}",
+				weights=[w for kernel, bias, _ in self.layers for w in (kernel, bias)],
+				input_dimension=6,
+				output_dimension=4,
+				layers=[
+					{"units": kernel.shape[1], "activation": activation}
+					for kernel, _, activation in self.layers
+				],
+			)
+			model = NumpyModel.from_artifact(artifact)
+		finally:
+			shutil.rmtree(directory)
+			database.engine.pool.close()
+			database.engine = engine
+		np.testing.assert_allclose(
+			model.predict(self.x), NumpyModel(self.layers).predict(self.x)
+		)
+
+
+@unittest.skipUnless(importlib.util.find_spec("keras"), "keras is not installed")
+class TestNumpyModelMatchesKeras(unittest.TestCase):
+
+	def test_predict_matches_keras(self):
+		from keras.models import Sequential
+		from keras.layers import Dense
+		keras_model = Sequential()
+		keras_model.add(Dense(units=10, activation="relu", input_dim=6))
+		keras_model.add(Dense(units=5, activation="relu"))
+		keras_model.add(Dense(units=4, activation="softmax"))
+		x = np.random.RandomState(0).randint(0, 2, (20, 6)).astype(float)
+		np.testing.assert_allclose(
+			NumpyModel.from_keras(keras_model).predict(x),
+			keras_model.predict(x),
+			rtol=1e-4,
+			atol=1e-6,
+		)
+
+
+if __name__ == "__main__":
+	unittest.main()
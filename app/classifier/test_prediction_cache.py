@@ -0,0 +1,75 @@
+import threading
+import unittest
+import numpy as np
+from app.classifier.prediction_cache import PredictionCache, vector_digest
+
+
+class TestPredictionCache(unittest.TestCase):
+	def test_digest(self):
+		vector = np.array([0., 1., 0., 1.])
+		self.assertEqual(vector_digest(vector), vector_digest(vector.reshape(1, 4)))
+		self.assertEqual(vector_digest(vector), vector_digest(vector.astype(np.float32)))
+		self.assertNotEqual(vector_digest(vector), vector_digest(vector[::-1]))
+		self.assertEqual(len(vector_digest(vector)), 16)
+
+	def test_hits_and_misses(self):
+		cache = PredictionCache(10)
+		vector = np.array([1., 0., 0.])
+		key = cache.key(vector, "model-1", None)
+		self.assertIsNone(cache.get(key))
+		cache.put(key, ["ranking"])
+		self.assertEqual(cache.get(key), ["ranking"])
+		self.assertEqual(cache.get(cache.key(vector.copy(), "model-1", None)), ["ranking"])
+		# another model version or top_k is another entry
+		self.assertIsNone(cache.get(cache.key(vector, "model-2", None)))
+		self.assertIsNone(cache.get(cache.key(vector, "model-1", 3)))
+		metrics = cache.metrics()
+		self.assertEqual((metrics["hits"], metrics["misses"]), (2, 3))
+		self.assertEqual(metrics["hit_rate"], 0.4)
+
+	def test_least_recently_used_is_evicted(self):
+		cache = PredictionCache(2)
+		keys = [cache.key(np.array([float(i)]), None) for i in range(3)]
+		cache.put(keys[0], 0)
+		cache.put(keys[1], 1)
+		# keys[0] is now more recently used than keys[1]
+		self.assertEqual(cache.get(keys[0]), 0)
+		cache.put(keys[2], 2)
+		self.assertEqual(len(cache), 2)
+		self.assertIsNone(cache.get(keys[1]))
+		self.assertEqual(cache.get(keys[0]), 0)
+		self.assertEqual(cache.get(keys[2]), 2)
+		self.assertEqual(cache.metrics()["evictions"], 1)
+
+	def test_clear_and_disabled(self):
+		cache = PredictionCache(2)
+		key = cache.key(np.ones(2), None)
+		cache.put(key, 1)
+		cache.clear()
+		self.assertIsNone(cache.get(key))
+		self.assertEqual(cache.metrics()["invalidations"], 1)
+		disabled = PredictionCache(0)
+		disabled.put(key, 1)
+		self.assertIsNone(disabled.get(key))
+
+	def test_threads(self):
+		cache = PredictionCache(50)
+
+		def use(offset):
+			for i in range(500):
+				key = cache.key(np.array([float((i + offset) % 80)]), None)
+				if cache.get(key) is None:
+					cache.put(key, i)
+
+		threads = [threading.Thread(target=use, args=(i,)) for i in range(8)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		metrics = cache.metrics()
+		self.assertEqual(metrics["size"], 50)
+		self.assertEqual(metrics["hits"] + metrics["misses"], 8 * 500)
+
+
+if __name__ == '__main__':
+	unittest.main()
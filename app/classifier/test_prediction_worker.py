@@ -0,0 +1,98 @@
+import threading
+import unittest
+from concurrent.futures import CancelledError
+import numpy as np
+from app.classifier.prediction_worker import PredictionWorker
+
+
+class RecordingModel:
+	""" predicts twice each vector, and records the size of every batch """
+
+	def __init__(self, fail: bool = False) -> None:
+		self.batch_sizes = []
+		self.threads = set()
+		self.fail = fail
+
+	def predict(self, vectors):
+		self.batch_sizes.append(len(vectors))
+		self.threads.add(threading.get_ident())
+		if self.fail:
+			raise ValueError("model failed")
+		return vectors * 2
+
+
+class TestPredictionWorker(unittest.TestCase):
+	def setUp(self):
+		self.model = RecordingModel()
+
+	def test_coalesces_concurrent_requests(self):
+		worker = PredictionWorker(self.model.predict, window=0.05, max_batch_size=64)
+		vectors = [np.full(3, index, dtype=float) for index in range(32)]
+		# queued before the worker starts, so that they are all waiting
+		futures = [worker.submit(vector) for vector in vectors]
+		worker.start()
+		for vector, future in zip(vectors, futures):
+			np.testing.assert_array_equal(future.result(1), vector * 2)
+		worker.close()
+		self.assertEqual(self.model.batch_sizes, [32])
+		self.assertEqual(self.model.threads, {worker._thread.ident})
+
+	def test_max_batch_size(self):
+		worker = PredictionWorker(self.model.predict, window=0.05, max_batch_size=10)
+		futures = [worker.submit(np.ones((1, 3))) for _ in range(25)]
+		worker.start()
+		for future in futures:
+			self.assertEqual(future.result(1).shape, (3,))
+		worker.close()
+		self.assertEqual(self.model.batch_sizes, [10, 10, 5])
+
+	def test_many_threads(self):
+		worker = PredictionWorker(self.model.predict, window=0.01).start()
+		results = {}
+
+		def request(index):
+			results[index] = worker.predict(np.full(4, index, dtype=float), 5)
+
+		threads = [threading.Thread(target=request, args=(i,)) for i in range(50)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		worker.close()
+		for index in range(50):
+			np.testing.assert_array_equal(results[index], np.full(4, 2 * index))
+		self.assertEqual(sum(self.model.batch_sizes), 50)
+		metrics = worker.metrics()
+		self.assertEqual(metrics["requests"], 50)
+		self.assertEqual(metrics["batches"], len(self.model.batch_sizes))
+		self.assertEqual(metrics["batch_size"]["count"], len(self.model.batch_sizes))
+		self.assertEqual(metrics["queue_wait"]["count"], 50)
+
+	def test_failed_batch(self):
+		model = RecordingModel(fail=True)
+		worker = PredictionWorker(model.predict, window=0.05)
+		futures = [worker.submit(np.ones(3)) for _ in range(3)]
+		worker.start()
+		for future in futures:
+			with self.assertRaises(ValueError):
+				future.result(1)
+		worker.close()
+		self.assertEqual(worker.metrics()["failed_batches"], 1)
+
+	def test_cancelled_and_closed(self):
+		worker = PredictionWorker(self.model.predict, window=0.05)
+		cancelled = worker.submit(np.ones(3))
+		kept = worker.submit(np.ones(3))
+		self.assertTrue(cancelled.cancel())
+		worker.start()
+		np.testing.assert_array_equal(kept.result(1), np.full(3, 2.))
+		worker.close()
+		with self.assertRaises(CancelledError):
+			cancelled.result(0)
+		self.assertEqual(self.model.batch_sizes, [1])
+		with self.assertRaises(RuntimeError):
+			worker.submit(np.ones(3))
+
+
+if __name__ == '__main__':
+	unittest.main()
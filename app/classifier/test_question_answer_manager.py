@@ -0,0 +1,81 @@
+import unittest
+import numpy as np
+import app.db.catalog as catalog
+from app.classifier.question_answer_manager import QuestionAnswerManager
+from app.db.__tests__.sqlite_test_case import SQLiteTestCase, store_question
+
+
+class TestQuestionAnswerManager(SQLiteTestCase):
+
+	def setUp(self):
+		super().setUp()
+		store_question("first", ["1,0", "0,1"])
+		# answer vectors are not necessarily one-hot
+		store_question("second", ["1,1,0", "0,2,0", "0,0,3"])
+		self.questions = [
+			(qid, [aid for aid, _, _ in answers])
+			for qid, _, answers in catalog.snapshot().questions
+		]
+		self.qam = QuestionAnswerManager()
+
+	def test_tables(self):
+		(q1, a1), (q2, a2) = self.questions
+		self.assertEqual(self.qam.question_ids_ordered(), [q1, q2])
+		self.assertEqual(self.qam.column_offsets.tolist(), [0, 2, 5])
+		self.assertEqual(self.qam.answer_codes, [
+			{a1[0]: 1, a1[1]: 2},
+			{a2[0]: 1, a2[1]: 2, a2[2]: 3},
+		])
+
+	def test_convert_response_to_vector(self):
+		(q1, a1), (q2, a2) = self.questions
+		convert = self.qam.convert_response_to_vector
+		self.assertEqual(convert({q1: a1[1], q2: a2[0]}).tolist(), [0, 1, 1, 1, 0])
+		# unanswered and unknown questions are left at zero
+		self.assertEqual(convert({q2: a2[2], -1: 7}).tolist(), [0, 0, 0, 0, 3])
+		with self.assertRaises(KeyError):
+			convert({q1: a2[0]})
+
+	def test_encode_batch(self):
+		(q1, a1), (q2, a2) = self.questions
+		responses = [{q1: a1[0], q2: a2[1]}, {}, {q2: a2[2]}, {q1: a1[1]}]
+		codes = self.qam.encode_answers(responses)
+		self.assertEqual(codes.tolist(), [[1, 2], [0, 0], [0, 3], [2, 0]])
+		expected = np.array([
+			self.qam.convert_response_to_vector(response) for response in responses
+		])
+		np.testing.assert_array_equal(self.qam.encode_batch(codes), expected)
+		out = np.full((4, 5), -1.)
+		self.assertIs(self.qam.encode_batch(codes, out=out), out)
+		np.testing.assert_array_equal(out, expected)
+		with self.assertRaises(AssertionError):
+			self.qam.encode_batch(codes, out=np.zeros((3, 5)))
+
+	def test_encode_answer_arrays(self):
+		(q1, a1), (q2, a2) = self.questions
+		codes = self.qam.encode_answer_arrays(
+			rows=[0, 0, 2, 3, 3],
+			qids=[q1, q2, q2, q1, -1],
+			aids=[a1[0], a2[1], a2[2], a1[1], 7],
+			row_count=4,
+		)
+		self.assertEqual(codes.tolist(), [[1, 2], [0, 0], [0, 3], [2, 0]])
+		with self.assertRaises(KeyError):
+			self.qam.encode_answer_arrays([0], [q1], [a2[0]], 1)
+
+	def test_encode_sparse(self):
+		random = np.random.RandomState(0)
+		codes = np.column_stack([
+			random.randint(0, 3, 50), random.randint(0, 4, 50)
+		]).astype(np.uint8)
+		matrix = self.qam.encode_sparse(codes)
+		self.assertEqual(matrix.format, "csr")
+		self.assertTrue(matrix.has_sorted_indices)
+		np.testing.assert_array_equal(matrix.toarray(), self.qam.encode_batch(codes))
+		# only the non-zero values of the answers given are stored
+		self.assertEqual(matrix.nnz, np.count_nonzero(self.qam.encode_batch(codes)))
+		self.assertEqual(self.qam.encode_sparse(codes[:0]).shape, (0, 5))
+
+
+if __name__ == '__main__':
+	unittest.main()
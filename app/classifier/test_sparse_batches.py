@@ -0,0 +1,65 @@
+import unittest
+import numpy as np
+import scipy.sparse
+import app.classifier.sparse_batches as sparse_batches
+
+
+class RecordingModel:
+	""" a keras-like model that only takes dense batches """
+
+	def __init__(self):
+		self.fitted = []
+		self.predicted = []
+
+	def fit(self, data, labels, epochs, batch_size, verbose):
+		self.fitted.append((type(data), len(data)))
+
+	def fit_generator(self, generator, steps_per_epoch, epochs, verbose):
+		for _ in range(steps_per_epoch * epochs):
+			data, labels = next(generator)
+			assert isinstance(data, np.ndarray) and len(data) == len(labels)
+			self.fitted.append((type(data), len(data)))
+
+	def predict(self, data, batch_size, verbose):
+		assert isinstance(data, np.ndarray)
+		self.predicted.append(len(data))
+		return data.sum(axis=1, keepdims=True)
+
+
+class TestSparseBatches(unittest.TestCase):
+
+	def setUp(self):
+		self.dense = np.eye(10)[np.arange(25) % 10]
+		self.sparse = scipy.sparse.csr_matrix(self.dense)
+		self.labels = np.arange(25)[:, None]
+		self.model = RecordingModel()
+
+	def test_is_sparse(self):
+		self.assertTrue(sparse_batches.is_sparse(self.sparse))
+		self.assertFalse(sparse_batches.is_sparse(self.dense))
+
+	def test_dense_batches_cover_every_row_each_epoch(self):
+		batches = sparse_batches.dense_batches(self.sparse, self.labels, 10)
+		labels = [next(batches)[1] for _ in range(3)]
+		self.assertEqual([len(batch) for batch in labels], [10, 10, 5])
+		self.assertEqual(sorted(np.concatenate(labels)[:, 0]), list(range(25)))
+		data, labels = next(batches)
+		np.testing.assert_array_equal(data, self.dense[labels[:, 0]])
+
+	def test_fit(self):
+		sparse_batches.fit(self.model, self.dense, self.labels, 2, 10, 0)
+		self.assertEqual(self.model.fitted, [(np.ndarray, 25)])
+		self.model.fitted = []
+		sparse_batches.fit(self.model, self.sparse, self.labels, 2, 10, 0)
+		self.assertEqual(
+			[rows for _, rows in self.model.fitted], [10, 10, 5, 10, 10, 5]
+		)
+
+	def test_predict(self):
+		predictions = sparse_batches.predict(self.model, self.sparse, batch_size=10)
+		np.testing.assert_array_equal(predictions, np.ones((25, 1)))
+		self.assertEqual(self.model.predicted, [10, 10, 5])
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,148 @@
+import unittest
+from unittest import mock
+import numpy as np
+import app.db.database as database
+from app.classifier.data_manager import DataManager
+from app.classifier.training_data import TrainingData
+from app.db.__tests__.sqlite_test_case import SQLiteTestCase, store_question
+
+
+class FakeDataManager:
+	""" encodes a response as its single answer and its course index """
+
+	def input_dimension(self):
+		return 1
+
+	def output_dimension(self):
+		return 3
+
+	def encode_responses(self, responses, sparse=False, sparse_labels=False):
+		data = np.array([[answers[1]] for _, _, answers in responses])
+		if sparse_labels:
+			return data, np.array([int(cn) for _, cn, _ in responses], dtype=np.int32)
+		labels = np.zeros((len(responses), 3))
+		for row, (_, cn, _) in enumerate(responses):
+			labels[row, int(cn)] = 1
+		return data, labels
+
+
+def refresh(training_data, responses, label_watermark, committed_rid=0):
+	with mock.patch(
+		"app.classifier.training_data.database.load_labelled_responses_since",
+		return_value=(responses, label_watermark, committed_rid),
+	) as load:
+		training_data.refresh()
+	return load.call_args[0]
+
+
+class TestTrainingData(unittest.TestCase):
+
+	def test_refresh_appends_new_responses_past_capacity(self):
+		training_data = TrainingData(FakeDataManager(), capacity=1)
+		refresh(training_data, [(1, "0", {1: 10}), (2, "1", {1: 20})], 5, 2)
+		args = refresh(training_data, [(7, "2", {1: 70})], 6)
+		self.assertEqual(args, (2, 5, 2, database.RID_SAFETY_WINDOW))
+		self.assertEqual(training_data.data[:, 0].tolist(), [10, 20, 70])
+		self.assertEqual(training_data.labels.argmax(axis=1).tolist(), [0, 1, 2])
+		self.assertEqual(training_data.rid_watermark, 7)
+
+	def test_refresh_updates_and_removes_relabelled_responses(self):
+		training_data = TrainingData(FakeDataManager())
+		refresh(training_data, [
+			(1, "0", {1: 10}), (2, "0", {1: 20}), (3, "0", {1: 30}),
+		], 5)
+		refresh(training_data, [(1, None, {1: 10}), (2, "2", {1: 20})], 6)
+		self.assertEqual(training_data.size, 2)
+		self.assertEqual(training_data.data[:, 0].tolist(), [30, 20])
+		self.assertEqual(training_data.labels.argmax(axis=1).tolist(), [0, 2])
+		self.assertEqual(training_data.rid_to_row, {3: 0, 2: 1})
+
+	def test_refresh_skips_responses_read_again(self):
+		training_data = TrainingData(FakeDataManager())
+		refresh(training_data, [(1, "0", {1: 10}), (2, "1", {1: 20})], 5)
+		# the safety window returns the responses below the watermarks again
+		with mock.patch.object(
+			training_data.data_manager, "encode_responses",
+			wraps=training_data.data_manager.encode_responses,
+		) as encode:
+			refresh(training_data, [
+				(1, "0", {1: 10}), (2, "2", {1: 20}), (3, None, {1: 30}),
+			], 6)
+		self.assertEqual(encode.call_args[0][0], [(2, "2", {1: 20})])
+		self.assertEqual(training_data.labels.argmax(axis=1).tolist(), [0, 2])
+		self.assertEqual(training_data.rid_to_cn, {1: "0", 2: "2"})
+
+	def test_sparse_labels(self):
+		training_data = TrainingData(FakeDataManager(), capacity=1, sparse_labels=True)
+		refresh(training_data, [(1, "2", {1: 10}), (2, "1", {1: 20})], 5)
+		refresh(training_data, [(1, None, {1: 10})], 6)
+		self.assertEqual(training_data.labels.dtype, np.int32)
+		self.assertEqual(training_data.labels.tolist(), [1])
+		self.assertEqual(training_data.data[:, 0].tolist(), [20])
+
+
+class TestTrainingDataOnDatabase(SQLiteTestCase):
+
+	def setUp(self):
+		super().setUp()
+		store_question("do you like labs?")
+
+	def test_sparse_data_matches_dense_data(self):
+		qid, _, answers = database.load_questions()[0]
+		yes, no = [aid for aid, _, _ in answers]
+		rids = database.store_responses([
+			({qid: yes}, "6"), ({qid: no}, "18"), ({qid: yes}, "8"),
+		])
+		dense = TrainingData(DataManager())
+		sparse = TrainingData(DataManager(), capacity=1, sparse=True)
+		for training_data in (dense, sparse):
+			training_data.refresh()
+		self.assertEqual(sparse.data.format, "csr")
+		np.testing.assert_array_equal(sparse.data.toarray(), dense.data)
+		database.label_response(rids[0], None)
+		for training_data in (dense, sparse):
+			training_data.refresh()
+		self.assertEqual(sparse.data.shape[0], 2)
+		np.testing.assert_array_equal(sparse.data.toarray(), dense.data)
+		np.testing.assert_array_equal(sparse.labels, dense.labels)
+
+	def test_refresh_picks_up_a_lower_rid_committed_late(self):
+		qid, _, answers = database.load_questions()[0]
+		yes, no = [aid for aid, _, _ in answers]
+		rids = database.store_responses([
+			({qid: yes}, "6"), ({qid: no}, "18"), ({qid: yes}, "8"),
+		])
+		# the response with the middle rid is not committed yet when the
+		# training data is refreshed
+		self._execute("DELETE FROM ResponseMappings WHERE rid = %s", (rids[1],))
+		self._execute("DELETE FROM Responses WHERE rid = %s", (rids[1],))
+		training_data = TrainingData(DataManager())
+		self.assertEqual(training_data.refresh(), 2)
+		self.assertEqual(training_data.rid_watermark, rids[2])
+		# the gap keeps the safety window open
+		self.assertEqual(training_data.committed_rid, 0)
+
+		self._execute(
+			"INSERT INTO Responses (rid, cn, salt) VALUES (%s, %s, %s)",
+			(rids[1], "18", "late"),
+		)
+		self._execute(
+			"INSERT INTO ResponseMappings (rid, qid, aid) VALUES (%s, %s, %s)",
+			(rids[1], qid, no),
+		)
+		self.assertEqual(training_data.refresh(), 1)
+		self.assertEqual(sorted(training_data.rid_to_cn.items()), [
+			(rids[0], "6"), (rids[1], "18"), (rids[2], "8"),
+		])
+		self.assertEqual(training_data.committed_rid, rids[2])
+		self.assertEqual(training_data.refresh(), 0)
+
+	@staticmethod
+	def _execute(statement, params):
+		with database.engine.pool.connection() as cnx:
+			database.engine.pool.cursor().execute(statement, params)
+			cnx.commit()
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,110 @@
+import io
+import os
+import sys
+import runpy
+import shutil
+import warnings
+import contextlib
+import tempfile
+import unittest
+import unittest.mock
+import numpy as np
+import app.db.database as database
+from app.classifier.data_manager import DataManager
+from app.classifier.training_data import TrainingData
+from app.classifier.training_snapshot import TrainingSnapshot, StaleSnapshotError
+from app.db.__tests__.sqlite_test_case import SQLiteTestCase, store_question
+
+
+class TestTrainingSnapshot(SQLiteTestCase):
+
+	def setUp(self):
+		super().setUp()
+		self.directory = tempfile.mkdtemp()
+		store_question("do you like labs?")
+		self.data_manager = DataManager()
+		qid, _, answers = database.load_questions()[0]
+		database.store_responses([
+			({qid: answers[0][0]}, "6"),
+			({qid: answers[1][0]}, "18"),
+		])
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+		super().tearDown()
+
+	def test_write_then_load_memory_mapped(self):
+		training_data = TrainingData(self.data_manager)
+		training_data.refresh()
+		TrainingSnapshot.write(self.directory, training_data)
+		TrainingSnapshot.write(self.directory, training_data)
+		# the matrices of the first snapshot were replaced
+		self.assertEqual(len(os.listdir(self.directory)), 3)
+
+		snapshot = TrainingSnapshot.load(self.directory)
+		self.assertIsInstance(snapshot.data, np.memmap)
+		np.testing.assert_array_equal(snapshot.data, training_data.data)
+		np.testing.assert_array_equal(snapshot.labels, training_data.labels)
+		self.assertEqual(snapshot.manifest["rid_watermark"], 2)
+		snapshot.check(self.data_manager)
+
+		store_question("do you like psets?")
+		with self.assertRaises(StaleSnapshotError):
+			snapshot.check(self.data_manager)
+
+	def test_sparse_snapshot(self):
+		training_data = TrainingData(self.data_manager)
+		training_data.refresh()
+		TrainingSnapshot.write(self.directory, training_data, sparse=True)
+		snapshot = TrainingSnapshot.load(self.directory)
+		self.assertEqual(snapshot.data.format, "csr")
+		self.assertEqual(snapshot.data.nnz, 2)
+		np.testing.assert_array_equal(snapshot.data.toarray(), training_data.data)
+		np.testing.assert_array_equal(snapshot.labels, training_data.labels)
+		# replacing it with a dense snapshot removes its three data arrays
+		TrainingSnapshot.write(self.directory, training_data)
+		self.assertEqual(len(os.listdir(self.directory)), 3)
+
+	def test_sparse_training_data(self):
+		dense = TrainingData(self.data_manager)
+		dense.refresh()
+		training_data = TrainingData(self.data_manager, sparse=True)
+		training_data.refresh()
+		snapshot = TrainingSnapshot.write(self.directory, training_data, sparse=True)
+		self.assertEqual(snapshot.data.nnz, 2)
+		np.testing.assert_array_equal(snapshot.data.toarray(), dense.data)
+		snapshot = TrainingSnapshot.write(self.directory, training_data)
+		np.testing.assert_array_equal(snapshot.data, dense.data)
+
+	def test_sparse_labels(self):
+		training_data = TrainingData(self.data_manager, sparse_labels=True)
+		training_data.refresh()
+		snapshot = TrainingSnapshot.write(self.directory, training_data)
+		self.assertEqual(snapshot.labels.dtype, np.int32)
+		self.assertEqual(
+			snapshot.labels.tolist(),
+			self.data_manager.cm.get_course_indices(["6", "18"]).tolist(),
+		)
+		self.assertTrue(snapshot.manifest["sparse_labels"])
+		self.assertEqual(
+			snapshot.manifest["output_dimension"], self.data_manager.output_dimension()
+		)
+		snapshot.check(self.data_manager)
+
+
+	def test_command_line(self):
+		output = io.StringIO()
+		argv = ["training_snapshot", self.directory, "--sparse"]
+		with unittest.mock.patch.object(sys, "argv", argv), \
+			contextlib.redirect_stdout(output), warnings.catch_warnings():
+			# runpy warns that the module was already imported by this test
+			warnings.simplefilter("ignore", RuntimeWarning)
+			runpy.run_module("app.classifier.training_snapshot", run_name="__main__")
+		self.assertIn("wrote 2 responses up to rid 2", output.getvalue())
+		snapshot = TrainingSnapshot.load(self.directory)
+		self.assertTrue(snapshot.manifest["sparse"])
+		self.assertEqual(snapshot.data.shape, (2, 2))
+
+
+if __name__ == "__main__":
+	unittest.main()
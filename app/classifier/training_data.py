@@ -0,0 +1,176 @@
+from typing import Dict, List, Tuple, Any
+from datetime import datetime
+from app.classifier.data_manager import DataManager
+from app.classifier.course_manager import LABEL_DTYPE
+from app.db import database
+import numpy as np
+
+
+class TrainingData:
+	"""
+	the data and label matrices of every labelled response, kept up to
+	date incrementally. each refresh only fetches the responses stored
+	after the last one seen (by rid) and the responses relabelled since
+	the last refresh, then updates the matrices in place: new rows are
+	appended into spare capacity (which doubles when it runs out), and
+	rows whose label was removed are swapped out with the last row.
+	the responses that database.load_labelled_responses_since returns
+	again (from below the watermarks) are skipped unless their label
+	changed.
+	sparse training data keeps the answer codes of each response instead
+	of its data row, one byte per question, and encodes them as a CSR
+	matrix when data is read.
+	"""
+
+	def __init__(
+		self,
+		data_manager: DataManager,
+		capacity: int = 1024,
+		sparse: bool = False,
+		sparse_labels: bool = False,
+		rid_safety_window: int = database.RID_SAFETY_WINDOW,
+	) -> None:
+		"""
+		:param sparse:
+			if true, data is a scipy.sparse CSR matrix (see
+			QuestionAnswerManager.encode_sparse)
+		:param sparse_labels:
+			if true, labels holds the course index of each response (see
+			DataManager.load_training_data) instead of one-hot rows
+		:param rid_safety_window:
+			the most rids below the rid watermark that a refresh reads
+			again, see database.load_labelled_responses_since
+		"""
+		self.data_manager = data_manager
+		self.sparse = sparse
+		self.sparse_labels = sparse_labels
+		self.rid_safety_window = rid_safety_window
+		self.rid_watermark: int = 0
+		self.label_watermark: datetime = None
+		self.committed_rid: int = 0
+		self.size: int = 0
+		self.rid_to_row: Dict[int, int] = {}
+		# the course number of every response in the matrices
+		self.rid_to_cn: Dict[int, str] = {}
+		self.row_to_rid: List[int] = []
+		# one row per response: its answer codes if sparse, else its data row
+		if sparse:
+			self._rows = np.zeros(
+				(capacity, data_manager.qam.question_count()), dtype=np.uint8
+			)
+		else:
+			self._rows = np.zeros((capacity, data_manager.input_dimension()))
+		# the CSR matrix of the rows, encoded by the first read of data
+		self._sparse_data: Any = None
+		self._labels = np.zeros(
+			self._label_shape(capacity),
+			dtype=LABEL_DTYPE if sparse_labels else float,
+		)
+
+	@property
+	def data(self) -> np.ndarray or Any:
+		if not self.sparse:
+			return self._rows[:self.size]
+		if self._sparse_data is None:
+			self._sparse_data = \
+				self.data_manager.encode_codes(self._rows[:self.size], sparse=True)
+		return self._sparse_data
+
+	@property
+	def labels(self) -> np.ndarray:
+		return self._labels[:self.size]
+
+	def refresh(self) -> int:
+		"""
+		pulls the labelled responses that changed since the last refresh
+		into the matrices.
+		:return: the number of responses added, updated or removed
+		"""
+		responses, label_watermark, committed_rid = \
+			database.load_labelled_responses_since(
+				self.rid_watermark,
+				self.label_watermark,
+				self.committed_rid,
+				self.rid_safety_window,
+			)
+		responses = [
+			response for response in responses
+			if self.rid_to_cn.get(response[0]) != response[1]
+		]
+		removed = [rid for rid, cn, _ in responses if cn is None]
+		labelled = [response for response in responses if response[1] is not None]
+		for rid in removed:
+			self._remove(rid)
+		if len(labelled) > 0:
+			rows, labels = self._encode(labelled)
+			for (rid, cn, _), row, label_row in zip(labelled, rows, labels):
+				self._set(rid, cn, row, label_row)
+				self.rid_watermark = max(self.rid_watermark, rid)
+		self.label_watermark = label_watermark
+		self.committed_rid = committed_rid
+		return len(responses)
+
+	def _encode(
+		self,
+		responses: List[Tuple[int, str, Dict[int, int]]],
+	) -> Tuple[np.ndarray, np.ndarray]:
+		""" :return: the rows (see _rows) and the labels of responses """
+		if not self.sparse:
+			return self.data_manager.encode_responses(
+				responses, sparse_labels=self.sparse_labels
+			)
+		codes = self.data_manager.qam.encode_answers(
+			answers for _, _, answers in responses
+		)
+		return codes, self.data_manager.encode_labels(
+			(cn for _, cn, _ in responses), self.sparse_labels
+		)
+
+	def _set(
+		self,
+		rid: int,
+		cn: str,
+		response_row: np.ndarray,
+		label_row: np.ndarray,
+	) -> None:
+		row = self.rid_to_row.get(rid)
+		if row is None:
+			if self.size == len(self._rows):
+				self._grow()
+			row = self.size
+			self.rid_to_row[rid] = row
+			self.row_to_rid.append(rid)
+			self.size += 1
+		self._rows[row] = response_row
+		self._labels[row] = label_row
+		self.rid_to_cn[rid] = cn
+		self._sparse_data = None
+
+	def _remove(self, rid: int) -> None:
+		row = self.rid_to_row.pop(rid, None)
+		if row is None:
+			return
+		del self.rid_to_cn[rid]
+		last = self.size - 1
+		if row != last:
+			last_rid = self.row_to_rid[last]
+			self._rows[row] = self._rows[last]
+			self._labels[row] = self._labels[last]
+			self.row_to_rid[row] = last_rid
+			self.rid_to_row[last_rid] = row
+		self.row_to_rid.pop()
+		self.size -= 1
+		self._sparse_data = None
+
+	def _grow(self) -> None:
+		capacity = max(1, 2 * len(self._rows))
+		rows = np.zeros((capacity, self._rows.shape[1]), dtype=self._rows.dtype)
+		labels = np.zeros(self._label_shape(capacity), dtype=self._labels.dtype)
+		rows[:self.size] = self._rows[:self.size]
+		labels[:self.size] = self.labels
+		self._rows, self._labels = rows, labels
+
+	def _label_shape(self, capacity: int) -> Tuple[int, ...]:
+		if self.sparse_labels:
+			return (capacity,)
+		return capacity, self.data_manager.output_dimension()
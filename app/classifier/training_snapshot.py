@@ -0,0 +1,190 @@
+"""
+a snapshot of the training matrices on disk, so that training jobs and
+analysis scripts on the same machine can share one copy of the training
+data instead of each loading it from the database.
+
+a snapshot is a directory with the data and label matrices as .npy files
+and a manifest.json describing them: the catalog they were encoded with,
+the rid and label watermarks of the responses they hold, and their
+dimensions. the data matrix is either dense or, for snapshots written
+with sparse=True, a scipy.sparse CSR matrix stored as its three arrays
+(values, column indices and row pointers). labels are one-hot rows, or
+course indexes for training data with sparse_labels. matrices are loaded
+memory-mapped (read only), so every process reading a snapshot shares the
+same page-cached copy and loading takes the same time whatever the size
+of the data.
+
+usage: python -m app.classifier.training_snapshot directory [--sparse]
+"""
+import os
+import sys
+import json
+import time
+from typing import Dict, List, Any
+import numpy as np
+from app.classifier.data_manager import DataManager
+from app.classifier.training_data import TrainingData
+from app.classifier.course_manager import LABEL_DTYPE
+import app.db.catalog as catalog
+
+# version of the layout of a snapshot directory. format 2 added sparse
+# data matrices, format 1 snapshots are still read
+SNAPSHOT_FORMAT = 2
+SUPPORTED_FORMATS = (1, 2)
+MANIFEST = "manifest.json"
+# the matrices are stored as float32, which is what keras trains on
+DTYPE = np.float32
+
+
+class StaleSnapshotError(Exception):
+	""" raised when a snapshot was encoded with a different catalog """
+
+
+class TrainingSnapshot:
+	def __init__(
+		self,
+		directory: str,
+		manifest: Dict[str, Any],
+		data: np.ndarray or Any,
+		labels: np.ndarray,
+	) -> None:
+		self.directory = directory
+		self.manifest = manifest
+		self.data = data
+		self.labels = labels
+
+	@staticmethod
+	def write(
+		directory: str,
+		training_data: TrainingData,
+		sparse: bool = False,
+	) -> "TrainingSnapshot":
+		"""
+		writes the matrices of training_data as the snapshot in directory.
+		if sparse, the data matrix is written as a CSR matrix, which takes
+		space in proportion to the answers given instead of the dimension.
+		sparse training data is written as it is, without densifying it.
+		readers never see a partial snapshot: the matrices are written
+		under new names first, then the manifest is replaced atomically.
+		the matrices of the previous snapshot are removed afterwards
+		(processes that mapped them keep reading them until they close).
+		"""
+		os.makedirs(directory, exist_ok=True)
+		previous = TrainingSnapshot._read_manifest(directory)
+		snapshot = catalog.snapshot()
+		generation = "%d" % time.time_ns()
+		manifest = {
+			"format": SNAPSHOT_FORMAT,
+			"catalog_fingerprint": snapshot.fingerprint,
+			"catalog_version": snapshot.version,
+			"rid_watermark": training_data.rid_watermark,
+			"label_watermark":
+				None if training_data.label_watermark is None
+				else str(training_data.label_watermark),
+			"rows": training_data.size,
+			"input_dimension": training_data.data.shape[1],
+			"output_dimension": training_data.data_manager.output_dimension(),
+			"sparse_labels": training_data.sparse_labels,
+			"sparse": sparse,
+			"data": "data.%s.npy" % generation,
+			"labels": "labels.%s.npy" % generation,
+		}
+		arrays = [("labels", training_data.labels.astype(
+			LABEL_DTYPE if training_data.sparse_labels else DTYPE, copy=False
+		))]
+		data = training_data.data
+		if sparse:
+			import scipy.sparse
+			data = scipy.sparse.csr_matrix(data, dtype=DTYPE)
+			# scipy wants the same dtype for both, and int32 when it fits
+			index_dtype = np.int32 if data.nnz < 2 ** 31 else np.int64
+			manifest["data_indices"] = "data_indices.%s.npy" % generation
+			manifest["data_indptr"] = "data_indptr.%s.npy" % generation
+			arrays += [
+				("data", data.data),
+				("data_indices", data.indices.astype(index_dtype, copy=False)),
+				("data_indptr", data.indptr.astype(index_dtype, copy=False)),
+			]
+		else:
+			if training_data.sparse:
+				data = data.toarray()
+			arrays.append(("data", data.astype(DTYPE, copy=False)))
+		for name, array in arrays:
+			np.save(os.path.join(directory, manifest[name]), array)
+		manifest_path = os.path.join(directory, MANIFEST)
+		with open(manifest_path + ".tmp", "w") as manifest_file:
+			json.dump(manifest, manifest_file, indent=2)
+		os.replace(manifest_path + ".tmp", manifest_path)
+		if previous is not None:
+			for file_name in TrainingSnapshot._array_files(previous):
+				try:
+					os.remove(os.path.join(directory, file_name))
+				except FileNotFoundError:
+					pass
+		return TrainingSnapshot.load(directory)
+
+	@staticmethod
+	def load(directory: str) -> "TrainingSnapshot":
+		""" maps the snapshot in directory into memory, read only """
+		manifest = TrainingSnapshot._read_manifest(directory)
+		if manifest is None:
+			raise FileNotFoundError("no training snapshot in %s" % directory)
+		assert manifest["format"] in SUPPORTED_FORMATS, \
+			"unsupported snapshot format %s" % repr(manifest["format"])
+
+		def load_array(name: str) -> np.ndarray:
+			return np.load(os.path.join(directory, manifest[name]), mmap_mode="r")
+
+		data = load_array("data")
+		if manifest.get("sparse", False):
+			import scipy.sparse
+			# copy=False keeps the arrays memory-mapped
+			data = scipy.sparse.csr_matrix(
+				(data, load_array("data_indices"), load_array("data_indptr")),
+				shape=(manifest["rows"], manifest["input_dimension"]),
+				copy=False,
+			)
+		return TrainingSnapshot(directory, manifest, data, load_array("labels"))
+
+	def check(self, data_manager: DataManager) -> None:
+		"""
+		raises StaleSnapshotError unless this snapshot was encoded with
+		the current catalog, in the dimensions of data_manager
+		"""
+		if self.manifest["catalog_fingerprint"] != catalog.snapshot().fingerprint:
+			raise StaleSnapshotError(
+				"the snapshot in %s was encoded with another catalog" %
+				self.directory
+			)
+		if (self.manifest["input_dimension"], self.manifest["output_dimension"]) \
+			!= (data_manager.input_dimension(), data_manager.output_dimension()):
+			raise StaleSnapshotError(
+				"the snapshot in %s does not match the data manager's "
+				"dimensions" % self.directory
+			)
+
+	@staticmethod
+	def _array_files(manifest: Dict[str, Any]) -> List[str]:
+		return [
+			manifest[name]
+			for name in ("data", "labels", "data_indices", "data_indptr")
+			if name in manifest
+		]
+
+	@staticmethod
+	def _read_manifest(directory: str) -> Dict[str, Any] or None:
+		try:
+			with open(os.path.join(directory, MANIFEST)) as manifest_file:
+				return json.load(manifest_file)
+		except FileNotFoundError:
+			return None
+
+
+if __name__ == "__main__":
+	training_data = TrainingData(DataManager())
+	training_data.refresh()
+	TrainingSnapshot.write(sys.argv[1], training_data, "--sparse" in sys.argv[2:])
+	print(
+		"wrote %d responses up to rid %d to %s" %
+		(training_data.size, training_data.rid_watermark, sys.argv[1])
+	)
@@ -0,0 +1,35 @@
+import unittest
+from typing import Sequence
+import app.db.database as database
+from app.db.sql import SQLiteEngine
+from app.classifier.custom_types import SQuestionType, SQuestionAnswerType, QID
+
+
+def store_question(question: str, vectors: Sequence[str] = ("1,0", "0,1")) -> QID:
+	"""
+	stores a multiple choice quiz question with one answer per vector
+	:return: the qid of the question
+	"""
+	qid, _, _ = database.store_question(
+		question,
+		SQuestionType.type.quiz,
+		SQuestionAnswerType.type.multiple_choice,
+		[("choice %d" % index, vector) for index, vector in enumerate(vectors)],
+	)
+	return qid
+
+
+class SQLiteTestCase(unittest.TestCase):
+	"""
+	runs each test against a new in-memory sqlite database, which needs no
+	server. subclasses that override setUp or tearDown call them first.
+	"""
+
+	def setUp(self):
+		self.engine = database.engine
+		database.engine = SQLiteEngine()
+		database.initialize_database()
+
+	def tearDown(self):
+		database.engine.pool.close()
+		database.engine = self.engine
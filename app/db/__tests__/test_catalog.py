@@ -0,0 +1,44 @@
+import unittest
+import app.db.catalog as catalog
+import app.db.database as database
+from app.db.mit_courses import mit_courses
+from app.classifier.course_manager import CourseManager
+from app.classifier.question_answer_manager import QuestionAnswerManager
+from app.db.__tests__.sqlite_test_case import SQLiteTestCase, store_question
+
+
+class TestCatalog(SQLiteTestCase):
+
+	def test_snapshot_is_shared_until_a_question_is_stored(self):
+		store_question("do you like labs?")
+		first = catalog.snapshot()
+		self.assertIs(catalog.snapshot(), first)
+		self.assertEqual(len(first.questions), 1)
+		self.assertEqual(len(first.courses), len(mit_courses))
+
+		store_question("do you like psets?")
+		second = catalog.snapshot()
+		self.assertGreater(second.version, first.version)
+		self.assertEqual(len(second.questions), 2)
+		self.assertNotEqual(second.fingerprint, first.fingerprint)
+
+	def test_warm_initialization_keeps_the_snapshot(self):
+		store_question("do you like labs?")
+		first = catalog.snapshot()
+		self.assertFalse(database.initialize_database())
+		self.assertIs(catalog.snapshot(), first)
+
+	def test_managers_read_from_the_snapshot(self):
+		store_question("do you like labs?")
+		snapshot = catalog.snapshot()
+		qam, cm = QuestionAnswerManager(), CourseManager()
+		self.assertEqual(qam.catalog_version, snapshot.version)
+		self.assertEqual(qam.input_dimension, 2)
+		self.assertEqual(cm.course_count, len(snapshot.courses))
+		cid, cn, _ = snapshot.courses[3]
+		self.assertEqual(cm.get_course_index(cn), 3)
+		self.assertEqual(cm.get_cid(cn), cid)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -1,33 +1,34 @@
 import config
 import unittest
 import mysql.connector
-from typing import Callable
+from typing import Callable, List, Tuple
 from app.db.sql_constants import TBL, TBLCol
 from app.classifier.custom_types import SQuestionType, SQuestionAnswerType
 import app.db.database as database
+from app.db.sql import MySQLEngine
 from app.db.mit_courses import mit_courses
 from app.utils.db_utils import convert_int_list_to_vector_text, quote
 
 
 def setup():
-	_cnx = mysql.connector.connect(
-		host=config.SQL_HOST,
-		user=config.SQL_USER,
-		password=config.SQL_PASSWORD,
-		database=config.SQL_TEST_DATABASE,
-	)
-	_cursor = _cnx.cursor()
-
-	def sql_test_commit(method):
-		def wrapper(*args, **kwargs):
-			out = method(*args, **kwargs)
-			_cnx.commit()
-			return out
+	engine = MySQLEngine({
+		"host": config.SQL_HOST,
+		"user": config.SQL_USER,
+		"password": config.SQL_PASSWORD,
+		"database": config.SQL_TEST_DATABASE,
+	}, pool_size=1)
+	engine.connect().close()
+	database.engine = engine
 
-		return wrapper
 
-	database._commit = sql_test_commit
-	database.cursor = _cursor
+def execute(query: str) -> List[Tuple]:
+	""" run a query on the test database, commit and return its rows """
+	with database.engine.pool.connection() as cnx:
+		cursor = database.engine.pool.cursor()
+		cursor.execute(query)
+		rows = cursor.fetchall() if cursor.with_rows else []
+		cnx.commit()
+		return rows
 
 
 def commit(method: Callable, db_cnx) -> Callable:
@@ -57,6 +58,8 @@ class TestDatabase(unittest.TestCase):
 		TBL.AnswerChoices,
 		TBL.Questions,
 		TBL.Courses,
+		TBL.SchemaMigrations,
+		TBL.DatabaseState,
 	)
 
 	def setUp(self):
@@ -72,8 +75,7 @@ class TestDatabase(unittest.TestCase):
 	@staticmethod
 	def drop_all_tables():
 		for table in TestDatabase.TABLES:
-			database.cursor.execute("DROP TABLE IF EXISTS %s" % table)
-			database.cnx.commit()
+			execute("DROP TABLE IF EXISTS %s" % table)
 
 		tables = TestDatabase.get_tables()
 		print('[TestDatabaseLog:tables-after-drop]', tables)
@@ -82,11 +84,11 @@ class TestDatabase(unittest.TestCase):
 
 	@staticmethod
 	def get_tables():
-		database.cursor.execute("SHOW TABLES")
-		return [row[0].lower() for row in database.cursor.fetchall()]
+		return [row[0].lower() for row in execute("SHOW TABLES")]
 
 	def tearDown(self):
 		TestDatabase.drop_all_tables()
+		database.engine.pool.close()
 
 	# tests
 
@@ -103,9 +105,9 @@ class TestDatabase(unittest.TestCase):
 				"table %s is missing from tables" % table
 			)
 		# check that courses are saved in the database
-		database.cursor.execute("SELECT COUNT(*) FROM %s" % TBL.Courses)
+		rows = execute("SELECT COUNT(*) FROM %s" % TBL.Courses)
 		try:
-			count = database.cursor.fetchall()[0][0]
+			count = rows[0][0]
 		except IndexError:
 			self.fail("fetching counts returned no rows")
 		self.assertTrue(
@@ -149,27 +151,24 @@ class TestDatabase(unittest.TestCase):
 			quote(SQuestionType.type.quiz),
 			quote(SQuestionAnswerType.type.multiple_choice),
 		)
-		database.cursor.execute(
+		execute(
 			"INSERT INTO %s (%s, %s, %s) VALUES ('Coffee', %s, %s)" % query_data
 		)
-		database.cnx.commit()
-		database.cursor.execute("""
+		execute("""
 			INSERT INTO %s (%s, %s, %s) VALUES (1, 'Yo', '1,4')
 		""" % (TBL.AnswerChoices, TBLCol.question_id, TBLCol.choice, TBLCol.vector))
-		database.cnx.commit()
 		# initialize again
 		database.initialize_database()
 		# check that data was not removed
-		database.cursor.execute("SELECT %s FROM %s" % (TBLCol.question, TBL.Questions))
-		question = database.cursor.fetchall()[0][0]
+		rows = execute("SELECT %s FROM %s" % (TBLCol.question, TBL.Questions))
+		question = rows[0][0]
 		self.assertTrue(
 			question == "Coffee", "question 'Coffee' was not found in db"
 		)
 		answer_choice_query_data = (
 			TBLCol.question_id, TBLCol.choice, TBLCol.vector, TBL.AnswerChoices
 		)
-		database.cursor.execute("SELECT %s, %s, %s FROM %s" % answer_choice_query_data)
-		row = database.cursor.fetchall()[0]
+		row = execute("SELECT %s, %s, %s FROM %s" % answer_choice_query_data)[0]
 		self.assertTrue(
 			row == (1, "Yo", "1,4"),
 			"answer choice %s was not found in db" % str((1, "Yo", "1,4"))
@@ -187,8 +186,8 @@ class TestDatabase(unittest.TestCase):
 			print(exception)
 			self.fail("initialization raised an error")
 		try:
-			database.cursor.execute("SELECT COUNT(*) FROM %s" % TBL.Courses)
-			course_count_before = database.cursor.fetchall()[0][0]
+			course_count_before = \
+				execute("SELECT COUNT(*) FROM %s" % TBL.Courses)[0][0]
 		except Exception as exception:
 			print(exception)
 			self.fail("wasn't able to fetch the course count")
@@ -198,8 +197,8 @@ class TestDatabase(unittest.TestCase):
 			print(exception)
 			self.fail("initialization raised an error the second time")
 		try:
-			database.cursor.execute("SELECT COUNT(*) FROM %s" % TBL.Courses)
-			course_count_after = database.cursor.fetchall()[0][0]
+			course_count_after = \
+				execute("SELECT COUNT(*) FROM %s" % TBL.Courses)[0][0]
 		except Exception as exception:
 			print(exception)
 			self.fail("wasn't able to fetch the course count after")
@@ -222,8 +221,8 @@ class TestDatabase(unittest.TestCase):
 			print(exception)
 			self.fail("initialization raised an error")
 		try:
-			database.cursor.execute("SELECT COUNT(*) FROM %s" % TBL.Courses)
-			course_count_before = database.cursor.fetchall()[0][0]
+			course_count_before = \
+				execute("SELECT COUNT(*) FROM %s" % TBL.Courses)[0][0]
 		except Exception as exception:
 			print(exception)
 			self.fail("wasn't able to fetch the course count")
@@ -236,8 +235,8 @@ class TestDatabase(unittest.TestCase):
 			print(exception)
 			self.fail("initialization raised an error the second time")
 		try:
-			database.cursor.execute("SELECT COUNT(*) FROM %s" % TBL.Courses)
-			course_count_after = database.cursor.fetchall()[0][0]
+			course_count_after = \
+				execute("SELECT COUNT(*) FROM %s" % TBL.Courses)[0][0]
 		except Exception as exception:
 			print(exception)
 			self.fail("wasn't able to fetch the course count after")
@@ -249,6 +248,28 @@ class TestDatabase(unittest.TestCase):
 		)
 		mit_courses_.mit_courses = mit_courses_.mit_courses[:-2]
 
+	def test_initialize_db_creates_indexes_once(self):
+		from app.db.db_initializer import INDEXES
+		TestDatabase.drop_all_tables()
+		try:
+			database.initialize_database()
+			database.initialize_database()
+		except Exception as exception:
+			print(exception)
+			self.fail("initialization raised an error")
+		indexes = set(
+			(table.lower(), index.lower()) for table, index in execute("""
+				SELECT DISTINCT TABLE_NAME, INDEX_NAME
+				FROM information_schema.STATISTICS
+				WHERE TABLE_SCHEMA = DATABASE()
+			""")
+		)
+		for table, index, _ in INDEXES:
+			self.assertTrue(
+				(table.lower(), index.lower()) in indexes,
+				"index %s is missing from table %s" % (index, table)
+			)
+
 	def test_load_courses(self):
 		TestDatabase.drop_all_tables()
 		try:
@@ -0,0 +1,91 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import app.db.database as database
+from app.db.instrumentation import instrumentation, QueryStats
+from app.db.__tests__.sqlite_test_case import SQLiteTestCase, store_question
+
+
+class TestInstrumentation(SQLiteTestCase):
+
+	def setUp(self):
+		super().setUp()
+		self.directory = tempfile.mkdtemp()
+		self.settings = (
+			instrumentation.slow_query_threshold,
+			instrumentation.slow_query_log,
+		)
+		instrumentation.reset()
+
+	def tearDown(self):
+		instrumentation.disable()
+		instrumentation.close()
+		instrumentation.slow_query_threshold, instrumentation.slow_query_log = \
+			self.settings
+		instrumentation.reset()
+		shutil.rmtree(self.directory)
+		super().tearDown()
+
+	def test_nothing_is_recorded_when_disabled(self):
+		database.load_courses()
+		self.assertEqual(database.query_stats(), [])
+
+	def test_statements_are_recorded_with_rows_and_callers(self):
+		slow_query_log = os.path.join(self.directory, "slow.log")
+		instrumentation.slow_query_threshold = 0.
+		instrumentation.slow_query_log = slow_query_log
+		course_count = len(database.load_courses())
+		instrumentation.enable()
+		database.load_courses()
+		database.load_courses()
+		store_question("do you like labs?")
+		stats = database.query_stats()
+		by_caller = {}
+		for entry in stats:
+			for caller, count in entry["callers"].items():
+				by_caller[caller] = by_caller.get(caller, []) + [entry]
+		load_courses, = by_caller["load_courses"]
+		self.assertEqual(load_courses["count"], 2)
+		self.assertEqual(load_courses["rows"], 2 * course_count)
+		self.assertEqual(
+			sorted(entry["rows"] for entry in by_caller["store_question"]),
+			[1, 2],
+		)
+		self.assertIn("get_unique_field", by_caller)
+		with open(slow_query_log) as log:
+			entries = [json.loads(line) for line in log]
+		# every statement is slower than a threshold of 0
+		self.assertEqual(len(entries), sum(entry["count"] for entry in stats))
+
+	def test_streams_and_lists_of_markers(self):
+		qid = store_question("do you like labs?")
+		yes, no = [aid for aid, _, _ in database.load_questions()[0][2]]
+		rids = database.store_responses([({qid: yes}, "6"), ({qid: no}, "18")])
+		instrumentation.enable()
+		self.assertEqual(len(list(database.stream_labelled_responses(chunk_size=1))), 2)
+		database.load_responses(rids[:1])
+		database.load_responses(rids)
+		by_caller = {}
+		for entry in database.query_stats():
+			for caller in entry["callers"]:
+				by_caller.setdefault(caller, []).append(entry)
+		stream, = by_caller["stream_labelled_responses"]
+		self.assertEqual(stream["rows"], 2)
+		# one entry, whatever the number of rids
+		load_responses, = by_caller["load_responses"]
+		self.assertEqual(load_responses["count"], 2)
+		self.assertIn("IN (…)", load_responses["statement"])
+
+	def test_percentiles(self):
+		stats = QueryStats("SELECT 1")
+		for duration in [0.001] * 98 + [0.5, 2.]:
+			stats.record(duration, 1, "caller")
+		self.assertLessEqual(stats.percentile(0.5), 0.0016)
+		self.assertGreaterEqual(stats.percentile(0.99), 0.5)
+		self.assertEqual(stats.percentile(1.), 2.)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,94 @@
+import io
+import runpy
+import unittest
+import unittest.mock
+import warnings
+import contextlib
+import numpy as np
+import app.db.catalog as catalog
+import app.db.database as database
+import app.db.packed_answers as packed_answers
+from app.classifier.data_manager import DataManager
+from app.db.__tests__.sqlite_test_case import SQLiteTestCase, store_question
+
+
+class TestPackedAnswers(SQLiteTestCase):
+
+	def setUp(self):
+		super().setUp()
+		store_question("first", ["1,0", "0,1"])
+		store_question("second", ["1,0,0", "0,1,0", "0,0,1"])
+		self.questions = [
+			(qid, [aid for aid, _, _ in answers])
+			for qid, _, answers in catalog.snapshot().questions
+		]
+
+	def test_pack_and_unpack(self):
+		(q1, a1), (q2, a2) = self.questions
+		snapshot = catalog.snapshot()
+		self.assertEqual(packed_answers.pack(snapshot, {q1: a1[1], q2: a2[2]}), b"\2\3")
+		self.assertEqual(packed_answers.pack(snapshot, {q2: a2[0]}), b"\0\1")
+		self.assertIsNone(packed_answers.pack(snapshot, {q1: a2[0]}))
+		indices = packed_answers.unpack([b"\2\3", b"\1"], 2)
+		self.assertEqual(indices.tolist(), [[2, 3], [1, 0]])
+
+	def test_backfill_and_packed_training_data(self):
+		(q1, a1), (q2, a2) = self.questions
+		# stored without packed answers, as before the column existed
+		database.store_responses([
+			({q1: a1[0], q2: a2[1]}, "6"),
+			({q1: a1[1]}, "18"),
+			({q2: a2[2]}, None),
+		])
+		self.assertEqual(packed_answers.backfill(chunk_size=2), 3)
+		self.assertEqual(database.load_unpacked_responses(), [])
+		dm = DataManager()
+		dm.store_responses([({q1: a1[1], q2: a2[0]}, "8")])
+
+		data, labels = dm.load_packed_training_data()
+		expected_data, expected_labels = dm.encode_responses(
+			database.load_labelled_responses_since()[0]
+		)
+		np.testing.assert_array_equal(data, expected_data)
+		np.testing.assert_array_equal(labels, expected_labels)
+		data, labels = dm.load_training_data()
+		np.testing.assert_array_equal(data, expected_data)
+		np.testing.assert_array_equal(labels, expected_labels)
+		_, label_indices = dm.load_packed_training_data(sparse_labels=True)
+		self.assertEqual(label_indices.tolist(), expected_labels.argmax(axis=1).tolist())
+
+	def test_packed_training_data_packs_in_bulk(self):
+		(q1, a1), (q2, a2) = self.questions
+		database.store_responses([
+			({q1: a1[0], q2: a2[1]}, "6"),
+			({q1: a1[1]}, "18"),
+			# answers a question that is not in the catalog: it cannot be packed
+			({q1: a1[1], q2 + 100: a2[0]}, "8"),
+		])
+		dm = DataManager()
+		expected_data, expected_labels = dm.encode_responses(
+			database.load_labelled_responses_since()[0]
+		)
+		# the unpacked responses are loaded together, not one per query
+		with unittest.mock.patch.object(database, "load_response", side_effect=AssertionError):
+			data, labels = dm.load_packed_training_data()
+		np.testing.assert_array_equal(data, expected_data)
+		np.testing.assert_array_equal(labels, expected_labels)
+		# and stored packed, but for the one that cannot be
+		self.assertEqual(len(database.load_unpacked_responses()), 1)
+		data, _ = dm.load_packed_training_data()
+		np.testing.assert_array_equal(data, expected_data)
+
+	def test_backfill_command_line(self):
+		(q1, a1), _ = self.questions
+		database.store_responses([({q1: a1[0]}, "6")])
+		output = io.StringIO()
+		with contextlib.redirect_stdout(output), warnings.catch_warnings():
+			# runpy warns that the module was already imported by this test
+			warnings.simplefilter("ignore", RuntimeWarning)
+			runpy.run_module("app.db.packed_answers", run_name="__main__")
+		self.assertEqual(output.getvalue(), "packed the answers of 1 responses\n")
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,107 @@
+import threading
+import unittest
+from app.db.sql import ConnectionPool, PoolTimeoutError, StorageEngine
+
+
+class FakeCursor:
+	def close(self):
+		pass
+
+
+class FakeConnection:
+	def __init__(self):
+		self.connected = True
+		self.rollbacks = 0
+
+	def cursor(self):
+		return FakeCursor()
+
+	def rollback(self):
+		self.rollbacks += 1
+
+	def is_connected(self):
+		return self.connected
+
+	def reconnect(self, attempts=1, delay=0):
+		self.connected = True
+
+	def close(self):
+		self.connected = False
+
+
+class FakeEngine(StorageEngine):
+	def connect(self):
+		return FakeConnection()
+
+	def is_alive(self, cnx):
+		return cnx.is_connected()
+
+	def reconnect(self, cnx):
+		cnx.reconnect()
+
+
+class TestConnectionPool(unittest.TestCase):
+
+	def test_checkout_is_reentrant_within_a_thread(self):
+		pool = ConnectionPool(FakeEngine(), size=1, timeout=0.1)
+		with pool.connection() as outer:
+			with pool.connection() as inner:
+				self.assertIs(outer, inner)
+		self.assertEqual(pool.metrics()["checkouts"], 1)
+
+	def test_connections_are_reused_and_rolled_back(self):
+		pool = ConnectionPool(FakeEngine(), size=2, timeout=0.1)
+		with pool.connection() as first:
+			pass
+		with pool.connection() as second:
+			pass
+		self.assertIs(first, second)
+		self.assertEqual(first.rollbacks, 2)
+		self.assertEqual(pool.metrics()["opened"], 1)
+
+	def test_pool_is_bounded(self):
+		pool = ConnectionPool(FakeEngine(), size=1, timeout=0.05)
+		checked_out, release = threading.Event(), threading.Event()
+
+		def hold_connection():
+			with pool.connection():
+				checked_out.set()
+				release.wait()
+
+		thread = threading.Thread(target=hold_connection)
+		thread.start()
+		checked_out.wait()
+		try:
+			with pool.connection():
+				self.fail("the pool should not hand out a second connection")
+		except PoolTimeoutError:
+			pass
+		release.set()
+		thread.join()
+		self.assertEqual(pool.metrics()["timeouts"], 1)
+		self.assertEqual(pool.metrics()["in_use"], 0)
+
+	def test_dedicated_connection_fails_fast_in_a_pool_of_one(self):
+		pool = ConnectionPool(FakeEngine(), size=1, timeout=5)
+		with pool.connection():
+			with self.assertRaises(PoolTimeoutError):
+				with pool.dedicated_connection():
+					pass
+		with pool.dedicated_connection():
+			self.assertEqual(pool.metrics()["in_use"], 1)
+		self.assertEqual(pool.metrics()["timeouts"], 0)
+
+	def test_dead_connection_is_reconnected(self):
+		pool = ConnectionPool(
+			FakeEngine(), size=1, timeout=0.1, health_check_interval=0
+		)
+		with pool.connection() as cnx:
+			pass
+		cnx.connected = False
+		with pool.connection() as cnx_again:
+			self.assertTrue(cnx_again.is_connected())
+		self.assertEqual(pool.metrics()["reconnects"], 1)
+
+
+if __name__ == "__main__":
+	unittest.main()
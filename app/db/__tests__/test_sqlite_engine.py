@@ -0,0 +1,175 @@
+import io
+import unittest
+import contextlib
+import numpy as np
+import app.db.database as database
+import app.db.diagnostics as diagnostics
+import app.db.db_initializer as db_initializer
+from app.db.mit_courses import mit_courses
+from app.classifier.custom_types import RID, AID
+from app.db.__tests__.sqlite_test_case import SQLiteTestCase, store_question
+
+
+class TestSQLiteEngine(SQLiteTestCase):
+	"""
+	runs the public functions of database.py against an in-memory sqlite
+	database, which needs no server.
+	"""
+
+	def test_initialize_database_is_idempotent(self):
+		self.assertFalse(database.initialize_database())
+		self.assertEqual(len(database.load_courses()), len(mit_courses))
+
+	def test_initialize_database_records_migrations_and_courses(self):
+		with database.engine.pool.connection():
+			cursor = database.engine.pool.cursor()
+			cursor.execute("SELECT version FROM SchemaMigrations ORDER BY version")
+			versions = [version for version, in cursor.fetchall()]
+		self.assertEqual(
+			versions, [version for version, _, _ in db_initializer.MIGRATIONS]
+		)
+		mit_courses.append(("99", "Undergraduate Basket Weaving"))
+		try:
+			self.assertTrue(database.initialize_database())
+			self.assertEqual(len(database.load_courses()), len(mit_courses))
+		finally:
+			mit_courses.pop()
+
+	def test_response_salts_are_made_unique(self):
+		engine = database.engine
+		with engine.pool.connection() as cnx:
+			cursor = engine.pool.cursor()
+			# the schema before the migration, with a salt stored twice
+			engine.drop_index(cursor, "Responses", db_initializer.UNIQUE_SALT_INDEX)
+			cursor.execute("CREATE INDEX idx_responses_salt ON Responses (salt)")
+			cursor.executemany(
+				"INSERT INTO Responses (cn, salt) VALUES (%s, %s)",
+				[("6", "repeated"), ("18", "repeated"), (None, None), (None, None)],
+			)
+			db_initializer.MIGRATIONS[-1][2](cursor, engine)
+			cursor.execute("SELECT salt FROM Responses WHERE salt IS NOT NULL ORDER BY rid")
+			salts = [salt for salt, in cursor.fetchall()]
+			self.assertEqual(salts[0], "repeated")
+			self.assertNotEqual(salts[1], "repeated")
+			indexes = engine.existing_indexes(cursor)
+			self.assertIn(("responses", db_initializer.UNIQUE_SALT_INDEX), indexes)
+			self.assertNotIn(("responses", "idx_responses_salt"), indexes)
+			with self.assertRaises(engine.IntegrityError):
+				cursor.execute(
+					"INSERT INTO Responses (cn, salt) VALUES (%s, %s)", ("8", "repeated")
+				)
+			cnx.commit()
+
+	def test_store_and_load_questions(self):
+		qid = store_question("are you a morning person?")
+		questions = database.load_questions()
+		self.assertEqual(len(questions), 1)
+		loaded_qid, question, answers = questions[0]
+		self.assertEqual(loaded_qid, qid)
+		self.assertEqual(question, "are you a morning person?")
+		self.assertEqual([vector for _, _, vector in answers], [[1, 0], [0, 1]])
+		with self.assertRaises(ValueError):
+			store_question("are you a morning person?")
+
+	def test_store_and_label_responses(self):
+		qid = store_question("do you like proofs?")
+		yes, no = [aid for aid, _, _ in database.load_questions()[0][2]]
+		rid = database.store_response({qid: yes})
+		rids = database.store_responses([({qid: no}, "6"), ({qid: yes}, "18")])
+		self.assertEqual(database.load_response(rid), {qid: yes})
+		self.assertEqual(database.load_response(rids[0]), {qid: no})
+		self.assertEqual(
+			database.load_responses([rids[1], rid, 999]),
+			{rid: {qid: yes}, rids[1]: {qid: yes}},
+		)
+
+		responses, label_watermark, committed_rid = \
+			database.load_labelled_responses_since()
+		self.assertEqual(committed_rid, max(rids))
+		self.assertEqual(
+			[(r, cn) for r, cn, _ in responses],
+			[(rids[0], "6"), (rids[1], "18")],
+		)
+		database.label_response(rid, "8")
+		database.label_response(rids[0], None)
+		responses, _, _ = database.load_labelled_responses_since(
+			max(rids), label_watermark,
+		)
+		# rids[1] is unchanged, but within the safety window below max(rids)
+		self.assertEqual(
+			[(r, cn) for r, cn, _ in responses],
+			[(rid, "8"), (rids[0], None), (rids[1], "18")],
+		)
+		# every rid below max(rids) committed, so none is read again
+		responses, _, _ = database.load_labelled_responses_since(
+			max(rids), label_watermark, committed_rid,
+		)
+		self.assertEqual([(r, cn) for r, cn, _ in responses], [(rid, "8"), (rids[0], None)])
+		chunks = list(database.stream_labelled_responses(chunk_size=1))
+		self.assertEqual([len(chunk) for chunk in chunks], [1, 1])
+
+	def test_stream_within_a_checked_out_connection(self):
+		qid = store_question("do you like labs?")
+		aid = database.load_questions()[0][2][0][0]
+		database.store_responses([({qid: aid}, "6"), ({qid: aid}, "18")])
+		# the in-memory pool has a single connection, which this thread holds
+		with database.engine.pool.connection():
+			chunks = database.stream_labelled_responses(chunk_size=1)
+			self.assertEqual(len(next(chunks)), 1)
+			self.assertEqual(len(database.load_questions()), 1)
+			chunks.close()
+		self.assertEqual(database.engine.pool.metrics()["in_use"], 0)
+		self.assertEqual(len(list(database.stream_labelled_responses(chunk_size=1))), 2)
+
+	def test_raw_and_typed_loaders(self):
+		qid = store_question("do you like proofs?")
+		yes, no = [aid for aid, _, _ in database.load_questions()[0][2]]
+		rids = database.store_responses([({qid: no}, "6"), ({qid: yes}, "6")])
+		typed = database.load_labelled_responses()
+		raw = database.load_labelled_responses(raw=True)
+		self.assertEqual(typed, raw)
+		self.assertEqual(raw, {(rids[0], "6"): {qid: no}, (rids[1], "6"): {qid: yes}})
+		for (rid, cn), answers in raw.items():
+			self.assertIs(type(rid), int)
+			self.assertEqual([type(value) for value in answers.popitem()], [int, int])
+		# ids are typed, and the ids of the catalog share one instance
+		(first, first_cn), (second, second_cn) = sorted(typed)
+		self.assertIsInstance(first, RID)
+		self.assertIs(first_cn, second_cn)
+		self.assertIs(
+			next(iter(typed[(first, first_cn)])), next(iter(typed[(second, second_cn)]))
+		)
+		self.assertIsInstance(database.load_response(rids[0])[qid], AID)
+		self.assertIs(type(database.load_response(rids[0], raw=True)[qid]), int)
+		self.assertIs(type(next(iter(database.load_responses(rids, raw=True)))), int)
+
+		rid_array, cns, qids, aids = database.load_labelled_answer_arrays()
+		self.assertEqual(sorted(rid_array.tolist()), rids)
+		self.assertEqual(rid_array.dtype, np.int64)
+		self.assertEqual(cns.tolist(), ["6", "6"])
+		self.assertEqual(qids.tolist(), [qid, qid])
+		self.assertEqual(sorted(aids.tolist()), sorted([yes, no]))
+
+	def test_explain_queries_uses_indexes(self):
+		plans = database.explain_queries()
+		for name in plans:
+			if name in diagnostics.FULL_READS:
+				continue
+			self.assertFalse(
+				any(database.engine.is_scan(row) for row in plans[name]), name
+			)
+		self.assertIn(
+			"USING COVERING INDEX idx_responses_cn_rid",
+			plans["load_labelled_responses"][0]["detail"],
+		)
+
+	def test_diagnostics_report(self):
+		output = io.StringIO()
+		with contextlib.redirect_stdout(output):
+			self.assertTrue(diagnostics.report())
+		for name in database.explain_queries():
+			self.assertIn(name, output.getvalue())
+
+
+if __name__ == "__main__":
+	unittest.main()
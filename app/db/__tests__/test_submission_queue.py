@@ -0,0 +1,164 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from app.db.submission_queue import SubmissionQueue
+
+
+class FakeStore:
+	def __init__(self):
+		self.batches = []
+		self.fail = False
+		self.bad_cn = None
+
+	def __call__(self, batch):
+		if self.fail:
+			raise ConnectionError("the database is down")
+		if self.bad_cn is not None and any(cn == self.bad_cn for _, cn in batch):
+			raise ValueError("unknown course")
+		self.batches.append(batch)
+		return list(range(len(batch)))
+
+
+class TestSubmissionQueue(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.journal = os.path.join(self.directory, "submissions.journal")
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def test_flush_stores_in_batches_and_empties_the_journal(self):
+		store = FakeStore()
+		queue = SubmissionQueue(self.journal, store=store, batch_size=2)
+		for aid in range(3):
+			queue.submit({1: aid}, "6")
+		self.assertEqual(queue.flush(), 2)
+		self.assertEqual(queue.flush(), 1)
+		self.assertEqual(store.batches, [
+			[({1: 0}, "6"), ({1: 1}, "6")],
+			[({1: 2}, "6")],
+		])
+		self.assertEqual(os.path.getsize(queue.journal_file), 0)
+		self.assertEqual(queue.metrics()["flushed"], 3)
+		queue.close()
+		self.assertEqual(os.listdir(self.directory), [])
+
+	def test_unstored_submissions_are_replayed(self):
+		store = FakeStore()
+		queue = SubmissionQueue(self.journal, store=store, batch_size=1)
+		queue.submit({1: 10})
+		queue.submit({1: 20}, "18")
+		queue.flush()
+		# the process dies without flushing the second submission, in the
+		# middle of journaling a third one
+		queue._journal.write('{"seq": 3, "answ')
+		queue._journal.flush()
+		# which releases its lock on the journal
+		queue._journal.close()
+
+		restarted = SubmissionQueue(self.journal, store=store)
+		self.assertEqual(restarted.metrics()["replayed"], 1)
+		restarted.submit({1: 30})
+		restarted.close()
+		self.assertEqual(store.batches[1:], [[({1: 20}, "18"), ({1: 30}, None)]])
+
+	def test_queues_sharing_a_journal_path(self):
+		store = FakeStore()
+		first = SubmissionQueue(self.journal, store=store)
+		second = SubmissionQueue(self.journal, store=store)
+		first.submit({1: 10})
+		second.submit({1: 20})
+		second.submit({1: 30})
+		# draining the first queue leaves the journal of the second as is
+		self.assertEqual(first.flush(), 1)
+		# a queue does not adopt the journal of a live queue
+		third = SubmissionQueue(self.journal, store=store)
+		self.assertEqual(third.metrics()["replayed"], 0)
+		third.close()
+		# both processes die, the second one after storing a response
+		first.submit({1: 40})
+		self.assertEqual(second.flush(), 2)
+		second.submit({1: 50})
+		first._journal.close()
+		second._journal.close()
+
+		restarted = SubmissionQueue(self.journal, store=store)
+		self.assertEqual(restarted.metrics()["replayed"], 2)
+		restarted.close()
+		self.assertCountEqual(store.batches[-1], [({1: 40}, None), ({1: 50}, None)])
+		self.assertEqual(os.listdir(self.directory), [])
+
+	def test_failed_flush_keeps_the_batch_queued(self):
+		store = FakeStore()
+		queue = SubmissionQueue(self.journal, store=store)
+		queue.submit({1: 10})
+		store.fail = True
+		with self.assertRaises(ConnectionError):
+			queue.flush()
+		self.assertEqual(queue.depth(), 1)
+		store.fail = False
+		self.assertEqual(queue.flush(), 1)
+		self.assertEqual(queue.metrics()["failed_flushes"], 1)
+		queue.close()
+
+	def test_responses_that_keep_failing_are_dead_lettered(self):
+		store = FakeStore()
+		store.bad_cn = "bad"
+		queue = SubmissionQueue(self.journal, store=store, max_attempts=2)
+		queue.submit({1: 10})
+		queue.submit({1: 20}, "bad")
+		queue.submit({1: 30})
+		with self.assertRaises(ValueError):
+			queue.flush()
+		# the responses of the failed batch are retried one at a time
+		self.assertEqual(queue.flush(), 1)
+		with self.assertRaises(ValueError):
+			queue.flush()
+		self.assertEqual(queue.metrics()["dead_lettered"], 0)
+		with self.assertRaises(ValueError):
+			queue.flush()
+		self.assertEqual(queue.metrics()["dead_lettered"], 1)
+		self.assertEqual(queue.flush(), 1)
+		self.assertEqual(store.batches, [[({1: 10}, None)], [({1: 30}, None)]])
+		with open(queue.dead_letter_path) as dead_letters:
+			entries = [json.loads(line) for line in dead_letters]
+		self.assertEqual([(entry["answers"], entry["cn"]) for entry in entries], [
+			([[1, 20]], "bad"),
+		])
+		queue.close()
+
+	def test_nothing_is_dropped_while_the_database_is_down(self):
+		store = FakeStore()
+		queue = SubmissionQueue(self.journal, store=store, batch_size=2, max_attempts=2)
+		for aid in range(3):
+			queue.submit({1: aid})
+		store.fail = True
+		for attempt in range(5):
+			with self.assertRaises(ConnectionError):
+				queue.flush()
+		self.assertEqual(queue.depth(), 3)
+		store.fail = False
+		self.assertEqual(queue.flush(), 2)
+		self.assertEqual(queue.flush(), 1)
+		self.assertEqual(store.batches, [
+			[({1: 0}, None), ({1: 1}, None)],
+			[({1: 2}, None)],
+		])
+		self.assertEqual(queue.metrics()["dead_lettered"], 0)
+		self.assertFalse(os.path.exists(queue.dead_letter_path))
+		queue.close()
+
+	def test_background_thread_flushes(self):
+		store = FakeStore()
+		queue = SubmissionQueue(self.journal, store=store, flush_interval=0.01)
+		queue.start()
+		queue.submit({1: 10})
+		queue.close()
+		self.assertEqual(store.batches, [[({1: 10}, None)]])
+
+
+if __name__ == "__main__":
+	unittest.main()
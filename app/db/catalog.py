@@ -0,0 +1,113 @@
+"""
+a process-wide snapshot of the catalog: the questions with their answer
+choices and vectors, and the courses. these almost never change, so they
+are loaded once and shared by every DataManager and view instead of being
+queried again each time.
+
+the snapshot is reloaded only after this process writes to the questions
+or the courses (database.store_question, and database.initialize_database
+when it changed the database, bump database.catalog_version). writes made
+by other processes are picked up with reload().
+"""
+import hashlib
+import threading
+from types import MappingProxyType
+from typing import Tuple, Mapping
+from app.classifier.custom_types import (
+	SQuestion,
+	SChoice,
+	SCourseNumber,
+	SCourse,
+	QID,
+	AID,
+	CID,
+)
+import app.db.database as database
+
+
+class Catalog:
+	"""
+	an immutable snapshot of the catalog. questions and courses are sorted
+	by id, and the index maps give the position of each id in that order
+	(which is also the order of the questions in a response vector and of
+	the courses in a prediction).
+	"""
+
+	def __init__(
+		self,
+		version: int,
+		questions: Tuple[Tuple[QID, SQuestion, Tuple[Tuple[AID, SChoice, Tuple[int, ...]], ...]], ...],
+		courses: Tuple[Tuple[CID, SCourseNumber, SCourse], ...],
+	) -> None:
+		self.version = version
+		self.questions = questions
+		self.courses = courses
+		self.qid_to_index: Mapping[QID, int] = MappingProxyType({
+			qid: index for index, (qid, _, _) in enumerate(questions)
+		})
+		self.cid_to_index: Mapping[CID, int] = MappingProxyType({
+			cid: index for index, (cid, _, _) in enumerate(courses)
+		})
+		self.aid_to_qid: Mapping[AID, QID] = MappingProxyType({
+			aid: qid
+			for qid, _, answers in questions
+			for aid, _, _ in answers
+		})
+		# position of each answer among the answers of its question
+		self.aid_to_index: Mapping[AID, int] = MappingProxyType({
+			aid: index
+			for _, _, answers in questions
+			for index, (aid, _, _) in enumerate(answers)
+		})
+		self.cn_to_cid: Mapping[SCourseNumber, CID] = MappingProxyType({
+			cn: cid for cid, cn, _ in courses
+		})
+		# identifies the content of the catalog across processes and
+		# restarts, unlike version which only counts writes in this process
+		self.fingerprint = hashlib.sha1(
+			repr((questions, courses)).encode()
+		).hexdigest()
+
+	@staticmethod
+	def load(version: int) -> "Catalog":
+		questions = tuple(sorted(
+			(
+				QID(qid),
+				SQuestion(question),
+				tuple(sorted(
+					(AID(aid), SChoice(choice), tuple(vector))
+					for aid, choice, vector in answers
+				)),
+			)
+			for qid, question, answers in database.load_questions()
+		))
+		courses = tuple(sorted(
+			(CID(cid), SCourseNumber(cn), SCourse(course))
+			for cid, cn, course in database.load_courses()
+		))
+		return Catalog(version, questions, courses)
+
+
+_snapshot: Catalog = None
+_lock = threading.Lock()
+
+
+def snapshot() -> Catalog:
+	""" the current catalog, loaded if questions or courses changed """
+	global _snapshot
+	version = database.catalog_version()
+	current = _snapshot
+	if current is not None and current.version == version:
+		return current
+	with _lock:
+		if _snapshot is None or _snapshot.version != version:
+			_snapshot = Catalog.load(version)
+		return _snapshot
+
+
+def reload() -> Catalog:
+	""" drops the current snapshot, i.e. after another process wrote """
+	global _snapshot
+	with _lock:
+		_snapshot = None
+	return snapshot()
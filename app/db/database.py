@@ -1,12 +1,11 @@
+from __future__ import annotations
 from app.utils import generator_util
-from app.utils.db_utils import (
-	convert_to_query_values,
-	convert_vector_text_to_int_list,
-	quote,
-)
-from app.db.sql import cursor, cnx
+from app.utils.db_utils import convert_vector_text_to_int_list, placeholders
+from app.utils.memoize_util import Memoized
+from app.db.sql import engine
+from app.db.instrumentation import instrumentation, TimedCursor
 from app.db.sql_constants import TBL, TBLCol
-from typing import List, Callable, Tuple, Dict, Union
+from typing import TYPE_CHECKING, List, Callable, Tuple, Dict, Union, Any, Iterator
 from app.classifier.custom_types import (
 	SQuestionType,
 	SQuestionAnswerType,
@@ -21,29 +20,469 @@ from app.classifier.custom_types import (
 	RID,
 )
 import app.db.db_initializer as db_initializer
+from datetime import datetime, timedelta
+import threading
+import time
+import sys
+import numpy as np
+
+if TYPE_CHECKING:
+	# only for annotations, which are not evaluated: the driver is imported
+	# by the mysql engine when it connects
+	from mysql.connector.cursor import CursorBase
+
+# the columns of load_labelled_answer_arrays
+ANSWER_ARRAYS_DTYPE = np.dtype([
+	("rid", np.int64), ("cn", object), ("qid", np.int64), ("aid", np.int64),
+])
+# number of rows read from the server at a time when streaming results
+STREAM_FETCH_SIZE = 5000
+# number of responses written per statement by store_responses. keeps
+# each multi-row INSERT well under max_allowed_packet.
+BULK_INSERT_SIZE = 1000
+# earlier than any time_label_changed, i.e. "no label changed yet"
+LABEL_EPOCH = "1970-01-01 00:00:00"
+# how far below its watermarks load_labelled_responses_since reads again.
+# concurrent transactions commit out of order of rid and of NOW(6), so a
+# row can become visible below a watermark that was already returned. the
+# rid window covers a few bulk inserts in flight. it is only read again
+# down to the last rid below which every rid had committed, so it costs
+# nothing while no insert is in flight.
+RID_SAFETY_WINDOW = 2 * BULK_INSERT_SIZE
+LABEL_SAFETY_WINDOW = timedelta(seconds=60)
+
+
+def _connect(method: Callable) -> Callable:
+	"""
+	decorator: checks out a connection from the pool for the duration
+	of the method. nested calls in the same thread share the connection.
+	:param method: method that calls an SQL query
+	:return: method running within a pooled connection
+	"""
+
+	def wrapper(*args, **kwargs):
+		with engine.pool.connection():
+			return method(*args, **kwargs)
+
+	return wrapper
 
 
 def _commit(method: Callable) -> Callable:
 	"""
-	decorator: calls cnx._commit() at the end of query in order to
+	decorator: calls cnx.commit() at the end of query in order to
 	make the changes caused by the query to be permanent in the DB.
+	if the method raises, the pool rolls the transaction back when the
+	connection is returned.
 	:param method:
 		method that calls an SQL query that makes changes to the data
 	:return: method decorated with cnx.commit()
 	"""
 
+	def wrapper(*args, **kwargs):
+		with engine.pool.connection() as cnx:
+			out = method(*args, **kwargs)
+			cnx.commit()
+			return out
+
+	return wrapper
+
+
+def _cursor() -> CursorBase:
+	""" the cursor of the connection checked out by this thread """
+	return engine.pool.cursor()
+
+
+def _execute(
+	statement: str,
+	params: Tuple = (),
+	prepared: bool = False,
+	cursor: CursorBase = None,
+) -> CursorBase:
+	"""
+	runs the statement with params bound by the driver (values are
+	never formatted into the statement).
+	:param statement: one of the constant statements in _SQL
+	:param params: values to bind to the statement's %s markers
+	:param prepared:
+		if true, the statement is prepared server-side once per pooled
+		connection and only executed afterwards. use it for statements
+		with parameters that run on hot paths.
+	:param cursor:
+		the cursor to run the statement with, if not one of the connection
+		checked out by this thread (i.e. of a dedicated connection)
+	:return: the cursor that ran the statement
+	"""
+	if cursor is None:
+		pool = engine.pool
+		cursor = pool.prepared_cursor(statement) if prepared else pool.cursor()
+	if not instrumentation.enabled:
+		cursor.execute(statement, params)
+		return cursor
+	start = time.perf_counter()
+	cursor.execute(statement, params)
+	caller = sys._getframe(1).f_code.co_name
+	if cursor.description is not None:
+		# recorded when its rows are fetched
+		return TimedCursor(cursor, instrumentation, statement, caller, start)
+	instrumentation.record(
+		statement, time.perf_counter() - start, cursor.rowcount, caller
+	)
+	return cursor
+
+
+def _executemany(statement: str, seq_params: List[Tuple]) -> CursorBase:
+	"""
+	runs a statement for every tuple in seq_params. the driver rewrites
+	an INSERT into a single multi-row INSERT, so this is one round trip
+	no matter how many rows are inserted. other statements run once per
+	tuple.
+	"""
+	cursor = engine.pool.cursor()
+	if not instrumentation.enabled:
+		cursor.executemany(statement, seq_params)
+		return cursor
+	start = time.perf_counter()
+	cursor.executemany(statement, seq_params)
+	instrumentation.record(
+		statement,
+		time.perf_counter() - start,
+		len(seq_params),
+		sys._getframe(1).f_code.co_name,
+	)
+	return cursor
+
+
+# bumped after every write to the questions or the courses, so that
+# catalog snapshots (see catalog.py) loaded before the write are reloaded
+_catalog_version = 0
+_catalog_version_lock = threading.Lock()
+
+
+def catalog_version() -> int:
+	""" the number of writes to questions and courses in this process """
+	return _catalog_version
+
+
+def _bump_catalog_version() -> None:
+	global _catalog_version
+	with _catalog_version_lock:
+		_catalog_version += 1
+
+
+def _changes_catalog(method: Callable) -> Callable:
+	"""
+	decorator: bumps the catalog version once the method returns. it must
+	wrap _commit so the version only changes after the write is visible.
+	"""
+
 	def wrapper(*args, **kwargs):
 		out = method(*args, **kwargs)
-		cnx.commit()
+		_bump_catalog_version()
 		return out
 
 	return wrapper
 
 
+def _may_change_catalog(method: Callable) -> Callable:
+	"""
+	decorator: same as _changes_catalog, for a method that returns whether
+	it changed anything. the version is only bumped if it did.
+	"""
+
+	def wrapper(*args, **kwargs):
+		changed = method(*args, **kwargs)
+		if changed:
+			_bump_catalog_version()
+		return changed
+
+	return wrapper
+
+
+def pool_metrics() -> Dict[str, Any]:
+	""" connection pool size, usage and wait time metrics """
+	return engine.pool.metrics()
+
+
+def query_stats() -> List[Dict[str, Any]]:
+	"""
+	latency percentiles, row counts and callers of every statement, if
+	instrumentation is enabled (see instrumentation.py)
+	"""
+	return instrumentation.stats()
+
+
+@_may_change_catalog
 @_commit
-def initialize_database() -> None:
+def initialize_database() -> bool:
 	""" see db_initializer.py """
-	db_initializer.initialize_database(cursor)
+	return db_initializer.initialize_database(_cursor(), engine)
+
+
+def _group_responses(
+	rows: List[Tuple[int, str, int, int]],
+) -> List[Tuple[int, str or None, Dict[int, int]]]:
+	"""
+	groups (rid, course number, qid, aid) rows that are ordered by rid
+	into one (rid, course number, {qid: aid}) tuple per response
+	"""
+	responses = []
+	for rid, cn, qid, aid in rows:
+		if len(responses) == 0 or responses[-1][0] != rid:
+			responses.append((rid, cn, {}))
+		responses[-1][2][qid] = aid
+	return responses
+
+
+def _before(
+	label_watermark: datetime or str or None,
+	window: timedelta,
+) -> datetime or str:
+	"""
+	:return:
+		label_watermark moved back by window, in its own type: mysql
+		returns datetimes, sqlite the text of NOW(6)
+	"""
+	if label_watermark is None:
+		return LABEL_EPOCH
+	if isinstance(label_watermark, datetime):
+		return label_watermark - window
+	earlier = datetime.strptime(label_watermark, "%Y-%m-%d %H:%M:%S.%f") - window
+	return earlier.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def _typed_answers(answers: Dict[int, int]) -> Dict[QID, AID]:
+	""" {qid: aid} with interned QID and AID, see SpecialInt.interned """
+	question, answer = QID.interned, AID.interned
+	return {question(qid): answer(aid) for qid, aid in answers.items()}
+
+
+class _SQL:
+	"""
+	every statement _DB sends. values are bound as parameters instead of
+	being formatted in, so each statement is a constant string that MySQL
+	can prepare once per connection and reuse.
+	"""
+	insert_question = "INSERT INTO %s (%s, %s, %s) VALUES (%s)" % (
+		TBL.Questions,
+		TBLCol.question,
+		TBLCol.question_type,
+		TBLCol.question_answer_type,
+		placeholders(3),
+	)
+	insert_answer_choice = "INSERT INTO %s (%s, %s, %s) VALUES (%s)" % (
+		TBL.AnswerChoices,
+		TBLCol.question_id,
+		TBLCol.choice,
+		TBLCol.vector,
+		placeholders(3),
+	)
+	load_questions = """
+		SELECT a.%s, a.%s, b.%s, b.%s, b.%s
+		FROM %s a JOIN %s b ON a.%s = b.%s
+	""" % (
+		TBLCol.question_id,
+		TBLCol.question,
+		TBLCol.answer_id,
+		TBLCol.choice,
+		TBLCol.vector,
+		TBL.Questions,
+		TBL.AnswerChoices,
+		TBLCol.question_id,
+		TBLCol.question_id,
+	)
+	load_courses = "SELECT %s, %s, %s FROM %s" % (
+		TBLCol.course_id,
+		TBLCol.course_number,
+		TBLCol.course_name,
+		TBL.Courses,
+	)
+	# CROSS JOIN is an inner join in MySQL, but makes sqlite read Responses
+	# first, through the index on cn, instead of scanning ResponseMappings
+	load_labelled_responses = """
+		SELECT a.%s, a.%s, b.%s, b.%s
+		FROM %s a
+			CROSS JOIN %s b ON a.%s = b.%s
+		WHERE
+			a.%s IS NOT NULL
+	""" % (
+		TBLCol.response_id,
+		TBLCol.course_number,
+		TBLCol.question_id,
+		TBLCol.answer_id,
+		TBL.Responses,
+		TBL.ResponseMappings,
+		TBLCol.response_id,
+		TBLCol.response_id,
+		TBLCol.course_number,
+	)
+	stream_labelled_responses = """
+		SELECT a.%s, a.%s, b.%s, b.%s
+		FROM %s a
+			JOIN %s b ON a.%s = b.%s
+		WHERE
+			a.%s IS NOT NULL
+		ORDER BY a.%s
+	""" % (
+		TBLCol.response_id,
+		TBLCol.course_number,
+		TBLCol.question_id,
+		TBLCol.answer_id,
+		TBL.Responses,
+		TBL.ResponseMappings,
+		TBLCol.response_id,
+		TBLCol.response_id,
+		TBLCol.course_number,
+		TBLCol.response_id,
+	)
+	load_labelled_responses_after = """
+		SELECT a.%s, a.%s, b.%s, b.%s
+		FROM %s a
+			JOIN %s b ON a.%s = b.%s
+		WHERE
+			a.%s IS NOT NULL AND a.%s > %%s
+		ORDER BY a.%s
+	""" % (
+		TBLCol.response_id,
+		TBLCol.course_number,
+		TBLCol.question_id,
+		TBLCol.answer_id,
+		TBL.Responses,
+		TBL.ResponseMappings,
+		TBLCol.response_id,
+		TBLCol.response_id,
+		TBLCol.course_number,
+		TBLCol.response_id,
+		TBLCol.response_id,
+	)
+	load_relabelled_responses = """
+		SELECT a.%s, a.%s, b.%s, b.%s
+		FROM %s a
+			JOIN %s b ON a.%s = b.%s
+		WHERE
+			a.%s > %%s AND a.%s <= %%s
+		ORDER BY a.%s
+	""" % (
+		TBLCol.response_id,
+		TBLCol.course_number,
+		TBLCol.question_id,
+		TBLCol.answer_id,
+		TBL.Responses,
+		TBL.ResponseMappings,
+		TBLCol.response_id,
+		TBLCol.response_id,
+		TBLCol.time_label_changed,
+		TBLCol.response_id,
+		TBLCol.response_id,
+	)
+	count_responses_after = "SELECT COUNT(*), MAX(%s) FROM %s WHERE %s > %%s" % (
+		TBLCol.response_id,
+		TBL.Responses,
+		TBLCol.response_id,
+	)
+	latest_label_change = "SELECT MAX(%s) FROM %s" % (
+		TBLCol.time_label_changed,
+		TBL.Responses,
+	)
+	label_response = "UPDATE %s SET %s = %%s, %s = NOW(6) WHERE %s = %%s" % (
+		TBL.Responses,
+		TBLCol.course_number,
+		TBLCol.time_label_changed,
+		TBLCol.response_id,
+	)
+	load_response = "SELECT %s, %s FROM %s WHERE %s = %%s" % (
+		TBLCol.question_id,
+		TBLCol.answer_id,
+		TBL.ResponseMappings,
+		TBLCol.response_id,
+	)
+	insert_response = "INSERT INTO %s (%s, %s, %s) VALUES (%s)" % (
+		TBL.Responses,
+		TBLCol.course_number,
+		TBLCol.response_salt,
+		TBLCol.packed_answers,
+		placeholders(3),
+	)
+	insert_response_mapping = "INSERT INTO %s (%s, %s, %s) VALUES (%s)" % (
+		TBL.ResponseMappings,
+		TBLCol.response_id,
+		TBLCol.question_id,
+		TBLCol.answer_id,
+		placeholders(3),
+	)
+
+	load_packed_labelled_responses = """
+		SELECT %s, %s, %s FROM %s WHERE %s IS NOT NULL ORDER BY %s
+	""" % (
+		TBLCol.response_id,
+		TBLCol.course_number,
+		TBLCol.packed_answers,
+		TBL.Responses,
+		TBLCol.course_number,
+		TBLCol.response_id,
+	)
+	load_unpacked_response_ids = """
+		SELECT %s FROM %s WHERE %s IS NULL AND %s > %%s ORDER BY %s LIMIT %%s
+	""" % (
+		TBLCol.response_id,
+		TBL.Responses,
+		TBLCol.packed_answers,
+		TBLCol.response_id,
+		TBLCol.response_id,
+	)
+	load_response_mappings_between = """
+		SELECT %s, %s, %s FROM %s WHERE %s >= %%s AND %s <= %%s ORDER BY %s
+	""" % (
+		TBLCol.response_id,
+		TBLCol.question_id,
+		TBLCol.answer_id,
+		TBL.ResponseMappings,
+		TBLCol.response_id,
+		TBLCol.response_id,
+		TBLCol.response_id,
+	)
+	store_packed_answers = "UPDATE %s SET %s = %%s WHERE %s = %%s" % (
+		TBL.Responses,
+		TBLCol.packed_answers,
+		TBLCol.response_id,
+	)
+	max_response_id = "SELECT COALESCE(MAX(%s), 0) FROM %s" % (
+		TBLCol.response_id,
+		TBL.Responses,
+	)
+
+	@staticmethod
+	def load_responses(count: int) -> str:
+		return "SELECT %s, %s, %s FROM %s WHERE %s IN (%s) ORDER BY %s" % (
+			TBLCol.response_id,
+			TBLCol.question_id,
+			TBLCol.answer_id,
+			TBL.ResponseMappings,
+			TBLCol.response_id,
+			placeholders(count),
+			TBLCol.response_id,
+		)
+
+	@staticmethod
+	def select_response_ids_by_salt(count: int) -> str:
+		return "SELECT %s, %s FROM %s WHERE %s IN (%s) AND %s > %%s" % (
+			TBLCol.response_id,
+			TBLCol.response_salt,
+			TBL.Responses,
+			TBLCol.response_salt,
+			placeholders(count),
+			TBLCol.response_id,
+		)
+
+	@staticmethod
+	@Memoized(cache_size=20)
+	def select_unique_field(
+		tbl: str,
+		unique_col_name: str,
+		target_col_name: str,
+	) -> str:
+		""" memoized, so the same statement object is reused every call """
+		return "SELECT %s FROM %s WHERE %s = %%s" % \
+			(unique_col_name, tbl, target_col_name)
 
 
 class _DB:
@@ -56,6 +495,7 @@ class _DB:
 	# questions
 
 	@staticmethod
+	@_changes_catalog
 	@_commit
 	def store_question(
 		question: str,
@@ -65,32 +505,16 @@ class _DB:
 	) -> Tuple[QID, SQuestion, List[Tuple[SChoice, SVector]]]:
 		if _DB.question_exists_in_db(question):
 			raise ValueError("this question already exists in the database")
-		data = (
-			TBL.Questions,
-			TBLCol.question,
-			TBLCol.question_type,
-			TBLCol.question_answer_type,
-			quote(question),
-			quote(q_type),
-			quote(qa_type),
+		cursor = _execute(
+			_SQL.insert_question,
+			(question, q_type, qa_type),
+			prepared=True,
 		)
-		cursor.execute("INSERT INTO %s (%s, %s, %s) VALUES (%s, %s, %s)" % data)
-		question_id = _DB.question_id(question)
-		data = (
-			TBL.AnswerChoices,
-			TBLCol.question_id,
-			TBLCol.choice,
-			TBLCol.vector,
-			', '.join([
-				"(" + ",".join([
-					str(question_id),
-					quote(str(choice)),
-					quote(str(vector))
-				]) + ")"
-				for choice, vector in choices
-			]),
-		)
-		cursor.execute("INSERT INTO %s (%s, %s, %s) VALUES %s;" % data)
+		question_id = cursor.lastrowid
+		_executemany(_SQL.insert_answer_choice, [
+			(question_id, str(choice), str(vector))
+			for choice, vector in choices
+		])
 		answers = \
 			[(SChoice(choice), SVector(vector)) for choice, vector in choices]
 		return QID(question_id), SQuestion(question), answers
@@ -100,23 +524,10 @@ class _DB:
 		return _DB.question_id(question) is not None
 
 	@staticmethod
+	@_connect
 	def load_questions(
 	) -> List[Tuple[QID, SQuestion, List[Tuple[AID, SChoice, List[int]]]]]:
-		data = (
-			TBLCol.question_id,
-			TBLCol.question,
-			TBLCol.answer_id,
-			TBLCol.choice,
-			TBLCol.vector,
-			TBL.Questions,
-			TBL.AnswerChoices,
-			TBLCol.question_id,
-			TBLCol.question_id,
-		)
-		cursor.execute("""
-			SELECT a.%s, a.%s, b.%s, b.%s, b.%s 
-			FROM %s a JOIN %s b ON a.%s = b.%s
-		""" % data)
+		cursor = _execute(_SQL.load_questions)
 		result = {}
 		for qid, question, aid, choice, vector in cursor.fetchall():
 			question_list = result.get((qid, question), [])
@@ -132,99 +543,332 @@ class _DB:
 	# courses
 
 	@staticmethod
+	@_connect
 	def load_courses() -> List[Tuple[CID, SCourseNumber, SCourse]]:
-		data = (
-			TBLCol.course_id,
-			TBLCol.course_number,
-			TBLCol.course_name,
-			TBL.Courses,
-		)
-		cursor.execute("SELECT %s, %s, %s FROM %s" % data)
-		return cursor.fetchall()
+		return _execute(_SQL.load_courses).fetchall()
 
 	# responses
 
 	@staticmethod
-	def load_labelled_responses() -> Dict[Tuple[RID, SCourseNumber], Dict[QID, AID]]:
-		data = (
-			TBLCol.response_id,
-			TBLCol.course_number,
-			TBLCol.question_id,
-			TBLCol.answer_id,
-			TBL.Responses,
-			TBL.ResponseMappings,
-			TBLCol.response_id,
-			TBLCol.response_id,
-			TBLCol.course_number,
-		)
-		cursor.execute("""
-			SELECT a.%s, b.%s, b.%s, b.%s 
-			FROM %s a 
-				JOIN %s b ON a.%s = b.%s
-			WHERE
-				a.%s IS NOT NULL
-		""" % data)
+	@_connect
+	def load_labelled_responses(
+		raw: bool = False,
+	) -> Dict[Tuple[RID, SCourseNumber], Dict[QID, AID]]:
+		"""
+		:param raw:
+			if true, ids are left as plain ints and course numbers as plain
+			strings, which skips building a typed value per cell
+		"""
 		result = {}
-		for rid_, cn_, qid_, aid_ in cursor.fetchall():
-			rid, cn, qid, aid = \
-				RID(rid_), SCourseNumber(cn_), QID(qid_), AID(aid_)
-			dic = result.get((rid, cn), {})
-			dic[qid] = aid
-			result[(rid, cn)] = dic
-		return result
+		for rid, cn, qid, aid in _execute(_SQL.load_labelled_responses).fetchall():
+			answers = result.get((rid, cn))
+			if answers is None:
+				answers = result[(rid, cn)] = {}
+			answers[qid] = aid
+		if raw:
+			return result
+		return {
+			(RID(rid), SCourseNumber.interned(cn)): _typed_answers(answers)
+			for (rid, cn), answers in result.items()
+		}
 
 	@staticmethod
-	def load_response(rid: RID) -> Dict[QID, AID] or None:
-		data = (
-			TBLCol.question_id,
-			TBLCol.answer_id,
-			TBL.ResponseMappings,
-			TBLCol.response_id,
-			str(rid),
+	@_connect
+	def load_labelled_answer_arrays(
+	) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+		"""
+		the rows of load_labelled_responses as columns, for bulk encoding
+		without a python object per response.
+		:return:
+			(rids, course numbers, qids, aids) with one entry per answer:
+			int64 arrays, and an object array of the course numbers
+		"""
+		# numpy reads the row tuples straight into the fields of a
+		# structured array, without a python object per column
+		rows = np.array(
+			_execute(_SQL.load_labelled_responses).fetchall(),
+			dtype=ANSWER_ARRAYS_DTYPE,
 		)
-		cursor.execute("SELECT %s, %s FROM %s WHERE %s = %s" % data)
-		rows = cursor.fetchall()
+		return rows["rid"], rows["cn"], rows["qid"], rows["aid"]
+
+	@staticmethod
+	def stream_labelled_responses(
+		chunk_size: int = 1000,
+	) -> Iterator[List[Tuple[int, str, Dict[int, int]]]]:
+		"""
+		streams the labelled responses in order of rid, in chunks of at
+		least chunk_size responses (a response is never split across two
+		chunks). rows are read from an unbuffered cursor on a dedicated
+		connection, so memory only grows with the chunk size. values are
+		left as plain ints and strings since the caller encodes them.
+		:param chunk_size: number of responses per chunk
+		:return: chunks of (rid, course number, {qid: aid}) tuples
+		"""
+		with engine.pool.dedicated_connection() as cnx:
+			cursor = engine.cursor(cnx)
+			# closed even if the caller stops iterating before the end
+			try:
+				cursor = _execute(_SQL.stream_labelled_responses, cursor=cursor)
+				chunk, answers, current_rid, current_cn = [], None, None, None
+				rows = cursor.fetchmany(STREAM_FETCH_SIZE)
+				while len(rows) > 0:
+					for rid, cn, qid, aid in rows:
+						if rid != current_rid:
+							if answers is not None:
+								chunk.append((current_rid, current_cn, answers))
+								if len(chunk) >= chunk_size:
+									yield chunk
+									chunk = []
+							answers, current_rid, current_cn = {}, rid, cn
+						answers[qid] = aid
+					rows = cursor.fetchmany(STREAM_FETCH_SIZE)
+			finally:
+				cursor.close()
+			if answers is not None:
+				chunk.append((current_rid, current_cn, answers))
+			if len(chunk) > 0:
+				yield chunk
+
+	@staticmethod
+	@_connect
+	def load_labelled_responses_since(
+		rid_watermark: int = 0,
+		label_watermark: datetime = None,
+		committed_rid: int = 0,
+		rid_safety_window: int = RID_SAFETY_WINDOW,
+	) -> Tuple[List[Tuple[int, str or None, Dict[int, int]]], datetime or None, int]:
+		"""
+		loads what changed in the labelled data since a previous call:
+		labelled responses with a rid above rid_watermark, and responses
+		at or below it whose label changed after label_watermark (their
+		course number is None if the label was removed). every query runs
+		in the same transaction, so the returned label watermark is
+		consistent with the rows.
+		rows that commit late, below a watermark already returned, are
+		picked up by reading the rids above committed_rid (at most
+		rid_safety_window of them) and LABEL_SAFETY_WINDOW below the
+		watermarks again: responses that were returned by the previous
+		call can be returned again, and callers dedupe by rid.
+		:param rid_watermark: the largest rid seen so far
+		:param label_watermark:
+			the label watermark returned by the previous call. None if no
+			label had changed by then (or if this is the first load, in
+			which case every response is above rid_watermark anyway).
+		:param committed_rid: the committed rid returned by the previous call
+		:param rid_safety_window: the most rids below rid_watermark read again
+		:return:
+			(rid, course number, {qid: aid}) tuples in order of rid, one
+			per rid, the label watermark to pass to the next call, and the
+			committed rid to pass to the next call: the largest rid at or
+			below which no response can commit any more
+		"""
+		start = max(
+			0, rid_watermark - rid_safety_window, min(committed_rid, rid_watermark)
+		)
+		responses = _group_responses(_execute(
+			_SQL.load_labelled_responses_after,
+			(start,),
+			prepared=True,
+		).fetchall())
+		if rid_watermark > 0:
+			relabelled = _group_responses(_execute(
+				_SQL.load_relabelled_responses,
+				(_before(label_watermark, LABEL_SAFETY_WINDOW), rid_watermark),
+				prepared=True,
+			).fetchall())
+			# the responses in the rid window can be in both
+			by_rid = {response[0]: response for response in responses + relabelled}
+			responses = [by_rid[rid] for rid in sorted(by_rid)]
+		# without a gap above start, no insert is in flight below the
+		# largest rid, and later inserts get larger rids. a gap is an
+		# insert in flight, or rolled back or deleted, which can't be told
+		# apart: the window is read again until it slides past the gap.
+		count, max_rid = _execute(
+			_SQL.count_responses_after, (start,), prepared=True,
+		).fetchall()[0]
+		committed_rid = start if max_rid is None or count < max_rid - start else max_rid
+		latest_label_change = _execute(_SQL.latest_label_change).fetchall()[0][0]
+		return responses, latest_label_change, committed_rid
+
+	@staticmethod
+	@_connect
+	def load_packed_labelled_responses() -> List[Tuple[int, str, bytes or None]]:
+		"""
+		one row per labelled response, in order of rid, with its packed
+		answers (None for responses that are not packed yet)
+		:return: (rid, course number, packed answers) tuples
+		"""
+		return [
+			(rid, cn, None if packed is None else bytes(packed))
+			for rid, cn, packed in
+			_execute(_SQL.load_packed_labelled_responses).fetchall()
+		]
+
+	@staticmethod
+	@_connect
+	def load_unpacked_responses(
+		rid_watermark: int = 0,
+		limit: int = BULK_INSERT_SIZE,
+	) -> List[Tuple[int, Dict[int, int]]]:
+		"""
+		loads up to limit responses above rid_watermark that have no packed
+		answers yet, in order of rid.
+		:return: (rid, {qid: aid}) tuples
+		"""
+		rids = [
+			rid for rid, in _execute(
+				_SQL.load_unpacked_response_ids,
+				(rid_watermark, limit),
+				prepared=True,
+			).fetchall()
+		]
+		if len(rids) == 0:
+			return []
+		answers = {rid: {} for rid in rids}
+		for rid, qid, aid in _execute(
+			_SQL.load_response_mappings_between,
+			(rids[0], rids[-1]),
+			prepared=True,
+		).fetchall():
+			if rid in answers:
+				answers[rid][qid] = aid
+		return [(rid, answers[rid]) for rid in rids]
+
+	@staticmethod
+	@_commit
+	def store_packed_answers(packed_answers: List[Tuple[int, bytes]]) -> None:
+		""" :param packed_answers: (rid, packed answers) tuples """
+		_executemany(_SQL.store_packed_answers, [
+			(packed, int(rid)) for rid, packed in packed_answers
+		])
+
+	@staticmethod
+	@_commit
+	def label_response(rid: RID, cn: SCourseNumber or None) -> None:
+		""" sets (or removes, if cn is None) the label of a response """
+		_execute(_SQL.label_response, (cn, int(rid)), prepared=True)
+
+	@staticmethod
+	@_connect
+	def load_response(rid: RID, raw: bool = False) -> Dict[QID, AID] or None:
+		""" :param raw: see load_labelled_responses """
+		rows = _execute(_SQL.load_response, (int(rid),), prepared=True).fetchall()
 		if len(rows) == 0:
 			return None
-		return {QID(qid): AID(aid) for qid, aid in rows}
+		answers = dict(rows)
+		return answers if raw else _typed_answers(answers)
+
+	@staticmethod
+	@_connect
+	def load_responses(
+		rids: List[RID],
+		raw: bool = False,
+	) -> Dict[RID, Dict[QID, AID]]:
+		"""
+		loads many responses with one query per BULK_INSERT_SIZE rids
+		:param raw: see load_labelled_responses
+		:return: the answers of each response found, by rid
+		"""
+		rids = sorted(set(int(rid) for rid in rids))
+		responses = {}
+		for start in range(0, len(rids), BULK_INSERT_SIZE):
+			chunk = rids[start:start + BULK_INSERT_SIZE]
+			for rid, qid, aid in _execute(
+				_SQL.load_responses(len(chunk)), tuple(chunk),
+			).fetchall():
+				responses.setdefault(rid, {})[qid] = aid
+		if raw:
+			return responses
+		return {RID(rid): _typed_answers(answers) for rid, answers in responses.items()}
 
 	@staticmethod
 	@_commit
 	def store_response(
 		response: Dict[QID, AID],
 		cn: SCourseNumber = None,
+		packed_answers: bytes = None,
 	) -> RID:
-		salt = _DB.create_unique_response_salt()
-		data = (
-			TBL.Responses,
-			TBLCol.course_number,
-			TBLCol.response_salt,
-			"NULL" if cn is None else cn,
-			salt,
-		)
-		cursor.execute("INSERT INTO %s (%s, %s) VALUES (%s, %s)" % data)
-		rid = RID(_DB.response_id(salt))
-		values = [(rid, qid, response[qid]) for qid in response]
-		data = (
-			TBL.ResponseMappings,
-			TBLCol.response_id,
-			TBLCol.question_id,
-			TBLCol.answer_id,
-			convert_to_query_values(values),
+		"""
+		:param packed_answers:
+			the response packed with packed_answers.pack, if the caller
+			could pack it. otherwise backfill packs it later.
+		"""
+		cursor = _execute(
+			_SQL.insert_response,
+			(cn, generator_util.generate_response_salt(), packed_answers),
+			prepared=True,
 		)
-		cursor.execute("INSERT INTO %s (%s, %s, %s) VALUES %s;" % data)
+		# the auto-incremented id comes back with the insert itself, so
+		# there is no need to look the response up by its salt
+		rid = RID(cursor.lastrowid)
+		_executemany(_SQL.insert_response_mapping, [
+			(int(rid), int(qid), int(response[qid])) for qid in response
+		])
 		return rid
 
 	@staticmethod
-	def create_unique_response_salt() -> str:
-		cursor.execute(
-			"SELECT %s FROM %s" %
-			(TBLCol.response_salt, TBL.Responses)
-		)
-		return generator_util.generate_unique_id(
-			set(el[0] for el in cursor.fetchall()),
-			generator_util.generate_response_salt,
-		)
+	@_commit
+	def store_responses(
+		batch: List[Tuple[Dict[QID, AID], SCourseNumber or None]],
+		packed_answers: List[bytes or None] = None,
+	) -> List[RID]:
+		"""
+		stores many responses in a single transaction. responses are
+		inserted BULK_INSERT_SIZE at a time with one multi-row INSERT for
+		Responses, one SELECT to read back their ids and one multi-row
+		INSERT for their mappings.
+		:param batch: (response, course number or None) tuples
+		:param packed_answers: the packed answers of each response, if any
+		:return: the rids of the stored responses, in the order given
+		"""
+		if packed_answers is None:
+			packed_answers = [None] * len(batch)
+		rids = []
+		for start in range(0, len(batch), BULK_INSERT_SIZE):
+			rids.extend(_DB._store_response_chunk(
+				batch[start:start + BULK_INSERT_SIZE],
+				packed_answers[start:start + BULK_INSERT_SIZE],
+			))
+		return rids
+
+	@staticmethod
+	def _store_response_chunk(
+		batch: List[Tuple[Dict[QID, AID], SCourseNumber or None]],
+		packed_answers: List[bytes or None],
+	) -> List[RID]:
+		salts = set()
+		for _ in batch:
+			salts.add(generator_util.generate_unique_id(
+				salts,
+				generator_util.generate_response_salt,
+			))
+		salts = list(salts)
+		# the ids of a multi-row insert may not be consecutive (depending
+		# on innodb_autoinc_lock_mode), so they are read back by salt,
+		# which a unique index keeps from matching any other response (an
+		# insert that repeats a salt fails and rolls the batch back). only
+		# ids above the largest one before the insert are searched. (not
+		# every driver sets lastrowid after executemany, so it can't be
+		# used.)
+		previous_rid = _execute(_SQL.max_response_id).fetchall()[0][0]
+		_executemany(_SQL.insert_response, [
+			(cn, salt, packed)
+			for (_, cn), salt, packed in zip(batch, salts, packed_answers)
+		])
+		rows = _execute(
+			_SQL.select_response_ids_by_salt(len(salts)),
+			tuple(salts) + (previous_rid,),
+		).fetchall()
+		assert len(rows) == len(salts), \
+			"read back %d of the %d responses inserted" % (len(rows), len(salts))
+		rid_by_salt = {salt: rid for rid, salt in rows}
+		rids = [RID(rid_by_salt[salt]) for salt in salts]
+		_executemany(_SQL.insert_response_mapping, [
+			(int(rid), int(qid), int(response[qid]))
+			for (response, _), rid in zip(batch, rids)
+			for qid in response
+		])
+		return rids
 
 	# id and name getters
 
@@ -234,7 +878,7 @@ class _DB:
 			tbl=TBL.Questions,
 			unique_col_name=TBLCol.question_id,
 			target_col_name=TBLCol.question,
-			target_value=quote(question),
+			target_value=question,
 		)
 
 	@staticmethod
@@ -243,15 +887,16 @@ class _DB:
 			tbl=TBL.Responses,
 			unique_col_name=TBLCol.response_id,
 			target_col_name=TBLCol.response_salt,
-			target_value=quote(response_salt),
+			target_value=response_salt,
 		)
 
 	@staticmethod
+	@_connect
 	def get_unique_field(
 		tbl: str,
 		unique_col_name: str,
 		target_col_name: str,
-		target_value: str,
+		target_value: str or int,
 	) -> str or int or None:
 		"""
 		this method expects that the column target_col_name column has unique
@@ -260,25 +905,75 @@ class _DB:
 		:param tbl: table where this is coming from
 		:param unique_col_name: the column name of the id
 		:param target_col_name: the target column name
-		:param target_value: the target column value
+		:param target_value: the target column value, bound as a parameter
 		:return:
 			unique_col_name from the database for the row with the unique
 			target_col_name equal to the target value
 		"""
-		cursor.execute(
-			"SELECT %s FROM %s WHERE %s = %s" %
-			(unique_col_name, tbl, target_col_name, target_value)
-		)
-		row = cursor.fetchall()
+		statement = \
+			_SQL.select_unique_field(tbl, unique_col_name, target_col_name)
+		row = _execute(statement, (target_value,), prepared=True).fetchall()
 		if len(row) == 0:
 			return None
 		return row[0][0]
 
+	# diagnostics
+
+	@staticmethod
+	@_connect
+	def explain_queries() -> Dict[str, List[Dict[str, Any]]]:
+		"""
+		runs EXPLAIN (or the engine's equivalent) on the statements that
+		_DB sends on request paths and when training data is refreshed,
+		with placeholder values bound to the parameters. use
+		engine.is_scan to tell which rows are scans.
+		:return: the rows of each plan (as dicts) by statement name
+		"""
+		statements = {
+			"load_questions": (_SQL.load_questions, ()),
+			"load_labelled_responses": (_SQL.load_labelled_responses, ()),
+			"load_labelled_responses_after": (
+				_SQL.load_labelled_responses_after, (0,),
+			),
+			"load_relabelled_responses": (
+				_SQL.load_relabelled_responses, (LABEL_EPOCH, 0),
+			),
+			"count_responses_after": (_SQL.count_responses_after, (0,)),
+			"load_packed_labelled_responses": (
+				_SQL.load_packed_labelled_responses, (),
+			),
+			"load_unpacked_response_ids": (
+				_SQL.load_unpacked_response_ids, (0, 1),
+			),
+			"load_response": (_SQL.load_response, (0,)),
+			"load_responses": (_SQL.load_responses(2), (0, 0)),
+			"question_id": (_SQL.select_unique_field(
+				TBL.Questions, TBLCol.question_id, TBLCol.question,
+			), ("",)),
+			"response_id": (_SQL.select_unique_field(
+				TBL.Responses, TBLCol.response_id, TBLCol.response_salt,
+			), ("",)),
+		}
+		return {
+			name: engine.explain(_cursor(), statement, params)
+			for name, (statement, params) in statements.items()
+		}
+
 
 # Exposing functions that will be used publicly
 load_courses = _DB.load_courses
 load_questions = _DB.load_questions
 load_response = _DB.load_response
+load_responses = _DB.load_responses
 load_labelled_responses = _DB.load_labelled_responses
+load_labelled_answer_arrays = _DB.load_labelled_answer_arrays
+stream_labelled_responses = _DB.stream_labelled_responses
+load_labelled_responses_since = _DB.load_labelled_responses_since
+load_packed_labelled_responses = _DB.load_packed_labelled_responses
+load_unpacked_responses = _DB.load_unpacked_responses
+store_packed_answers = _DB.store_packed_answers
+label_response = _DB.label_response
 store_question = _DB.store_question
 store_response = _DB.store_response
+store_responses = _DB.store_responses
+explain_queries = _DB.explain_queries
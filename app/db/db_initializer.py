@@ -1,27 +1,171 @@
+from __future__ import annotations
 from app.db.sql_constants import TBL, TBLCol
-from app.utils.db_utils import quote
+from app.utils.db_utils import placeholders
 from app.db.mit_courses import mit_courses
-import mysql.connector.errors
-from mysql.connector.cursor import CursorBase
+from app.utils import generator_util
+from typing import TYPE_CHECKING, Dict
+import hashlib
+from app.db.sql import StorageEngine
+
+if TYPE_CHECKING:
+	# only for annotations, which are not evaluated: the driver is imported
+	# by the mysql engine when it connects
+	from mysql.connector.cursor import CursorBase
+
+
+# unique index on the Responses salts, which replaces idx_responses_salt
+UNIQUE_SALT_INDEX = "idx_responses_salt_unique"
+
+# (table, column, column definition) of the columns added to a table
+# after it was first created
+COLUMNS = (
+	(TBL.Responses, TBLCol.time_label_changed, "DATETIME(6)"),
+	(TBL.Responses, TBLCol.packed_answers, "BLOB"),
+)
+
+# (table, index name, indexed columns)
+INDEXES = (
+	(
+		# load_response(rid) and the join in load_labelled_responses
+		TBL.ResponseMappings,
+		"idx_response_mappings_rid_qid",
+		"%s, %s" % (TBLCol.response_id, TBLCol.question_id),
+	),
+	(
+		# response_id(salt)
+		TBL.Responses,
+		"idx_responses_salt",
+		TBLCol.response_salt,
+	),
+	(
+		# the "cn IS NOT NULL" filter of load_labelled_responses
+		TBL.Responses,
+		"idx_responses_cn_rid",
+		"%s(16), %s" % (TBLCol.course_number, TBLCol.response_id),
+	),
+	(
+		# relabelled responses in load_labelled_responses_since
+		TBL.Responses,
+		"idx_responses_time_label_changed",
+		TBLCol.time_label_changed,
+	),
+	(
+		# question_id(question)
+		TBL.Questions,
+		"idx_questions_question",
+		"%s(255)" % TBLCol.question,
+	),
+	(
+		# the join in load_questions
+		TBL.AnswerChoices,
+		"idx_answer_choices_qid",
+		TBLCol.question_id,
+	),
+)
 
 
 class _DBInitializer:
 	@staticmethod
-	def initialize_database(cursor: CursorBase) -> None:
+	def initialize_database(cursor: CursorBase, engine: StorageEngine) -> bool:
 		"""
-		when the database is just loaded, we need to make sure that
-		all the tables are created in the db. with this method, we
-		will not need to manually create tables every time we change
-		db: it will just create them at initialization.
-		:return: void
+		brings the database up to date: applies the migrations that it has
+		not applied yet (in order of version), and adds the courses of
+		mit_courses.py if they changed since the last initialization. both
+		are recorded in DatabaseState, so initializing a database that is
+		already up to date is a single SELECT.
+		migrations are not guarded against concurrent runs: initialize the
+		database from one process when deploying new migrations.
+		:param cursor: a cursor handed out by engine
+		:param engine: the engine the database is stored with
+		:return: true if the database changed
 		"""
+		state = _DBInitializer.load_state(cursor, engine)
+		schema_version = int(state.get(SCHEMA_VERSION, 0))
+		courses_fingerprint = _DBInitializer.courses_fingerprint()
+		if schema_version >= LATEST_SCHEMA_VERSION and \
+			state.get(COURSES_FINGERPRINT) == courses_fingerprint:
+			return False
+		_DBInitializer.create_state_tables(cursor)
+		for version, name, migrate in MIGRATIONS:
+			if version <= schema_version:
+				continue
+			migrate(cursor, engine)
+			cursor.execute(
+				"INSERT INTO %s (%s, %s, %s) VALUES (%%s, %%s, NOW(6))" % (
+					TBL.SchemaMigrations,
+					TBLCol.migration_version,
+					TBLCol.migration_name,
+					TBLCol.time_applied,
+				),
+				(version, name),
+			)
+			_DBInitializer.set_state(cursor, SCHEMA_VERSION, str(version))
+		if state.get(COURSES_FINGERPRINT) != courses_fingerprint:
+			_DBInitializer.populate_courses_table_with_new_courses(cursor)
+			_DBInitializer.set_state(
+				cursor, COURSES_FINGERPRINT, courses_fingerprint
+			)
+		return True
+
+	@staticmethod
+	def load_state(cursor: CursorBase, engine: StorageEngine) -> Dict[str, str]:
+		""" :return: the DatabaseState, empty if it doesn't exist yet """
+		try:
+			cursor.execute(
+				"SELECT %s, %s FROM %s" %
+				(TBLCol.state_key, TBLCol.state_value, TBL.DatabaseState)
+			)
+			return dict(cursor.fetchall())
+		except engine.Error:
+			# databases initialized before migrations were recorded (or
+			# never initialized) have no DatabaseState table
+			return {}
+
+	@staticmethod
+	def set_state(cursor: CursorBase, key: str, value: str) -> None:
+		cursor.execute(
+			"DELETE FROM %s WHERE %s = %%s" %
+			(TBL.DatabaseState, TBLCol.state_key),
+			(key,),
+		)
+		cursor.execute(
+			"INSERT INTO %s (%s, %s) VALUES (%%s, %%s)" %
+			(TBL.DatabaseState, TBLCol.state_key, TBLCol.state_value),
+			(key, value),
+		)
+
+	@staticmethod
+	def courses_fingerprint() -> str:
+		return hashlib.sha1(repr(sorted(mit_courses)).encode()).hexdigest()
+
+	@staticmethod
+	def create_state_tables(cursor: CursorBase) -> None:
+		cursor.execute("""
+			CREATE TABLE IF NOT EXISTS %s (
+				%s INT NOT NULL PRIMARY KEY,
+				%s VARCHAR(255) NOT NULL,
+				%s DATETIME(6) NOT NULL
+			);
+		""" % (
+			TBL.SchemaMigrations,
+			TBLCol.migration_version,
+			TBLCol.migration_name,
+			TBLCol.time_applied,
+		))
+		cursor.execute("""
+			CREATE TABLE IF NOT EXISTS %s (
+				%s VARCHAR(64) NOT NULL PRIMARY KEY,
+				%s VARCHAR(255) NOT NULL
+			);
+		""" % (TBL.DatabaseState, TBLCol.state_key, TBLCol.state_value))
+
+	@staticmethod
+	def create_tables(cursor: CursorBase, engine: StorageEngine) -> None:
 		_DBInitializer.create_courses_table(cursor)
 		_DBInitializer.create_questions_table(cursor)
 		_DBInitializer.create_answer_choice_table(cursor)
 		_DBInitializer.create_response_table(cursor)
 		_DBInitializer.create_response_mapping_table(cursor)
-		_DBInitializer.add_delete_constraints_if_needed(cursor)
-		_DBInitializer.populate_courses_table_with_new_courses(cursor)
 
 	@staticmethod
 	def create_courses_table(cursor: CursorBase) -> None:
@@ -84,6 +228,8 @@ class _DBInitializer:
 			TBLCol.course_number,
 			TBLCol.response_salt,
 			TBLCol.time_created,
+			TBLCol.time_label_changed,
+			TBLCol.packed_answers,
 		)
 		cursor.execute("""
 			CREATE TABLE IF NOT EXISTS %s (
@@ -94,12 +240,21 @@ class _DBInitializer:
 				-- ids are arbitrary. so we retrieve courses with 
 				-- course names
 				%s TINYTEXT,
-				-- response salts are just random strings that are 
-				-- generated at creation time in order to fetch the
-				-- response id (since ids are incremented 
-				-- automatically). 
+				-- response salts are just random strings generated 
+				-- at creation time. the response id itself is read 
+				-- back from the insert (cursor.lastrowid), so salts 
+				-- are only kept as an opaque handle on a response. 
 				%s VARCHAR(10),
-				%s DATETIME(6)
+				%s DATETIME(6),
+				-- set whenever the label (course number) of an existing 
+				-- response changes, so that training data can pick up 
+				-- relabelled responses incrementally 
+				%s DATETIME(6),
+				-- the answers of the response packed into one byte per 
+				-- question (see packed_answers.py), so that training 
+				-- data loads one row per response instead of one per 
+				-- answer. NULL until packed. 
+				%s BLOB
 			);
 		""" % responses_data)
 
@@ -120,7 +275,43 @@ class _DBInitializer:
 		""" % response_mappings_query_data)
 
 	@staticmethod
-	def add_delete_constraints_if_needed(cursor: CursorBase) -> None:
+	def add_columns_if_needed(cursor: CursorBase, engine: StorageEngine) -> None:
+		"""
+		adds the columns that were introduced after their table was first
+		created to databases that were initialized before then.
+		"""
+		existing_columns = engine.existing_columns(cursor)
+		for table, column, definition in COLUMNS:
+			if (table.lower(), column.lower()) in existing_columns:
+				continue
+			cursor.execute(
+				"ALTER TABLE %s ADD COLUMN %s %s" % (table, column, definition)
+			)
+
+	@staticmethod
+	def create_indexes_if_needed(cursor: CursorBase, engine: StorageEngine) -> None:
+		"""
+		creates the secondary indexes that the queries in database.py
+		rely on. MySQL has no CREATE INDEX IF NOT EXISTS, so we look up
+		the indexes that already exist and only create the missing ones.
+		text columns are indexed by prefix since they can't be indexed
+		whole.
+		"""
+		existing_indexes = engine.existing_indexes(cursor)
+		for table, index, columns in INDEXES:
+			if (table.lower(), index.lower()) in existing_indexes:
+				continue
+			cursor.execute(
+				"CREATE INDEX %s ON %s (%s)" % (index, table, columns)
+			)
+
+	@staticmethod
+	def add_delete_constraints_if_needed(
+		cursor: CursorBase,
+		engine: StorageEngine,
+	) -> None:
+		if not engine.supports_adding_constraints:
+			return
 		fk_insertion_data = [
 			(
 				TBL.AnswerChoices,
@@ -159,11 +350,57 @@ class _DBInitializer:
 					REFERENCES %s (%s)
 					ON DELETE CASCADE;
 				""" % query_data)
-			except mysql.connector.errors.IntegrityError:
+			except engine.IntegrityError:
 				# integrity error means we ran into the duplicate key,
 				# so table already had it
 				pass
 
+	@staticmethod
+	def make_response_salts_unique(
+		cursor: CursorBase,
+		engine: StorageEngine,
+	) -> None:
+		"""
+		replaces the index on Responses salts with a unique one, so that
+		store_responses can read the ids of the responses it inserted back
+		by salt. responses that share a salt with an older response are
+		given a new salt first.
+		"""
+		cursor.execute(
+			"SELECT %s FROM %s WHERE %s IS NOT NULL GROUP BY %s HAVING COUNT(*) > 1" % (
+				TBLCol.response_salt,
+				TBL.Responses,
+				TBLCol.response_salt,
+				TBLCol.response_salt,
+			)
+		)
+		duplicated_salts = [salt for salt, in cursor.fetchall()]
+		if len(duplicated_salts) > 0:
+			cursor.execute("SELECT %s FROM %s WHERE %s IS NOT NULL" % (
+				TBLCol.response_salt, TBL.Responses, TBLCol.response_salt,
+			))
+			salts = set(salt for salt, in cursor.fetchall())
+		for salt in duplicated_salts:
+			cursor.execute("SELECT %s FROM %s WHERE %s = %%s ORDER BY %s" % (
+				TBLCol.response_id,
+				TBL.Responses,
+				TBLCol.response_salt,
+				TBLCol.response_id,
+			), (salt,))
+			for rid, in cursor.fetchall()[1:]:
+				new_salt = generator_util.generate_unique_id(
+					salts, generator_util.generate_response_salt,
+				)
+				salts.add(new_salt)
+				cursor.execute("UPDATE %s SET %s = %%s WHERE %s = %%s" % (
+					TBL.Responses, TBLCol.response_salt, TBLCol.response_id,
+				), (new_salt, rid))
+		if (TBL.Responses.lower(), "idx_responses_salt") in engine.existing_indexes(cursor):
+			engine.drop_index(cursor, TBL.Responses, "idx_responses_salt")
+		cursor.execute("CREATE UNIQUE INDEX %s ON %s (%s)" % (
+			UNIQUE_SALT_INDEX, TBL.Responses, TBLCol.response_salt,
+		))
+
 	@staticmethod
 	def populate_courses_table_with_new_courses(cursor: CursorBase) -> None:
 		cursor.execute(
@@ -180,16 +417,35 @@ class _DBInitializer:
 				TBL.Courses,
 				TBLCol.course_number,
 				TBLCol.course_name,
-				",".join(
-					["(" + ",".join(
-						[quote(s) for s in course_row]
-					) + ")" for course_row in course_to_add_list]
-				),
+				placeholders(2),
 			)
-			cursor.execute(
-				"INSERT INTO %s (%s, %s) VALUES %s;" %
-				course_population_data
+			cursor.executemany(
+				"INSERT INTO %s (%s, %s) VALUES (%s)" %
+				course_population_data,
+				course_to_add_list,
 			)
 
 
+# keys of DatabaseState
+SCHEMA_VERSION = "schema_version"
+COURSES_FINGERPRINT = "courses_fingerprint"
+
+# (version, name, migration) of every change to the schema, in order.
+# each migration runs once per database, in its own step of a deploy. a
+# migration that shipped must never change: add a new one instead.
+# migrations 1 to 4 are the schema from before migrations were recorded.
+# they check what exists, so databases from back then can adopt them.
+MIGRATIONS = (
+	(1, "create tables", _DBInitializer.create_tables),
+	(2, "add time_label_changed and packed_answers to Responses",
+		_DBInitializer.add_columns_if_needed),
+	# indexes go before the foreign keys so that InnoDB uses them for
+	# the constraints instead of creating duplicates
+	(3, "create secondary indexes", _DBInitializer.create_indexes_if_needed),
+	(4, "add delete constraints",
+		_DBInitializer.add_delete_constraints_if_needed),
+	(5, "make Responses salts unique", _DBInitializer.make_response_salts_unique),
+)
+LATEST_SCHEMA_VERSION = MIGRATIONS[-1][0]
+
 initialize_database = _DBInitializer.initialize_database
@@ -0,0 +1,67 @@
+"""
+prints the EXPLAIN plan of every query that database.py runs on request
+paths and flags the ones that scan a whole table or index. the plans come
+from whichever storage engine is configured (see SQL_ENGINE).
+
+usage: python -m app.db.diagnostics
+exits with status 1 if any point lookup or indexed query scans. the
+queries in FULL_READS read whole tables by design, so their scans are
+shown but do not fail the report.
+"""
+import sys
+from typing import Dict, Any
+import app.db.database as database
+from app.utils.log_util import Color
+
+# queries that read every row on purpose: the quiz, and the packed
+# answers of every labelled response that training starts from
+FULL_READS = ("load_questions", "load_packed_labelled_responses")
+
+
+def _as_text(value: Any) -> str:
+	if isinstance(value, (bytes, bytearray)):
+		return value.decode()
+	return "" if value is None else str(value)
+
+
+def is_scan(plan_row: Dict[str, Any]) -> bool:
+	return database.engine.is_scan(plan_row)
+
+
+def _format(plan_row: Dict[str, Any]) -> str:
+	if "detail" in plan_row:
+		# sqlite's EXPLAIN QUERY PLAN describes each step in one line
+		return "  " + _as_text(plan_row["detail"])
+	return "  %-18s type=%-7s key=%-32s rows=%-8s %s" % tuple(
+		_as_text(plan_row.get(column))
+		for column in ("table", "type", "key", "rows", "Extra")
+	)
+
+
+def report() -> bool:
+	"""
+	prints the plans of every query.
+	:return: true if no query outside of FULL_READS scans
+	"""
+	no_scans = True
+	for name, plan in database.explain_queries().items():
+		full_read = name in FULL_READS
+		print(Color.bold(name + ("  (full read)" if full_read else "")))
+		for row in plan:
+			line = _format(row)
+			if not is_scan(row):
+				print(line)
+			elif full_read:
+				print(line + "  <- scan")
+			else:
+				no_scans = False
+				print(Color.error(line + "  <- scan"))
+	if no_scans:
+		print(Color.notice("no point lookup or indexed query scans a full table or index"))
+	return no_scans
+
+
+if __name__ == "__main__":
+	# creates the tables and indexes if the database is new (or in memory)
+	database.initialize_database()
+	sys.exit(0 if report() else 1)
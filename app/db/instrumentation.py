@@ -0,0 +1,213 @@
+"""
+timing of the statements that database.py sends. when enabled, every
+statement run through _execute and _executemany is timed (including the
+fetch of its rows) and recorded with its row count and the _DB method
+that ran it:
+- into a latency histogram per statement, see stats(). statements that
+only differ by the number of markers in a list (i.e. IN (%s, %s, ...))
+share one histogram.
+- into the slow query log (one json line per statement), if it took
+longer than the slow query threshold
+
+it is off by default. turn it on with SQL_INSTRUMENTATION=1, or with
+instrumentation.enable() at runtime. when off, the only cost is one
+attribute check per statement.
+"""
+import os
+import re
+import json
+import time
+import threading
+from typing import Dict, List, Any
+from app.utils.histogram_util import Histogram, exponential_bounds
+
+# upper bounds (in seconds) of the latency buckets: 0.1ms, 0.2ms, ...
+# up to about 105s. the last bucket holds everything slower.
+BUCKET_BOUNDS = exponential_bounds(0.0001, 21)
+# a list of parameter markers, i.e. the (%s, %s, %s) of an IN with one
+# marker per value. statements that only differ by the length of their
+# lists are recorded together.
+PLACEHOLDER_LIST = re.compile(r"\(\s*%s(?:\s*,\s*%s)*\s*\)")
+# number of statement texts whose normalized form is remembered
+NORMALIZED_CACHE_SIZE = 1024
+
+
+def normalize(statement: str) -> str:
+	""" the statement on one line, with its lists of markers collapsed to (…) """
+	return PLACEHOLDER_LIST.sub("(…)", " ".join(statement.split()))
+
+
+class QueryStats:
+	""" the latency histogram and row counts of one statement """
+
+	def __init__(self, statement: str) -> None:
+		self.statement = statement
+		self.rows = 0
+		self.latency = Histogram(BUCKET_BOUNDS)
+		self.callers: Dict[str, int] = {}
+
+	def record(self, duration: float, row_count: int, caller: str) -> None:
+		self.rows += max(row_count, 0)
+		self.latency.record(duration)
+		self.callers[caller] = self.callers.get(caller, 0) + 1
+
+	def percentile(self, fraction: float) -> float:
+		return self.latency.percentile(fraction)
+
+	def as_dict(self) -> Dict[str, Any]:
+		return {
+			"statement": self.statement,
+			"count": self.latency.count,
+			"rows": self.rows,
+			"time_total": self.latency.total,
+			"time_avg": self.latency.average(),
+			"time_max": self.latency.max,
+			"p50": self.percentile(0.5),
+			"p90": self.percentile(0.9),
+			"p99": self.percentile(0.99),
+			"callers": dict(self.callers),
+		}
+
+
+class Instrumentation:
+	def __init__(
+		self,
+		enabled: bool = False,
+		slow_query_threshold: float = 0.1,
+		slow_query_log: str = None,
+	) -> None:
+		"""
+		:param enabled: whether statements are recorded
+		:param slow_query_threshold:
+			statements that take longer than this (in seconds) are written
+			to the slow query log
+		:param slow_query_log: path of the slow query log, None for none
+		"""
+		self.enabled = enabled
+		self.slow_query_threshold = slow_query_threshold
+		self.slow_query_log = slow_query_log
+		self._lock = threading.Lock()
+		# by normalized statement
+		self._stats: Dict[str, QueryStats] = {}
+		# statement -> normalized statement
+		self._normalized: Dict[str, str] = {}
+		self._log_file = None
+
+	def enable(self) -> None:
+		self.enabled = True
+
+	def disable(self) -> None:
+		self.enabled = False
+
+	def record(
+		self,
+		statement: str,
+		duration: float,
+		row_count: int,
+		caller: str,
+	) -> None:
+		with self._lock:
+			normalized = self._normalized.get(statement)
+			if normalized is None:
+				if len(self._normalized) >= NORMALIZED_CACHE_SIZE:
+					self._normalized = {}
+				normalized = self._normalized[statement] = normalize(statement)
+			stats = self._stats.get(normalized)
+			if stats is None:
+				stats = self._stats[normalized] = QueryStats(normalized)
+			stats.record(duration, row_count, caller)
+			if duration >= self.slow_query_threshold and \
+				self.slow_query_log is not None:
+				self._log_slow_query(stats.statement, duration, row_count, caller)
+
+	def stats(self) -> List[Dict[str, Any]]:
+		""" :return: the stats of every statement, by total time spent """
+		with self._lock:
+			stats = [query_stats.as_dict() for query_stats in self._stats.values()]
+		return sorted(stats, key=lambda entry: -entry["time_total"])
+
+	def reset(self) -> None:
+		with self._lock:
+			self._stats = {}
+
+	def close(self) -> None:
+		with self._lock:
+			if self._log_file is not None:
+				self._log_file.close()
+				self._log_file = None
+
+	def _log_slow_query(
+		self,
+		statement: str,
+		duration: float,
+		row_count: int,
+		caller: str,
+	) -> None:
+		if self._log_file is None:
+			self._log_file = open(self.slow_query_log, "a")
+		self._log_file.write(json.dumps({
+			"time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+			"duration_ms": round(duration * 1000, 3),
+			"rows": row_count,
+			"caller": caller,
+			"statement": statement,
+		}) + "\n")
+		self._log_file.flush()
+
+
+class TimedCursor:
+	"""
+	a cursor whose statement returned rows: the statement is recorded once
+	its rows are fetched, so that the time spent transferring them counts.
+	rows fetched with fetchmany are recorded when a fetch comes back
+	empty, with only the time spent executing and fetching (not the time
+	the caller spends between fetches).
+	"""
+
+	def __init__(
+		self,
+		cursor: Any,
+		instrumentation: Instrumentation,
+		statement: str,
+		caller: str,
+		start: float,
+	) -> None:
+		self._cursor = cursor
+		self._instrumentation = instrumentation
+		self._statement = statement
+		self._caller = caller
+		self._start = start
+		# time spent in execute and fetchmany, and the rows fetched so far
+		self._elapsed = time.perf_counter() - start
+		self._rows = 0
+
+	def fetchmany(self, size: int) -> List[Any]:
+		start = time.perf_counter()
+		rows = self._cursor.fetchmany(size)
+		self._elapsed += time.perf_counter() - start
+		self._rows += len(rows)
+		if len(rows) == 0:
+			self._instrumentation.record(
+				self._statement, self._elapsed, self._rows, self._caller,
+			)
+		return rows
+
+	def fetchall(self) -> List[Any]:
+		rows = self._cursor.fetchall()
+		self._instrumentation.record(
+			self._statement,
+			time.perf_counter() - self._start,
+			len(rows),
+			self._caller,
+		)
+		return rows
+
+	def __getattr__(self, item: str) -> Any:
+		return getattr(self._cursor, item)
+
+
+instrumentation = Instrumentation(
+	enabled=os.environ.get("SQL_INSTRUMENTATION", "0") == "1",
+	slow_query_threshold=float(os.environ.get("SQL_SLOW_QUERY_THRESHOLD", 0.1)),
+	slow_query_log=os.environ.get("SQL_SLOW_QUERY_LOG", "slow_queries.log"),
+)
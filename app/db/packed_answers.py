@@ -0,0 +1,85 @@
+"""
+the packed answers of a response: a compact encoding of its answers that
+is stored with the response (Responses.packed_answers), so that training
+data can be loaded one row per response instead of one row per answer.
+
+the encoding has one byte per question of the catalog, in order of qid.
+a byte is 0 if the question was not answered, or 1 + the position of the
+chosen answer among the answers of the question (in order of aid). since
+new questions get larger qids, packed answers from before a question was
+added are just shorter, and unpack pads them with "not answered".
+
+responses stored without packed answers (i.e. before this column existed)
+are packed by backfill:
+usage: python -m app.db.packed_answers
+"""
+from typing import Dict, List
+import numpy as np
+from app.db.catalog import Catalog
+from app.classifier.custom_types import QID, AID
+import app.db.catalog as catalog
+import app.db.database as database
+
+NOT_ANSWERED = 0
+# a byte holds at most this many answers per question
+MAX_ANSWER_COUNT = 255
+
+
+def pack(snapshot: Catalog, response: Dict[QID, AID]) -> bytes or None:
+	"""
+	:return:
+		the packed answers of response, or None if it answers a question
+		that is not in the snapshot (it is then packed by backfill)
+	"""
+	packed = bytearray(len(snapshot.questions))
+	for qid, aid in response.items():
+		index = snapshot.qid_to_index.get(qid)
+		if index is None or snapshot.aid_to_qid.get(aid) != qid:
+			return None
+		assert snapshot.aid_to_index[aid] < MAX_ANSWER_COUNT, \
+			"%s has too many answers to be packed" % repr(qid)
+		packed[index] = snapshot.aid_to_index[aid] + 1
+	return bytes(packed)
+
+
+def unpack(packed_answers: List[bytes], question_count: int) -> np.ndarray:
+	"""
+	:param packed_answers: packed answers of any length
+	:param question_count: number of questions to unpack
+	:return:
+		a (len(packed_answers), question_count) uint8 matrix of the bytes
+		of each response, padded with NOT_ANSWERED or cut to question_count
+	"""
+	rows = b"".join(
+		packed[:question_count].ljust(question_count, b"\0")
+		for packed in packed_answers
+	)
+	return np.frombuffer(rows, dtype=np.uint8).reshape(
+		(len(packed_answers), question_count)
+	)
+
+
+def backfill(chunk_size: int = database.BULK_INSERT_SIZE) -> int:
+	"""
+	packs the answers of every response that has none yet, chunk_size
+	responses per transaction.
+	:return: the number of responses packed
+	"""
+	snapshot, packed_count, rid_watermark = catalog.snapshot(), 0, 0
+	while True:
+		responses = database.load_unpacked_responses(rid_watermark, chunk_size)
+		if len(responses) == 0:
+			return packed_count
+		packed_answers = [
+			(rid, pack(snapshot, answers)) for rid, answers in responses
+		]
+		database.store_packed_answers([
+			(rid, packed) for rid, packed in packed_answers
+			if packed is not None
+		])
+		packed_count += len([p for _, p in packed_answers if p is not None])
+		rid_watermark = responses[-1][0]
+
+
+if __name__ == "__main__":
+	print("packed the answers of %d responses" % backfill())
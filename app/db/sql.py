@@ -1,15 +1,534 @@
 import os
-import mysql.connector
-import config
-
-_config = {
-	"host": os.environ.get("SQL_HOST", config.SQL_HOST),
-	"user": os.environ.get("SQL_USER", config.SQL_USER),
-	"passwd": os.environ.get("SQL_PASSWORD", config.SQL_PASSWORD),
-	"database": os.environ.get("SQL_DATABASE", config.SQL_DATABASE)
-}
+import re
+import time
+import sqlite3
+import threading
+import importlib
+from contextlib import contextmanager
+from queue import LifoQueue, Empty, Full
+from typing import Dict, Any, List, Set, Tuple
+
 try:
-	cnx = mysql.connector.connect(**_config)
-	cursor = cnx.cursor()
-except mysql.connector.Error as err:
-	print("Something went wrong: {}".format(err))
+	import config
+except ImportError:
+	# config.py is only needed to reach a mysql server. an embedded
+	# sqlite database can be configured from the environment alone.
+	config = None
+
+
+def _setting(name: str, default: Any = None) -> Any:
+	""" reads a setting from the environment, then from config.py """
+	return os.environ.get(name, getattr(config, name, default))
+
+
+# maximum number of connections opened at once. flask workers that
+# ask for more connections than this wait for one to be returned.
+POOL_SIZE = int(_setting("SQL_POOL_SIZE", 8))
+# how long (in seconds) a thread waits for a connection before giving up
+POOL_TIMEOUT = float(_setting("SQL_POOL_TIMEOUT", 10))
+# connections idle for longer than this (in seconds) are pinged before
+# being handed out, since mysql drops connections after wait_timeout
+POOL_HEALTH_CHECK_INTERVAL = float(_setting("SQL_POOL_HEALTH_CHECK_INTERVAL", 30))
+RECONNECT_ATTEMPTS = 3
+
+
+class PoolTimeoutError(Exception):
+	""" raised when no connection is returned to the pool in time """
+
+
+class ConnectionPool:
+	"""
+	a bounded pool of database connections. connections are opened
+	lazily (so importing this module does not touch the database) and
+	each thread checks one out for the duration of a unit of work with
+	`with pool.connection():`. the checkout is re-entrant: nested
+	checkouts in the same thread share the same connection, so a _DB
+	method that calls another _DB method stays in one transaction.
+	everything specific to a database driver is left to the engine.
+	"""
+
+	def __init__(
+		self,
+		engine: "StorageEngine",
+		size: int = POOL_SIZE,
+		timeout: float = POOL_TIMEOUT,
+		health_check_interval: float = POOL_HEALTH_CHECK_INTERVAL,
+	) -> None:
+		assert size > 0, "pool size must be positive, got %d" % size
+		self._engine = engine
+		self.size = size
+		self.timeout = timeout
+		self.health_check_interval = health_check_interval
+		self._idle: LifoQueue = LifoQueue(maxsize=size)
+		self._slots = threading.BoundedSemaphore(size)
+		self._local = threading.local()
+		self._lock = threading.Lock()
+		self._last_used: Dict[int, float] = {}
+		# prepared cursors of each connection, keyed by their statement
+		self._prepared: Dict[int, Dict[str, Any]] = {}
+		# metrics
+		self._opened = 0
+		self._in_use = 0
+		self._checkouts = 0
+		self._health_checks = 0
+		self._reconnects = 0
+		self._timeouts = 0
+		self._wait_time_total = 0.
+		self._wait_time_max = 0.
+
+	@contextmanager
+	def connection(self) -> Any:
+		held = getattr(self._local, "cnx", None)
+		if held is not None:
+			yield held
+			return
+		cnx = self._checkout()
+		self._local.cnx, self._local.cursor = cnx, self._engine.cursor(cnx)
+		try:
+			yield cnx
+		finally:
+			cursor = self._local.cursor
+			self._local.cnx, self._local.cursor = None, None
+			self._checkin(cnx, cursor)
+
+	@contextmanager
+	def dedicated_connection(self) -> Any:
+		"""
+		checks out a connection that is not shared with the rest of the
+		thread's work. used to stream a long result set with an unbuffered
+		cursor while the same thread keeps running other queries.
+		a pool of size 1 has no second connection to give to a thread that
+		already holds one: that connection is reused if the engine can
+		read a result set while running other statements on the same
+		connection, otherwise PoolTimeoutError is raised right away instead
+		of waiting for a connection that this thread itself holds.
+		"""
+		held = getattr(self._local, "cnx", None)
+		if held is not None and self.size == 1:
+			if not self._engine.interleaves_result_sets:
+				raise PoolTimeoutError(
+					"no dedicated connection available: this thread holds the "
+					"only connection of the pool"
+				)
+			yield held
+			return
+		cnx = self._checkout()
+		try:
+			yield cnx
+		finally:
+			self._checkin(cnx)
+
+	def cursor(self) -> Any:
+		"""
+		the cursor of the connection checked out by the current thread.
+		must be called within a `with pool.connection():` block.
+		"""
+		cursor = getattr(self._local, "cursor", None)
+		assert cursor is not None, \
+			"no connection is checked out by this thread"
+		return cursor
+
+	def prepared_cursor(self, statement: str) -> Any:
+		"""
+		a cursor on the current thread's connection that has statement
+		prepared server-side. the cursor is kept with the connection so
+		the statement is only parsed once per connection. statement must
+		be the same string object on every call (i.e. a constant) since
+		the prepared cursor only skips re-preparing on identity.
+		"""
+		cnx = getattr(self._local, "cnx", None)
+		assert cnx is not None, "no connection is checked out by this thread"
+		statements = self._prepared.setdefault(id(cnx), {})
+		cursor = statements.get(statement)
+		if cursor is None:
+			cursor = self._engine.prepared_cursor(cnx)
+			statements[statement] = cursor
+		return cursor
+
+	def metrics(self) -> Dict[str, Any]:
+		with self._lock:
+			checkouts = self._checkouts
+			return {
+				"size": self.size,
+				"opened": self._opened,
+				"idle": self._idle.qsize(),
+				"in_use": self._in_use,
+				"checkouts": checkouts,
+				"health_checks": self._health_checks,
+				"reconnects": self._reconnects,
+				"timeouts": self._timeouts,
+				"wait_time_total": self._wait_time_total,
+				"wait_time_max": self._wait_time_max,
+				"wait_time_avg":
+					self._wait_time_total / checkouts if checkouts > 0 else 0.,
+			}
+
+	def close(self) -> None:
+		""" close every idle connection. used on shutdown and in tests """
+		while True:
+			try:
+				cnx = self._idle.get_nowait()
+			except Empty:
+				return
+			self._discard(cnx)
+
+	def _checkout(self) -> Any:
+		start = time.perf_counter()
+		if not self._slots.acquire(timeout=self.timeout):
+			with self._lock:
+				self._timeouts += 1
+			raise PoolTimeoutError(
+				"no connection available after %.1fs (pool size %d)" %
+				(self.timeout, self.size)
+			)
+		waited = time.perf_counter() - start
+		try:
+			cnx = self._healthy_connection()
+		except BaseException:
+			self._slots.release()
+			raise
+		with self._lock:
+			self._in_use += 1
+			self._checkouts += 1
+			self._wait_time_total += waited
+			self._wait_time_max = max(self._wait_time_max, waited)
+		return cnx
+
+	def _checkin(self, cnx: Any, cursor: Any = None) -> None:
+		try:
+			if cursor is not None:
+				cursor.close()
+			# end whatever transaction was left open (i.e. by a read) so
+			# the next borrower does not read from a stale snapshot
+			cnx.rollback()
+			self._last_used[id(cnx)] = time.monotonic()
+			self._idle.put_nowait(cnx)
+		except (self._engine.Error, Full):
+			self._discard(cnx)
+		finally:
+			with self._lock:
+				self._in_use -= 1
+			self._slots.release()
+
+	def _healthy_connection(self) -> Any:
+		try:
+			cnx = self._idle.get_nowait()
+		except Empty:
+			return self._open()
+		idle_time = time.monotonic() - self._last_used.get(id(cnx), 0.)
+		if idle_time < self.health_check_interval:
+			return cnx
+		with self._lock:
+			self._health_checks += 1
+		if self._engine.is_alive(cnx):
+			return cnx
+		with self._lock:
+			self._reconnects += 1
+		# statements prepared on the dropped session are gone
+		self._prepared.pop(id(cnx), None)
+		try:
+			self._engine.reconnect(cnx)
+		except self._engine.Error:
+			self._discard(cnx)
+			cnx = self._open()
+		return cnx
+
+	def _open(self) -> Any:
+		cnx = self._engine.connect()
+		with self._lock:
+			self._opened += 1
+		return cnx
+
+	def _discard(self, cnx: Any) -> None:
+		self._last_used.pop(id(cnx), None)
+		self._prepared.pop(id(cnx), None)
+		try:
+			cnx.close()
+		except self._engine.Error:
+			pass
+		with self._lock:
+			self._opened -= 1
+
+
+class StorageEngine:
+	"""
+	a database that the _DB layer can store its tables in. statements are
+	written in the MySQL dialect; engines for other databases translate
+	them through the cursors they hand out. each engine owns the pool of
+	connections to its database.
+	"""
+	name: str = None
+	# base class of the errors raised by the driver
+	Error = Exception
+	IntegrityError = Exception
+	# whether foreign keys can be added with ALTER TABLE ... ADD CONSTRAINT
+	supports_adding_constraints = True
+	# whether a cursor can be read from while other statements run on its
+	# connection (unbuffered MySQL cursors can't)
+	interleaves_result_sets = False
+
+	def __init__(
+		self,
+		pool_size: int = POOL_SIZE,
+		timeout: float = POOL_TIMEOUT,
+	) -> None:
+		self.pool = ConnectionPool(self, size=pool_size, timeout=timeout)
+
+	def connect(self) -> Any:
+		raise NotImplementedError
+
+	def cursor(self, cnx: Any) -> Any:
+		return cnx.cursor()
+
+	def prepared_cursor(self, cnx: Any) -> Any:
+		return self.cursor(cnx)
+
+	def is_alive(self, cnx: Any) -> bool:
+		return True
+
+	def reconnect(self, cnx: Any) -> None:
+		raise NotImplementedError
+
+	def existing_columns(self, cursor: Any) -> Set[Tuple[str, str]]:
+		""" :return: (table, column) of every column, lowercase """
+		raise NotImplementedError
+
+	def existing_indexes(self, cursor: Any) -> Set[Tuple[str, str]]:
+		""" :return: (table, index) of every index, lowercase """
+		raise NotImplementedError
+
+	def drop_index(self, cursor: Any, table: str, index: str) -> None:
+		cursor.execute("DROP INDEX %s ON %s" % (index, table))
+
+	def explain(
+		self,
+		cursor: Any,
+		statement: str,
+		params: Tuple = (),
+	) -> List[Dict[str, Any]]:
+		""" :return: the rows of the query plan of statement, as dicts """
+		raise NotImplementedError
+
+	def is_scan(self, plan_row: Dict[str, Any]) -> bool:
+		""" whether a row of explain reads a whole table or index """
+		raise NotImplementedError
+
+	@staticmethod
+	def _rows_as_dicts(cursor: Any) -> List[Dict[str, Any]]:
+		columns = [description[0] for description in cursor.description]
+		return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def _mysql_connector() -> Any:
+	"""
+	mysql.connector, imported on first use so that processes using the
+	sqlite engine, or not using the database at all, don't import it
+	"""
+	return importlib.import_module("mysql.connector")
+
+
+class MySQLEngine(StorageEngine):
+	name = "mysql"
+
+	def __init__(self, connection_config: Dict[str, Any], **kwargs) -> None:
+		self.connection_config = connection_config
+		super().__init__(**kwargs)
+
+	@property
+	def Error(self) -> Any:
+		return _mysql_connector().Error
+
+	@property
+	def IntegrityError(self) -> Any:
+		return _mysql_connector().errors.IntegrityError
+
+	def connect(self) -> Any:
+		return _mysql_connector().connect(**self.connection_config)
+
+	def prepared_cursor(self, cnx: Any) -> Any:
+		return cnx.cursor(prepared=True)
+
+	def is_alive(self, cnx: Any) -> bool:
+		return cnx.is_connected()
+
+	def reconnect(self, cnx: Any) -> None:
+		cnx.reconnect(attempts=RECONNECT_ATTEMPTS, delay=0)
+
+	def existing_columns(self, cursor: Any) -> Set[Tuple[str, str]]:
+		cursor.execute("""
+			SELECT TABLE_NAME, COLUMN_NAME
+			FROM information_schema.COLUMNS
+			WHERE TABLE_SCHEMA = DATABASE()
+		""")
+		return set(
+			(table.lower(), column.lower())
+			for table, column in cursor.fetchall()
+		)
+
+	def existing_indexes(self, cursor: Any) -> Set[Tuple[str, str]]:
+		cursor.execute("""
+			SELECT DISTINCT TABLE_NAME, INDEX_NAME
+			FROM information_schema.STATISTICS
+			WHERE TABLE_SCHEMA = DATABASE()
+		""")
+		return set(
+			(table.lower(), index.lower())
+			for table, index in cursor.fetchall()
+		)
+
+	def explain(
+		self,
+		cursor: Any,
+		statement: str,
+		params: Tuple = (),
+	) -> List[Dict[str, Any]]:
+		cursor.execute("EXPLAIN " + statement, params)
+		return self._rows_as_dicts(cursor)
+
+	def is_scan(self, plan_row: Dict[str, Any]) -> bool:
+		access_type = plan_row.get("type")
+		if isinstance(access_type, (bytes, bytearray)):
+			access_type = access_type.decode()
+		# ALL reads the whole table, index reads the whole index
+		return access_type in {"ALL", "index"}
+
+
+class _SQLiteCursor:
+	"""
+	a sqlite3 cursor that accepts statements in the MySQL dialect used
+	by database.py and db_initializer.py. translations are cached, so each
+	statement is only rewritten once.
+	"""
+	# MySQL construct -> sqlite equivalent. %s markers are replaced first
+	# so that the strftime format below is left alone.
+	TRANSLATIONS = (
+		(re.compile(r"%s"), "?"),
+		(re.compile(r"\bNOW\(6\)"), "strftime('%Y-%m-%d %H:%M:%f', 'now')"),
+		(re.compile(r"\bSERIAL\b"), "INTEGER PRIMARY KEY AUTOINCREMENT"),
+		(re.compile(r"\bBIGINT UNSIGNED\b"), "INTEGER"),
+		(re.compile(r"\bTINYTEXT\b"), "TEXT"),
+		(re.compile(r"\bDATETIME\(6\)"), "TEXT"),
+	)
+	# prefix lengths of indexed columns, i.e. the (255) in question(255)
+	INDEX_PREFIX = re.compile(r"(\w)\(\d+\)")
+	_translations: Dict[str, str] = {}
+
+	def __init__(self, cursor: sqlite3.Cursor) -> None:
+		self._cursor = cursor
+
+	@staticmethod
+	def translate(statement: str) -> str:
+		translated = _SQLiteCursor._translations.get(statement)
+		if translated is None:
+			translated = statement
+			for pattern, replacement in _SQLiteCursor.TRANSLATIONS:
+				translated = pattern.sub(
+					lambda match: replacement, translated
+				)
+			if translated.lstrip().upper().startswith("CREATE INDEX"):
+				translated = _SQLiteCursor.INDEX_PREFIX.sub(r"\1", translated)
+			_SQLiteCursor._translations[statement] = translated
+		return translated
+
+	def execute(self, statement: str, params: Tuple = ()) -> "_SQLiteCursor":
+		self._cursor.execute(_SQLiteCursor.translate(statement), params)
+		return self
+
+	def executemany(self, statement: str, seq_params: List[Tuple]) -> "_SQLiteCursor":
+		self._cursor.executemany(_SQLiteCursor.translate(statement), seq_params)
+		return self
+
+	def __getattr__(self, item: str) -> Any:
+		return getattr(self._cursor, item)
+
+
+class SQLiteEngine(StorageEngine):
+	"""
+	an embedded database in a file, or in memory if path is ":memory:".
+	an in-memory database lives in a single connection, so its pool
+	always has size 1.
+	"""
+	name = "sqlite"
+	Error = sqlite3.Error
+	IntegrityError = sqlite3.IntegrityError
+	supports_adding_constraints = False
+	interleaves_result_sets = True
+	MEMORY = ":memory:"
+
+	def __init__(self, path: str = MEMORY, **kwargs) -> None:
+		self.path = path
+		if path == SQLiteEngine.MEMORY:
+			kwargs["pool_size"] = 1
+		super().__init__(**kwargs)
+
+	def connect(self) -> Any:
+		# connections are handed from thread to thread by the pool, but
+		# only ever used by one thread at a time
+		cnx = sqlite3.connect(
+			self.path,
+			timeout=self.pool.timeout,
+			check_same_thread=False,
+		)
+		if self.path != SQLiteEngine.MEMORY:
+			cnx.execute("PRAGMA journal_mode = WAL")
+		return cnx
+
+	def cursor(self, cnx: Any) -> Any:
+		return _SQLiteCursor(cnx.cursor())
+
+	def existing_columns(self, cursor: Any) -> Set[Tuple[str, str]]:
+		cursor.execute("""
+			SELECT m.name, p.name
+			FROM sqlite_master m JOIN pragma_table_info(m.name) p
+			WHERE m.type = 'table'
+		""")
+		return set(
+			(table.lower(), column.lower())
+			for table, column in cursor.fetchall()
+		)
+
+	def existing_indexes(self, cursor: Any) -> Set[Tuple[str, str]]:
+		cursor.execute(
+			"SELECT tbl_name, name FROM sqlite_master WHERE type = 'index'"
+		)
+		return set(
+			(table.lower(), index.lower())
+			for table, index in cursor.fetchall()
+		)
+
+	def drop_index(self, cursor: Any, table: str, index: str) -> None:
+		# index names are per database in sqlite, not per table
+		cursor.execute("DROP INDEX %s" % index)
+
+	def explain(
+		self,
+		cursor: Any,
+		statement: str,
+		params: Tuple = (),
+	) -> List[Dict[str, Any]]:
+		cursor.execute("EXPLAIN QUERY PLAN " + statement, params)
+		return self._rows_as_dicts(cursor)
+
+	def is_scan(self, plan_row: Dict[str, Any]) -> bool:
+		# i.e. "SCAN Responses" as opposed to "SEARCH Responses USING ..."
+		return str(plan_row.get("detail", "")).startswith("SCAN")
+
+
+def create_engine() -> StorageEngine:
+	"""
+	the engine picked by the SQL_ENGINE setting: "mysql" (the default)
+	or "sqlite", which stores the database at SQL_SQLITE_PATH.
+	"""
+	name = _setting("SQL_ENGINE", MySQLEngine.name)
+	if name == SQLiteEngine.name:
+		return SQLiteEngine(_setting("SQL_SQLITE_PATH", SQLiteEngine.MEMORY))
+	assert name == MySQLEngine.name, "unknown SQL_ENGINE %s" % repr(name)
+	return MySQLEngine({
+		"host": _setting("SQL_HOST"),
+		"user": _setting("SQL_USER"),
+		"passwd": _setting("SQL_PASSWORD"),
+		"database": _setting("SQL_DATABASE"),
+	})
+
+
+engine = create_engine()
@@ -10,6 +10,8 @@ class TBL:
 	Courses = "Courses"
 	Responses = "Responses"
 	ResponseMappings = "ResponseMappings"
+	SchemaMigrations = "SchemaMigrations"
+	DatabaseState = "DatabaseState"
 
 
 class TBLCol:
@@ -29,6 +31,13 @@ class TBLCol:
 	time_created = "time_created"
 	course_id = "cid"
 	response_salt = "salt"
+	time_label_changed = "time_label_changed"
+	packed_answers = "packed_answers"
+	migration_version = "version"
+	migration_name = "name"
+	time_applied = "time_applied"
+	state_key = "state_key"
+	state_value = "state_value"
 
 
 class TableColumns:
@@ -68,6 +77,8 @@ class Responses(TableColumns):
 			TBLCol.course_number,
 			TBLCol.time_created,
 			TBLCol.response_salt,
+			TBLCol.time_label_changed,
+			TBLCol.packed_answers,
 		)
 
 
@@ -76,6 +87,20 @@ class ResponseMappings(TableColumns):
 		return TBLCol.response_id, TBLCol.question_id, TBLCol.answer_id
 
 
+class SchemaMigrations(TableColumns):
+	def get_columns(self):
+		return (
+			TBLCol.migration_version,
+			TBLCol.migration_name,
+			TBLCol.time_applied,
+		)
+
+
+class DatabaseState(TableColumns):
+	def get_columns(self):
+		return TBLCol.state_key, TBLCol.state_value
+
+
 class DBType:
 	@staticmethod
 	def get_types() -> Set[str]:
@@ -0,0 +1,374 @@
+"""
+a write-behind queue for quiz submissions. submit() appends the response
+to a local journal and returns without touching the database; a
+background thread then stores whatever is queued with one call to
+database.store_responses every FLUSH_INTERVAL seconds (or as soon as
+BATCH_SIZE responses are waiting).
+
+every queue journals to its own file, journal_path.<pid>-<token>, locked
+with flock for as long as the queue is open, so the worker processes of
+one server can share a journal_path. the journal is an append-only file
+of json lines: one line per submitted response, and a marker line after
+each batch that was stored. it is truncated whenever the queue empties,
+and removed when the queue is closed empty. when a queue is created, it
+adopts the journals next to its own that no process holds a lock on:
+the responses submitted after their last marker are copied to its own
+journal and queued again, then the orphaned journal is removed. so
+submissions survive a restart, whichever process restarts.
+
+when a batch fails with a data error (see is_data_error), its responses
+are stored one at a time to find the ones that fail. a response whose own
+insert fails with a data error MAX_ATTEMPTS times is written to
+journal_path.dead with the error and dropped from the queue, so that bad
+data does not block the responses behind it. any other error, such as
+the database being unreachable, leaves the responses queued however long
+it lasts, and flushes back off up to MAX_RETRY_INTERVAL seconds while
+failures last.
+
+delivery is at least once: a crash between storing a batch and writing
+its marker (or between adopting a journal and removing it) stores those
+responses again on restart.
+"""
+import os
+import glob
+import json
+import time
+import uuid
+import fcntl
+import threading
+from typing import Callable, Dict, List, Tuple, Any
+from app.classifier.custom_types import QID, AID, SCourseNumber, RID
+import app.db.catalog as catalog
+import app.db.database as database
+import app.db.packed_answers as packed_answers
+
+# maximum number of responses stored per flush
+BATCH_SIZE = 500
+# seconds between two flushes while responses are waiting
+FLUSH_INTERVAL = 0.5
+# inserts of a response alone failing with a data error before it is
+# dead-lettered
+MAX_ATTEMPTS = 3
+# longest wait between two flushes while flushes fail
+MAX_RETRY_INTERVAL = 30.
+# suffix of the file the dead-lettered responses are appended to
+DEAD_LETTER_SUFFIX = ".dead"
+
+
+def store_packed_responses(
+	batch: List[Tuple[Dict[QID, AID], SCourseNumber or None]],
+) -> List[RID]:
+	""" database.store_responses, with the answers of each response packed """
+	snapshot = catalog.snapshot()
+	return database.store_responses(batch, [
+		packed_answers.pack(snapshot, response) for response, _ in batch
+	])
+
+
+def is_data_error(error: Exception) -> bool:
+	"""
+	whether storing failed because of the data stored, so that trying
+	again cannot succeed, rather than because of the database
+	"""
+	return isinstance(error, (ValueError, TypeError, KeyError, database.engine.IntegrityError))
+
+
+class SubmissionQueue:
+	def __init__(
+		self,
+		journal_path: str,
+		store: Callable[[List[Tuple[Dict[QID, AID], SCourseNumber or None]]], List[RID]] = None,
+		batch_size: int = BATCH_SIZE,
+		flush_interval: float = FLUSH_INTERVAL,
+		fsync: bool = False,
+		max_attempts: int = MAX_ATTEMPTS,
+	) -> None:
+		"""
+		:param journal_path:
+			path the journal of this queue is named after. the queues of
+			several processes can share it.
+		:param store: stores a batch, store_packed_responses by default
+		:param batch_size: maximum number of responses stored per flush
+		:param flush_interval: seconds between two flushes
+		:param fsync:
+			if true, every submission is synced to disk before submit
+			returns, which also survives a power loss but costs a disk
+			flush per submission. otherwise the journal survives the
+			process crashing but not the machine.
+		:param max_attempts:
+			inserts of a response alone failing with a data error before it
+			is written to the dead letter file and dropped from the queue
+		"""
+		self.journal_path = journal_path
+		self.journal_file = "%s.%d-%s" % (journal_path, os.getpid(), uuid.uuid4().hex[:8])
+		self.dead_letter_path = journal_path + DEAD_LETTER_SUFFIX
+		self.store = store if store is not None else store_packed_responses
+		self.batch_size = batch_size
+		self.flush_interval = flush_interval
+		self.fsync = fsync
+		self.max_attempts = max_attempts
+		self._lock = threading.Lock()
+		# only one flush runs at a time
+		self._flush_lock = threading.Lock()
+		self._wakeup = threading.Event()
+		self._stopped = threading.Event()
+		self._thread: threading.Thread = None
+		self._pending: List[Tuple[int, Dict[QID, AID], SCourseNumber or None]] = []
+		self._sequence = 0
+		# inserts that failed with a data error per sequence number, for the
+		# responses stored one at a time
+		self._attempts: Dict[int, int] = {}
+		# responses up to this sequence number are stored one at a time
+		self._isolate_until = 0
+		self._consecutive_failures = 0
+		# metrics
+		self._submitted = 0
+		self._flushed = 0
+		self._flushes = 0
+		self._failed_flushes = 0
+		self._dead_lettered = 0
+		self._flush_time_total = 0.
+		self._flush_time_max = 0.
+		self._flush_time_last = 0.
+		# the journal is locked under a name other queues do not adopt, then
+		# renamed. the lock is held until the queue is closed or the
+		# process dies: a journal that is not locked is orphaned.
+		unlocked_file = "%s~%s" % (journal_path, os.path.basename(self.journal_file))
+		self._journal = open(unlocked_file, "a")
+		fcntl.flock(self._journal.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+		os.rename(unlocked_file, self.journal_file)
+		self._replayed = self._adopt_orphaned_journals()
+
+	def submit(
+		self,
+		response: Dict[QID, AID],
+		cn: SCourseNumber = None,
+	) -> int:
+		"""
+		journals a response to be stored by the next flush.
+		:return: the sequence number of the submission in the journal
+		"""
+		answers = [[int(qid), int(aid)] for qid, aid in response.items()]
+		with self._lock:
+			self._sequence += 1
+			sequence = self._sequence
+			self._write({"seq": sequence, "answers": answers, "cn": cn})
+			self._pending.append((sequence, dict(response), cn))
+			self._submitted += 1
+			if len(self._pending) >= self.batch_size:
+				self._wakeup.set()
+		return sequence
+
+	def flush(self) -> int:
+		"""
+		stores up to batch_size of the queued responses, or only the first
+		one while the responses of a failed batch are retried one at a time.
+		if storing fails, the error is raised and the responses stay queued,
+		unless a response stored alone failed with a data error
+		max_attempts times.
+		:return: the number of responses stored
+		"""
+		with self._flush_lock:
+			with self._lock:
+				batch = self._pending[:1 if self._isolating() else self.batch_size]
+			if len(batch) == 0:
+				return 0
+			start = time.perf_counter()
+			try:
+				self.store([(answers, cn) for _, answers, cn in batch])
+			except Exception as error:
+				with self._lock:
+					self._failed_flushes += 1
+					self._consecutive_failures += 1
+					# any other error is the database failing, not these
+					# responses, which stay queued until it recovers
+					if is_data_error(error) and len(batch) > 1:
+						self._isolate_until = batch[-1][0]
+					elif is_data_error(error):
+						sequence = batch[0][0]
+						self._attempts[sequence] = self._attempts.get(sequence, 0) + 1
+						if self._attempts[sequence] >= self.max_attempts:
+							self._dead_letter(batch[0], error)
+							self._remove_head(batch)
+				raise
+			elapsed = time.perf_counter() - start
+			with self._lock:
+				self._remove_head(batch)
+				self._consecutive_failures = 0
+				self._flushed += len(batch)
+				self._flushes += 1
+				self._flush_time_total += elapsed
+				self._flush_time_max = max(self._flush_time_max, elapsed)
+				self._flush_time_last = elapsed
+			return len(batch)
+
+	def start(self) -> "SubmissionQueue":
+		""" starts flushing in a background thread """
+		assert self._thread is None, "the queue is already started"
+		self._thread = threading.Thread(
+			target=self._run,
+			name="submission-queue",
+			daemon=True,
+		)
+		self._thread.start()
+		return self
+
+	def close(self) -> None:
+		"""
+		stops the background thread and flushes what is queued. the journal
+		is removed if everything was stored, otherwise it is left for the
+		next queue to adopt.
+		"""
+		self._stopped.set()
+		self._wakeup.set()
+		if self._thread is not None:
+			self._thread.join()
+		try:
+			while self.depth() > 0 and self.flush() > 0:
+				pass
+		finally:
+			if self.depth() == 0:
+				os.unlink(self.journal_file)
+			# releases the lock
+			self._journal.close()
+
+	def depth(self) -> int:
+		""" number of responses submitted but not stored yet """
+		with self._lock:
+			return len(self._pending)
+
+	def metrics(self) -> Dict[str, Any]:
+		with self._lock:
+			flushes = self._flushes
+			return {
+				"depth": len(self._pending),
+				"submitted": self._submitted,
+				"replayed": self._replayed,
+				"flushed": self._flushed,
+				"flushes": flushes,
+				"failed_flushes": self._failed_flushes,
+				"dead_lettered": self._dead_lettered,
+				"flush_time_last": self._flush_time_last,
+				"flush_time_max": self._flush_time_max,
+				"flush_time_avg":
+					self._flush_time_total / flushes if flushes > 0 else 0.,
+			}
+
+	def _run(self) -> None:
+		while not self._stopped.is_set():
+			with self._lock:
+				failures = self._consecutive_failures
+			self._wakeup.wait(min(
+				self.flush_interval * 2 ** min(failures, 16), MAX_RETRY_INTERVAL
+			))
+			self._wakeup.clear()
+			try:
+				while self.flush() > 0 and self._more_to_flush():
+					pass
+			except Exception:
+				# the batch stays queued and is retried on the next flush.
+				# failures are counted in metrics()["failed_flushes"].
+				pass
+
+	def _more_to_flush(self) -> bool:
+		""" whether the next flush can start right away """
+		with self._lock:
+			return len(self._pending) >= self.batch_size or self._isolating()
+
+	def _isolating(self) -> bool:
+		return len(self._pending) > 0 and self._pending[0][0] <= self._isolate_until
+
+	def _remove_head(self, batch: List[Tuple[int, Dict[QID, AID], SCourseNumber or None]]) -> None:
+		""" drops batch, the first responses of the queue, and marks it in the journal """
+		del self._pending[:len(batch)]
+		for sequence, _, _ in batch:
+			self._attempts.pop(sequence, None)
+		if len(self._pending) == 0:
+			self._journal.truncate(0)
+		else:
+			self._write({"flushed": batch[-1][0]})
+
+	def _dead_letter(
+		self,
+		submission: Tuple[int, Dict[QID, AID], SCourseNumber or None],
+		error: Exception,
+	) -> None:
+		sequence, response, cn = submission
+		with open(self.dead_letter_path, "a") as dead_letters:
+			dead_letters.write(json.dumps({
+				"journal": self.journal_file,
+				"seq": sequence,
+				"answers": [[int(qid), int(aid)] for qid, aid in response.items()],
+				"cn": cn,
+				"error": repr(error),
+			}) + "\n")
+		self._dead_lettered += 1
+
+	def _write(self, entry: Dict[str, Any]) -> None:
+		self._journal.write(json.dumps(entry) + "\n")
+		self._journal.flush()
+		if self.fsync:
+			os.fsync(self._journal.fileno())
+
+	def _adopt_orphaned_journals(self) -> int:
+		"""
+		queues the responses that were not stored yet from the journals
+		that no open queue holds, i.e. of the processes that died. the plain
+		journal_path is adopted too, as it was written before journals were
+		per process.
+		:return: the number of responses queued
+		"""
+		paths = [self.journal_path] + sorted(glob.glob(glob.escape(self.journal_path) + ".*"))
+		adopted = 0
+		for path in paths:
+			if path == self.journal_file or path == self.dead_letter_path:
+				continue
+			try:
+				journal = open(path)
+			except (FileNotFoundError, IsADirectoryError):
+				continue
+			with journal:
+				try:
+					fcntl.flock(journal.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+				except BlockingIOError:
+					# the journal of a live queue
+					continue
+				try:
+					if os.stat(path).st_ino != os.fstat(journal.fileno()).st_ino:
+						continue
+				except FileNotFoundError:
+					# adopted and removed by another queue in the meantime
+					continue
+				for answers, cn in self._unstored_entries(journal):
+					self._sequence += 1
+					self._write({"seq": self._sequence, "answers": answers, "cn": cn})
+					self._pending.append((
+						self._sequence,
+						{QID(qid): AID(aid) for qid, aid in answers},
+						cn,
+					))
+					adopted += 1
+				# the entries must be in this journal before the orphan goes
+				os.fsync(self._journal.fileno())
+				os.unlink(path)
+		return adopted
+
+	@staticmethod
+	def _unstored_entries(journal) -> List[Tuple[List[List[int]], SCourseNumber or None]]:
+		""" :return: the (answers, cn) of the entries after the last marker of journal """
+		entries, flushed = [], 0
+		for line in journal:
+			try:
+				entry = json.loads(line)
+			except ValueError:
+				# the last line is cut short if the process died
+				# while writing it. it was never acknowledged.
+				continue
+			if "flushed" in entry:
+				flushed = max(flushed, entry["flushed"])
+			else:
+				entries.append(entry)
+		return [
+			(entry["answers"], entry["cn"])
+			for entry in entries if entry["seq"] > flushed
+		]
@@ -0,0 +1,56 @@
+import json
+import unittest
+from unittest import mock
+from app import app
+import app.views as views
+import app.db.database as database
+from app.db.__tests__.sqlite_test_case import SQLiteTestCase, store_question
+
+
+class TestStoreResponse(SQLiteTestCase):
+
+	def setUp(self):
+		super().setUp()
+		self.qid = store_question("do you like labs?")
+		self.aid = database.load_questions()[0][2][0][0]
+		self.queue = mock.Mock()
+		self.queue.submit.return_value = 1
+		patcher = mock.patch.object(views, "submission_queue", return_value=self.queue)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+		self.client = app.test_client()
+
+	def post(self, body):
+		return self.client.post("/response", data=json.dumps(body), content_type="application/json")
+
+	def test_valid_response_is_queued(self):
+		result = self.post({
+			"answers": [{"qid": self.qid, "aid": self.aid}],
+			"course_number": "6",
+		})
+		self.assertEqual(result.status_code, 202)
+		self.queue.submit.assert_called_once_with({self.qid: self.aid}, "6")
+
+	def test_malformed_payloads_are_rejected(self):
+		answer = {"qid": self.qid, "aid": self.aid}
+		for body in [
+			None,
+			[answer],
+			"answers",
+			{"answers": {"0": answer}},
+			{"answers": answer},
+			{"answers": [[self.qid, self.aid]]},
+			{"answers": [None]},
+			{"answers": [{"qid": str(self.qid), "aid": self.aid}]},
+			{"answers": []},
+			{"answers": [answer], "course_number": 6},
+			{"answers": [answer], "course_number": ["6"]},
+			{"answers": [answer], "course_number": "not a course"},
+		]:
+			with self.subTest(body=body):
+				self.assertEqual(self.post(body).status_code, 400)
+		self.queue.submit.assert_not_called()
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -38,3 +38,11 @@ def quote(s: str, use_double=False) -> str:
 	if use_double:
 		q = "\""
 	return q + s + q
+
+
+def placeholders(count: int) -> str:
+	"""
+	parameter markers to bind count values in a query, i.e. for an
+	"INSERT INTO tbl VALUES ({output})" with count columns
+	"""
+	return ", ".join(["%s"] * count)
@@ -0,0 +1,57 @@
+import bisect
+from typing import Dict, List, Any, Sequence
+
+
+def exponential_bounds(first: float, count: int) -> List[float]:
+	""" :return: first, 2 * first, 4 * first, ... (count bounds) """
+	return [first * 2 ** i for i in range(count)]
+
+
+class Histogram:
+	"""
+	counts samples into buckets by upper bound. the last bucket holds the
+	samples above the largest bound. not thread safe: callers lock.
+	"""
+
+	def __init__(self, bounds: Sequence[float]) -> None:
+		self.bounds = tuple(bounds)
+		self.buckets: List[int] = [0] * (len(self.bounds) + 1)
+		self.count = 0
+		self.total = 0.
+		self.max = 0.
+
+	def record(self, value: float) -> None:
+		self.count += 1
+		self.total += value
+		self.max = max(self.max, value)
+		self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+
+	def average(self) -> float:
+		return self.total / self.count if self.count > 0 else 0.
+
+	def percentile(self, fraction: float) -> float:
+		"""
+		:return:
+			the upper bound of the bucket holding the given fraction of
+			the samples (i.e. 0.99 for p99), capped at the largest sample
+		"""
+		target, seen = fraction * self.count, 0
+		for index, bucket_count in enumerate(self.buckets):
+			seen += bucket_count
+			if seen >= target and seen > 0:
+				if index == len(self.bounds):
+					return self.max
+				return min(self.bounds[index], self.max)
+		return 0.
+
+	def as_dict(self) -> Dict[str, Any]:
+		return {
+			"count": self.count,
+			"avg": self.average(),
+			"max": self.max,
+			"p50": self.percentile(0.5),
+			"p90": self.percentile(0.9),
+			"p99": self.percentile(0.99),
+			# samples up to each bound, then above the largest one
+			"buckets": list(zip(self.bounds + (None,), self.buckets)),
+		}
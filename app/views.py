@@ -1,9 +1,17 @@
 from flask import render_template, request, json, send_from_directory
 from app import app
 from app.db.mit_courses import mit_courses
-import app.db.database as database
+from app.db.submission_queue import SubmissionQueue
+from app.classifier.custom_types import QID, AID, SCourseNumber
+import app.db.catalog as catalog
+import atexit
+import threading
 import os
 
+# journal of the quiz submissions that are not stored in the database yet.
+# each process journals to its own file named after it.
+SUBMISSION_JOURNAL = os.environ.get("SUBMISSION_JOURNAL", "submissions.journal")
+
 
 @app.route("/")
 def index():
@@ -31,7 +39,56 @@ DATA POST REQUESTS
 
 @app.route("/response", methods=["POST"])
 def store_response():
-	raise NotImplementedError
+	"""
+	queues a quiz response to be stored. the response is journaled and
+	acknowledged right away; it reaches the database with the next flush
+	of the submission queue.
+	expects json of the format
+		Dict["answers": List[Dict["qid": Int, "aid": Int]],
+			"course_number": String or null]
+	:return: json of the format Dict["queued": Int], with status 202
+	"""
+	body = request.get_json(silent=True)
+	if type(body) != dict:
+		return json.dumps({"error": "a response must be a json object"}), 400
+	answers = body.get("answers", [])
+	if type(answers) != list:
+		return json.dumps({"error": "answers must be a list"}), 400
+	snapshot = catalog.snapshot()
+	response = {}
+	for answer in answers:
+		if type(answer) != dict:
+			return json.dumps({"error": "invalid answer %s" % repr(answer)}), 400
+		qid, aid = answer.get("qid"), answer.get("aid")
+		if type(qid) != int or type(aid) != int or snapshot.aid_to_qid.get(aid) != qid:
+			return json.dumps({"error": "invalid answer %s" % repr(answer)}), 400
+		response[QID(qid)] = AID(aid)
+	if len(response) == 0:
+		return json.dumps({"error": "a response needs answers"}), 400
+	cn = body.get("course_number")
+	if cn is not None and type(cn) != str:
+		return json.dumps({"error": "course_number must be a string or null"}), 400
+	if cn is not None and cn not in snapshot.cn_to_cid:
+		return json.dumps({"error": "unknown course %s" % repr(cn)}), 400
+	sequence = submission_queue().submit(
+		response,
+		None if cn is None else SCourseNumber(cn),
+	)
+	return json.dumps({"queued": sequence}), 202
+
+
+_submission_queue: SubmissionQueue = None
+_submission_queue_lock = threading.Lock()
+
+
+def submission_queue() -> SubmissionQueue:
+	""" the queue of this process, started on the first submission """
+	global _submission_queue
+	with _submission_queue_lock:
+		if _submission_queue is None:
+			_submission_queue = SubmissionQueue(SUBMISSION_JOURNAL).start()
+			atexit.register(_submission_queue.close)
+		return _submission_queue
 
 
 """
@@ -47,14 +104,23 @@ def questions():
 		List[Dict["question": String, "qid": Int, "answers": AnswerList]]
 		AnswerList: List[Dict["choice": String, "aid": Int]]
 	"""
-	return json.dumps([{
-		"qid": qid,
-		"question": question,
-		"choices": [{
-			"choice": choice,
-			"aid": aid,
-		} for aid, choice, _ in answers]
-	} for qid, question, answers in database.load_questions()])
+	snapshot = catalog.snapshot()
+	version, questions_json = _questions_json
+	if version != snapshot.version:
+		questions_json = json.dumps([{
+			"qid": qid,
+			"question": question,
+			"choices": [{
+				"choice": choice,
+				"aid": aid,
+			} for aid, choice, _ in answers]
+		} for qid, question, answers in snapshot.questions])
+		_questions_json[:] = [snapshot.version, questions_json]
+	return questions_json
+
+
+# [catalog version, /questions json], rebuilt when the catalog changes
+_questions_json = [None, None]
 
 
 @app.route("/courses", methods=["GET"])
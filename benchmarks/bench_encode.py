@@ -0,0 +1,93 @@
+"""
+compares the previous per-response encoding of responses into the data
+matrix (one sort of the qids, one list and one np.array per response,
+then a vstack) with QuestionAnswerManager.encode_answers + encode_batch,
+with encode_batch alone for answers that are already codes (i.e.
+unpacked packed_answers), and with encode_sparse on the same codes, for
+RESPONSE_COUNT random responses.
+
+runs on an in-memory sqlite database, so it needs no database server.
+
+usage: python -m benchmarks.bench_encode [response count]
+"""
+import sys
+import time
+import numpy as np
+import app.db.database as database
+from app.db.sql import SQLiteEngine
+from app.classifier.question_answer_manager import QuestionAnswerManager
+from benchmarks.bench_util import store_questions
+
+RESPONSE_COUNT = 1000000
+QUESTION_COUNT = 10
+CHOICE_COUNT = 4
+
+
+def per_response_encode(qam: QuestionAnswerManager, responses) -> np.ndarray:
+	""" the encoding before the lookup tables, as load_training_data did it """
+	data = []
+	for response in responses:
+		vector_list = []
+		for qid in sorted([qid for qid in qam.question_ids()]):
+			vector_list.extend(qam.get_answer_vector(qid, response))
+		data.append(np.array(vector_list))
+	return np.vstack(data)
+
+
+def timed(function, *args):
+	start = time.perf_counter()
+	result = function(*args)
+	return result, time.perf_counter() - start
+
+
+def main() -> None:
+	response_count = int(sys.argv[1]) if len(sys.argv) > 1 else RESPONSE_COUNT
+	database.engine = SQLiteEngine()
+	database.initialize_database()
+	questions = store_questions(QUESTION_COUNT, CHOICE_COUNT)
+	qam = QuestionAnswerManager()
+
+	random = np.random.RandomState(0)
+	# code 0 leaves the question unanswered
+	codes = random.randint(0, CHOICE_COUNT + 1, (response_count, QUESTION_COUNT))
+	codes = codes.astype(np.uint8)
+	responses = [
+		{
+			qid: aids[code - 1]
+			for (qid, aids), code in zip(questions, row) if code > 0
+		}
+		for row in codes.tolist()
+	]
+
+	expected, per_response = timed(per_response_encode, qam, responses)
+	encoded, from_dicts = timed(
+		lambda: qam.encode_batch(qam.encode_answers(responses))
+	)
+	assert np.array_equal(encoded, expected)
+	del encoded
+	out = np.empty((response_count, qam.input_dimension))
+	_, from_codes = timed(qam.encode_batch, codes, out)
+	assert np.array_equal(out, expected)
+	sparse, from_codes_sparse = timed(qam.encode_sparse, codes)
+	assert np.array_equal(sparse.toarray(), expected)
+
+	print("%d responses, %d questions, input dimension %d" % (
+		response_count, QUESTION_COUNT, qam.input_dimension
+	))
+	print("%-34s %10s %10s" % ("path", "total (s)", "speedup"))
+	for name, elapsed in (
+		("per response + vstack", per_response),
+		("encode_answers + encode_batch", from_dicts),
+		("encode_batch (answer codes)", from_codes),
+		("encode_sparse (answer codes)", from_codes_sparse),
+	):
+		print("%-34s %10.3f %9.1fx" % (name, elapsed, per_response / elapsed))
+	print("dense matrix: %.1f MB, csr matrix: %.1f MB" % (
+		out.nbytes / 2 ** 20,
+		(sparse.data.nbytes + sparse.indices.nbytes + sparse.indptr.nbytes) / 2 ** 20,
+	))
+	database.engine.pool.close()
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,119 @@
+"""
+compares the python-side cost of reading the labelled responses:
+- the previous loader, which built a RID, SCourseNumber, QID and AID for
+every cell of every row
+- load_labelled_responses, which builds a RID per response and shares
+interned QID, AID and SCourseNumber instances
+- load_labelled_responses(raw=True), with plain ints and strings
+- load_labelled_answer_arrays, with numpy arrays
+then the previous load_training_data (typed dicts, then encoded) with
+the current one (arrays, encoded at once).
+
+runs on an in-memory sqlite database, so it needs no database server.
+
+usage: python -m benchmarks.bench_load_responses [response count]
+"""
+import sys
+import time
+import numpy as np
+import app.db.database as database
+from app.db.sql import SQLiteEngine
+from app.classifier.custom_types import RID, QID, AID, SCourseNumber
+from app.classifier.data_manager import DataManager
+from benchmarks.bench_util import store_questions
+
+RESPONSE_COUNT = 50000
+QUESTION_COUNT = 20
+CHOICE_COUNT = 4
+COURSE_NUMBERS = ("6", "8", "18", "2", "21W")
+SAMPLES = 3
+
+
+def fetch_rows():
+	with database.engine.pool.connection():
+		cursor = database.engine.pool.cursor()
+		cursor.execute(database._SQL.load_labelled_responses)
+		return cursor.fetchall()
+
+
+def previous_group(rows):
+	""" the grouping of load_labelled_responses before raw and interning """
+	result = {}
+	for rid_, cn_, qid_, aid_ in rows:
+		rid, cn, qid, aid = \
+			RID(rid_), SCourseNumber(cn_), QID(qid_), AID(aid_)
+		dic = result.get((rid, cn), {})
+		dic[qid] = aid
+		result[(rid, cn)] = dic
+	return result
+
+
+def previous_load_training_data(data_manager: DataManager):
+	responses = previous_group(fetch_rows())
+	data = data_manager.qam.encode_batch(
+		data_manager.qam.encode_answers(responses.values())
+	)
+	labels = np.vstack([data_manager.cm.get_course_vector(cn) for _, cn in responses])
+	return data, labels
+
+
+def best_time(function, *args) -> float:
+	""" :return: the fastest of SAMPLES runs, in seconds """
+	durations = []
+	for _ in range(SAMPLES):
+		start = time.perf_counter()
+		function(*args)
+		durations.append(time.perf_counter() - start)
+	return min(durations)
+
+
+def main() -> None:
+	response_count = int(sys.argv[1]) if len(sys.argv) > 1 else RESPONSE_COUNT
+	database.engine = SQLiteEngine()
+	database.initialize_database()
+	questions = store_questions(QUESTION_COUNT, CHOICE_COUNT)
+	random = np.random.RandomState(0)
+	for start in range(0, response_count, database.BULK_INSERT_SIZE):
+		database.store_responses([
+			(
+				{qid: aids[random.randint(len(aids))] for qid, aids in questions},
+				COURSE_NUMBERS[random.randint(len(COURSE_NUMBERS))],
+			)
+			for _ in range(min(database.BULK_INSERT_SIZE, response_count - start))
+		])
+	data_manager = DataManager()
+
+	rows = fetch_rows()
+	fetch = best_time(fetch_rows)
+	print("%d responses, %d rows, fetched in %.3f s" % (
+		response_count, len(rows), fetch
+	))
+	print("%-40s %10s %10s" % ("path", "total (s)", "speedup"))
+	previous = best_time(lambda: previous_group(fetch_rows()))
+	for name, elapsed in (
+		("previous typed loader", previous),
+		("load_labelled_responses", best_time(database.load_labelled_responses)),
+		(
+			"load_labelled_responses(raw=True)",
+			best_time(lambda: database.load_labelled_responses(raw=True)),
+		),
+		("load_labelled_answer_arrays", best_time(database.load_labelled_answer_arrays)),
+	):
+		print("%-40s %10.3f %9.1fx" % (name, elapsed, previous / elapsed))
+
+	expected = previous_load_training_data(data_manager)
+	# the previous loader keeps the order of the rows, the current one
+	# sorts by rid: the rows are in order of rid here, so both match
+	for expected_matrix, matrix in zip(expected, data_manager.load_training_data()):
+		assert np.array_equal(expected_matrix, matrix)
+	previous = best_time(previous_load_training_data, data_manager)
+	for name, elapsed in (
+		("previous load_training_data", previous),
+		("load_training_data", best_time(data_manager.load_training_data)),
+	):
+		print("%-40s %10.3f %9.1fx" % (name, elapsed, previous / elapsed))
+	database.engine.pool.close()
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,83 @@
+"""
+measures what TrainingData.refresh costs when no response was stored or
+relabelled since the last refresh, which is the common case for a
+classifier refreshed on a timer: the responses it reads again below the
+rid watermark, and the time it takes, for several rid_safety_window
+sizes. each window is measured with the committed rid of the previous
+refresh (the rids below it are not read again) and without it (the
+whole window is read again, as when a gap below the watermark keeps the
+window open).
+
+runs on an in-memory sqlite database, so it needs no database server.
+
+usage: python -m benchmarks.bench_refresh [response count]
+"""
+import sys
+import time
+import numpy as np
+import app.db.database as database
+from app.db.sql import SQLiteEngine
+from app.classifier.data_manager import DataManager
+from app.classifier.training_data import TrainingData
+from benchmarks.bench_util import store_questions
+
+RESPONSE_COUNT = 20000
+QUESTION_COUNT = 20
+CHOICE_COUNT = 4
+COURSE_NUMBERS = ("6", "8", "18", "2", "21W")
+WINDOWS = (0, 100, database.RID_SAFETY_WINDOW, 10000)
+SAMPLES = 20
+
+
+def refresh_time(training_data: TrainingData, committed_rid: int) -> float:
+	""" :return: the median time of SAMPLES refreshes, in milliseconds """
+	durations = []
+	for _ in range(SAMPLES):
+		training_data.committed_rid = committed_rid
+		start = time.perf_counter()
+		changed = training_data.refresh()
+		durations.append(time.perf_counter() - start)
+		assert changed == 0, "%d responses changed" % changed
+	return sorted(durations)[len(durations) // 2] * 1000
+
+
+def main() -> None:
+	response_count = int(sys.argv[1]) if len(sys.argv) > 1 else RESPONSE_COUNT
+	database.engine = SQLiteEngine()
+	database.initialize_database()
+	questions = store_questions(QUESTION_COUNT, CHOICE_COUNT)
+	random = np.random.RandomState(0)
+	for start in range(0, response_count, database.BULK_INSERT_SIZE):
+		database.store_responses([
+			(
+				{qid: aids[random.randint(len(aids))] for qid, aids in questions},
+				COURSE_NUMBERS[random.randint(len(COURSE_NUMBERS))],
+			)
+			for _ in range(min(database.BULK_INSERT_SIZE, response_count - start))
+		])
+	data_manager = DataManager()
+
+	print("%d responses, refreshes with no new rows" % response_count)
+	print("%-10s %-10s %10s %12s" % ("window", "committed", "re-read", "refresh (ms)"))
+	for window in WINDOWS:
+		training_data = TrainingData(data_manager, rid_safety_window=window)
+		training_data.refresh()
+		committed_rid = training_data.committed_rid
+		for tracked in (True, False):
+			responses, _, _ = database.load_labelled_responses_since(
+				training_data.rid_watermark,
+				training_data.label_watermark,
+				committed_rid if tracked else 0,
+				window,
+			)
+			print("%-10d %-10s %10d %12.2f" % (
+				window,
+				"yes" if tracked else "no",
+				len(responses),
+				refresh_time(training_data, committed_rid if tracked else 0),
+			))
+	database.engine.pool.close()
+
+
+if __name__ == "__main__":
+	main()
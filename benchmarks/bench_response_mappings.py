@@ -0,0 +1,85 @@
+"""
+compares the old string-built multi-row INSERT used for ResponseMappings
+(quote / convert_to_query_values) with the bound-parameter executemany
+path used by database.store_response, for 20 to 200 question mappings.
+
+runs against config.SQL_TEST_DATABASE in a temporary table.
+
+usage: python -m benchmarks.bench_response_mappings
+"""
+import time
+import config
+import mysql.connector
+from app.db.sql_constants import TBLCol
+from app.utils.db_utils import convert_to_query_values, placeholders
+
+TABLE = "BenchResponseMappings"
+MAPPING_COUNTS = (20, 50, 100, 200)
+SAMPLES = 500
+
+
+def string_built_insert(cursor, rows) -> None:
+	cursor.execute("INSERT INTO %s (%s, %s, %s) VALUES %s;" % (
+		TABLE,
+		TBLCol.response_id,
+		TBLCol.question_id,
+		TBLCol.answer_id,
+		convert_to_query_values(rows),
+	))
+
+
+EXECUTEMANY_STATEMENT = "INSERT INTO %s (%s, %s, %s) VALUES (%s)" % (
+	TABLE,
+	TBLCol.response_id,
+	TBLCol.question_id,
+	TBLCol.answer_id,
+	placeholders(3),
+)
+
+
+def executemany_insert(cursor, rows) -> None:
+	cursor.executemany(EXECUTEMANY_STATEMENT, rows)
+
+
+def time_insert(cnx, insert, mapping_count: int) -> float:
+	""" :return: the median latency of one insert + commit in milliseconds """
+	cursor = cnx.cursor()
+	durations = []
+	for rid in range(SAMPLES):
+		rows = [(rid, qid, qid * 4) for qid in range(mapping_count)]
+		start = time.perf_counter()
+		insert(cursor, rows)
+		cnx.commit()
+		durations.append(time.perf_counter() - start)
+	cursor.close()
+	return sorted(durations)[len(durations) // 2] * 1000
+
+
+def main() -> None:
+	cnx = mysql.connector.connect(
+		host=config.SQL_HOST,
+		user=config.SQL_USER,
+		password=config.SQL_PASSWORD,
+		database=config.SQL_TEST_DATABASE,
+	)
+	cursor = cnx.cursor()
+	cursor.execute("""
+		CREATE TEMPORARY TABLE %s (
+			%s BIGINT UNSIGNED NOT NULL,
+			%s BIGINT UNSIGNED NOT NULL,
+			%s BIGINT UNSIGNED NOT NULL
+		)
+	""" % (TABLE, TBLCol.response_id, TBLCol.question_id, TBLCol.answer_id))
+	print("%10s %18s %18s" % ("mappings", "string (ms)", "executemany (ms)"))
+	for mapping_count in MAPPING_COUNTS:
+		print("%10d %18.3f %18.3f" % (
+			mapping_count,
+			time_insert(cnx, string_built_insert, mapping_count),
+			time_insert(cnx, executemany_insert, mapping_count),
+		))
+	cursor.close()
+	cnx.close()
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,88 @@
+"""
+measures the cold start of the app package: each entry point is imported
+in a fresh interpreter with `python -X importtime`, SAMPLES times. prints
+the median import time of each entry point and the modules that took the
+most of it, and exits with status 1 if an entry point goes over its
+budget or imports a module it shouldn't (i.e. keras when only importing
+the database layer).
+
+needs neither a database server nor keras: nothing connects at import.
+
+usage: python -m benchmarks.bench_startup
+"""
+import os
+import sys
+import subprocess
+from typing import Dict, Tuple
+
+SAMPLES = 5
+# modules listed per entry point, by cumulative import time
+TOP_MODULES = 8
+
+# (statement, budget in milliseconds, modules it must not import)
+ENTRY_POINTS = (
+	("import app.db.sql", 150, ("flask", "keras", "tensorflow", "mysql.connector")),
+	("import app.db.database", 250, ("flask", "keras", "tensorflow", "mysql.connector")),
+	("import app.classifier.numpy_model", 300, ("flask", "keras", "tensorflow")),
+	("import app.classifier.classifier", 350, ("flask", "keras", "tensorflow")),
+	("from app import app", 700, ("keras", "tensorflow")),
+)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(statement: str) -> Dict[str, Tuple[int, int]]:
+	"""
+	runs statement in a fresh interpreter
+	:return: (self, cumulative) import time in microseconds of each module
+	"""
+	process = subprocess.run(
+		[sys.executable, "-X", "importtime", "-c", statement],
+		cwd=ROOT,
+		stderr=subprocess.PIPE,
+		universal_newlines=True,
+		check=True,
+	)
+	times = {}
+	for line in process.stderr.splitlines():
+		if not line.startswith("import time:") or "self [us]" in line:
+			continue
+		self_time, cumulative, name = line[len("import time:"):].split("|")
+		times[name.strip()] = (int(self_time), int(cumulative))
+	return times
+
+
+def total_time(times: Dict[str, Tuple[int, int]]) -> float:
+	""" :return: the time spent importing every module, in milliseconds """
+	return sum(self_time for self_time, _ in times.values()) / 1000
+
+
+def main() -> None:
+	failures = []
+	for statement, budget, forbidden in ENTRY_POINTS:
+		samples = sorted(
+			(import_times(statement) for _ in range(SAMPLES)),
+			key=total_time,
+		)
+		median = samples[len(samples) // 2]
+		elapsed = total_time(median)
+		print("%-40s %8.1f ms (budget %d ms)" % (statement, elapsed, budget))
+		for name, (_, cumulative) in sorted(
+			median.items(), key=lambda item: -item[1][1]
+		)[:TOP_MODULES]:
+			print("    %-36s %8.1f ms" % (name, cumulative / 1000))
+		if elapsed > budget:
+			failures.append("%s took %.1f ms, over its budget of %d ms" % (
+				statement, elapsed, budget
+			))
+		for name in forbidden:
+			if name in median:
+				failures.append("%s imports %s" % (statement, name))
+	for failure in failures:
+		print("FAIL: " + failure)
+	if len(failures) > 0:
+		sys.exit(1)
+
+
+if __name__ == "__main__":
+	main()
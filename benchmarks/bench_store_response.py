@@ -0,0 +1,64 @@
+"""
+measures the latency of database.store_response as the Responses table
+grows. insertion should cost the same whether 1k or 1M responses are
+already stored.
+
+runs against config.SQL_TEST_DATABASE. every table in it is dropped.
+
+usage: python -m benchmarks.bench_store_response [max_responses]
+"""
+import sys
+import time
+import app.db.database as database
+from app.db.sql_constants import TBL, TBLCol
+from app.classifier.custom_types import QID, AID
+from app.utils import generator_util
+from benchmarks.bench_util import use_test_database, store_questions
+
+SIZES = (1000, 10000, 100000, 1000000)
+SEED_CHUNK = 10000
+SAMPLES = 200
+
+
+def seed_responses(count: int) -> None:
+	""" bulk insert unlabelled responses without any mappings """
+	query = "INSERT INTO %s (%s) VALUES (%%s)" % \
+		(TBL.Responses, TBLCol.response_salt)
+	with database.engine.pool.connection() as cnx:
+		cursor = database.engine.pool.cursor()
+		while count > 0:
+			chunk = min(count, SEED_CHUNK)
+			cursor.executemany(query, [
+				(generator_util.generate_response_salt(),)
+				for _ in range(chunk)
+			])
+			cnx.commit()
+			count -= chunk
+
+
+def time_store_response(response) -> float:
+	""" :return: the median store_response latency in milliseconds """
+	durations = []
+	for _ in range(SAMPLES):
+		start = time.perf_counter()
+		database.store_response(response)
+		durations.append(time.perf_counter() - start)
+	return sorted(durations)[len(durations) // 2] * 1000
+
+
+def main(max_responses: int) -> None:
+	use_test_database()
+	qid, aids = store_questions(1)[0]
+	response = {QID(qid): AID(aids[0])}
+	stored = 0
+	print("%12s %14s" % ("responses", "median (ms)"))
+	for size in [s for s in SIZES if s <= max_responses]:
+		seed_responses(size - stored)
+		stored = size
+		print("%12d %14.3f" % (size, time_store_response(response)))
+		stored += SAMPLES
+	database.engine.pool.close()
+
+
+if __name__ == "__main__":
+	main(int(sys.argv[1]) if len(sys.argv) > 1 else SIZES[-1])
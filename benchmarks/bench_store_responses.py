@@ -0,0 +1,53 @@
+"""
+compares the throughput of storing responses one at a time with
+database.store_response against database.store_responses, which writes
+a whole batch in one transaction.
+
+runs against config.SQL_TEST_DATABASE. every table in it is dropped.
+
+usage: python -m benchmarks.bench_store_responses [response_count]
+"""
+import sys
+import time
+import random
+import app.db.database as database
+from app.classifier.custom_types import QID, AID, SCourseNumber
+from app.db.mit_courses import mit_courses
+from benchmarks.bench_util import use_test_database, store_questions
+
+QUESTION_COUNT = 20
+
+
+def random_batch(questions, count: int):
+	return [
+		(
+			{QID(qid): AID(random.choice(aids)) for qid, aids in questions},
+			SCourseNumber(random.choice(mit_courses)[0]),
+		)
+		for _ in range(count)
+	]
+
+
+def main(response_count: int) -> None:
+	use_test_database()
+	questions = store_questions(QUESTION_COUNT)
+	batch = random_batch(questions, response_count)
+
+	start = time.perf_counter()
+	for response, cn in batch:
+		database.store_response(response, cn)
+	per_call = time.perf_counter() - start
+
+	start = time.perf_counter()
+	database.store_responses(batch)
+	bulk = time.perf_counter() - start
+
+	print("%d responses with %d answers each" % (response_count, QUESTION_COUNT))
+	print("%16s %12s %16s" % ("path", "seconds", "responses / s"))
+	for name, seconds in (("store_response", per_call), ("store_responses", bulk)):
+		print("%16s %12.3f %16.0f" % (name, seconds, response_count / seconds))
+	database.engine.pool.close()
+
+
+if __name__ == "__main__":
+	main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,62 @@
+"""
+helpers shared by the benchmarks. the benchmarks that use
+use_test_database run against config.SQL_TEST_DATABASE and drop every
+table in it. config is only imported then, so the benchmarks on sqlite
+run on a checkout without config.py.
+"""
+import app.db.database as database
+from app.db.sql import MySQLEngine
+from app.db.sql_constants import TBL
+from app.classifier.custom_types import SQuestionType, SQuestionAnswerType
+from typing import List, Tuple
+
+TABLES = (
+	TBL.ResponseMappings,
+	TBL.Responses,
+	TBL.AnswerChoices,
+	TBL.Questions,
+	TBL.Courses,
+	TBL.SchemaMigrations,
+	TBL.DatabaseState,
+)
+
+
+def use_test_database() -> None:
+	""" points the database module at an empty test database """
+	import config
+	database.engine = MySQLEngine({
+		"host": config.SQL_HOST,
+		"user": config.SQL_USER,
+		"password": config.SQL_PASSWORD,
+		"database": config.SQL_TEST_DATABASE,
+	}, pool_size=1)
+	with database.engine.pool.connection() as cnx:
+		cursor = database.engine.pool.cursor()
+		for table in TABLES:
+			cursor.execute("DROP TABLE IF EXISTS %s" % table)
+		cnx.commit()
+	database.initialize_database()
+
+
+def store_questions(count: int, choice_count: int = 4) -> List[Tuple[int, List[int]]]:
+	"""
+	stores count multiple choice questions with one-hot answer vectors
+	:return: (qid, [aid, ...]) for every question stored
+	"""
+	for index in range(count):
+		database.store_question(
+			"benchmark question %d" % index,
+			SQuestionType.type.quiz,
+			SQuestionAnswerType.type.multiple_choice,
+			[
+				(
+					"choice %d" % choice,
+					",".join(["1" if i == choice else "0" for i in range(choice_count)])
+				)
+				for choice in range(choice_count)
+			],
+		)
+	return [
+		(qid, [aid for aid, _, _ in answers])
+		for qid, _, answers in database.load_questions()
+	]
@@ -1,10 +1,10 @@
 import os
-import config
 from app import app
 import app.db.database as database
 
 
 def set_config_variables():
+	import config
 	os.environ["SQL_HOST"] = config.SQL_HOST
 	os.environ["SQL_USER"] = config.SQL_USER
 	os.environ["SQL_PASSWORD"] = config.SQL_PASSWORD